@@ -1,6 +1,7 @@
 pip install -r requirements.txt
 
 cp .env.example .env
-# edit .env with your CENSUS_API_KEY
+# edit .env with your CENSUS_API_KEY (only needed for --census api / cached-api;
+# the default --census snapshot reads data/raw/census offline)
 
 python -m src.data.main_data_build
@@ -0,0 +1,63 @@
+# Microbenchmark: data_utils.add_time_parts / month labelling vs the previous implementation
+#
+#   python -m scripts.bench_time_parts --rows 1000000
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from src.data.data_utils import add_time_parts, month_label
+
+def legacy_add_time_parts(df, dt_col):
+    out = df.copy()
+    out[dt_col] = pd.to_datetime(out[dt_col], errors="coerce", utc=True).dt.tz_convert(None)
+    out["Year"]  = out[dt_col].dt.year
+    out["Month"] = out[dt_col].dt.month
+    out["Day"]   = out[dt_col].dt.day
+    out["Hour"]  = out[dt_col].dt.hour
+    out["month_label"] = out[dt_col].dt.to_period("M").astype(str)
+    return out
+
+def legacy_month_label(g):
+    return g.apply(lambda r: f"{int(r['Year'])}-{int(r['Month']):02d}", axis=1)
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark time-part extraction.")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--label-rows", type=int, default=100_000, help="Rows for the month_label comparison")
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2019-01-01") + rng.integers(0, 5 * 365 * 24 * 60, args.rows).astype("timedelta64[m]")
+    df = pd.DataFrame({"start_datetime": pd.Series(start).dt.strftime("%Y-%m-%d %H:%M:%S")})
+
+    t_old, old = best_of(lambda: legacy_add_time_parts(df, "start_datetime"), args.repeat)
+    t_new, new = best_of(lambda: add_time_parts(df, "start_datetime"), args.repeat)
+    for c in ["Year", "Month", "Day", "Hour"]:
+        assert (old[c].to_numpy() == new[c].to_numpy(dtype="int64")).all(), c
+    assert (old["month_label"].to_numpy() == new["month_label"].astype(str).to_numpy()).all()
+    mem_old = old[["Year","Month","Day","Hour","month_label"]].memory_usage(deep=True).sum()
+    mem_new = new[["Year","Month","Day","Hour","month_label"]].memory_usage(deep=True).sum()
+    print(f"add_time_parts  rows={args.rows:,}")
+    print(f"  legacy      {t_old:8.3f}s  {mem_old / 1e6:8.1f} MB")
+    print(f"  vectorised  {t_new:8.3f}s  {mem_new / 1e6:8.1f} MB  ({t_old / t_new:.1f}x faster)")
+
+    g = new[["Year","Month"]].head(args.label_rows).astype("int64")
+    t_old, old = best_of(lambda: legacy_month_label(g), args.repeat)
+    t_new, new = best_of(lambda: month_label(g["Year"], g["Month"]), args.repeat)
+    assert (old.to_numpy() == new.astype(str).to_numpy()).all()
+    print(f"month_label  rows={len(g):,}")
+    print(f"  legacy      {t_old:8.3f}s")
+    print(f"  vectorised  {t_new:8.3f}s  ({t_old / t_new:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,8 @@
 pip install -r requirements.txt
 
+# both targets in one run: one data load and split, one worker pool for every model search;
+# results and models land in results/supervised/<target>/ and models/<target>/
 python -m src.models.train_supervised \
   --data data/processed/final_data/FinalFeaturesDF.csv \
-  --target demand_score \
+  --target demand_score ENERGY_KWH \
   --drop STATE_NAME STATE id station_name
-
-
-python -m src.models.train_supervised \
-  --data data/processed/final_data/FinalFeaturesDF.csv \
-  --target ENERGY_KWH
\ No newline at end of file
@@ -0,0 +1,69 @@
+import argparse
+import time
+from pathlib import Path
+import pandas as pd
+from sklearn.base import clone
+
+from src.data.artifact_store import load_frame
+from src.models.sl_utils import (split_features, family_preprocessor, get_model_spaces, indicator_columns, compact_indicators,
+                                 feature_matrix_stats)
+
+# Memory / fit-time report: the indicator-aware feature matrix (uint8 indicators, per-family
+# sparse or dense float32 layout) against the previous path (every numeric scaled, float64).
+# hgb always gets its native-categorical frame, so its two rows differ only in the indicator dtype.
+# Each family is fitted once at the first point of its grid.
+#
+#   python -m src.bench.feature_matrix --data bench_data/features.csv --rows 20000
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare the legacy and indicator-aware feature matrices.")
+    p.add_argument("--data", default="data/processed/final_data/Sample_FinalFeaturesDF.csv")
+    p.add_argument("--target", default="demand_score")
+    p.add_argument("--drop", nargs="*", default=["STATE_NAME","STATE","station_name","id"])
+    p.add_argument("--rows", type=int, default=None, help="Use the first N rows")
+    p.add_argument("--models", nargs="*", default=None)
+    p.add_argument("--out", default=None, help="Optional CSV for the report")
+    return p.parse_args()
+
+def time_fit(prep, model, X, y):
+    t0 = time.perf_counter()
+    M = prep.fit_transform(X)
+    t1 = time.perf_counter()
+    model.fit(M, y)
+    return t1 - t0, time.perf_counter() - t1
+
+def main():
+    args = parse_args()
+    df = load_frame(args.data)
+    if args.rows:
+        df = df.head(args.rows)
+    X, y, num_cols, cat_cols = split_features(df, args.target, drop_cols=args.drop)
+    ind_cols = indicator_columns(X, num_cols)
+    Xc = compact_indicators(X, ind_cols)
+    print(f"{len(X):,} rows, {len(num_cols)} numeric ({len(ind_cols)} indicators), {len(cat_cols)} categorical")
+    print(f"frame: {X.memory_usage(deep=True).sum() / 1e6:.1f} MB -> {Xc.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+
+    rows = []
+    for key, (model, grid) in get_model_spaces().items():
+        if args.models and key not in args.models:
+            continue
+        model = clone(model).set_params(**{k.replace("model__", ""): v[0] for k, v in grid.items()})
+        for path, prep, data in [
+            ("legacy", family_preprocessor(key, num_cols, cat_cols), X),
+            ("indicator", family_preprocessor(key, num_cols, cat_cols, ind_cols), Xc),
+        ]:
+            prep_s, fit_s = time_fit(prep, clone(model), data, y)
+            stats = feature_matrix_stats(prep, data)
+            rows.append({"model": key, "path": path, "layout": stats["layout"], "dtype": stats["dtype"],
+                         "matrix_mb": stats["mb"], "density": stats["density"],
+                         "prep_s": round(prep_s, 3), "fit_s": round(fit_s, 3)})
+            print(f"{key:6s} {path:9s} {stats['layout']:6s} {stats['mb']:8.2f} MB  prep {prep_s:6.2f}s  fit {fit_s:7.2f}s")
+
+    report = pd.DataFrame(rows)
+    print("\n" + report.to_string(index=False))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        report.to_csv(args.out, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import platform
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+from src.instrumentation import RunRecorder, count_rows
+from src.data.census_api import SnapshotCensusProvider
+from src.data.data_config import build_paths
+from src.data.merge_pipeline import (load_clean_afs, load_clean_evwatts, iter_clean_evwatts, load_clean_afdc_regs,
+                                     load_census, aggregate_state_month, aggregate_state_month_stream, merge_state_month)
+from src.data.load_profile import load_profile_frame
+from src.models.orchestrate import SearchJob, run_search_jobs
+from src.models.sl_utils import (split_features, build_preprocessor, family_preprocessor, get_model_spaces,
+                                 export_feature_importance, indicator_columns, compact_indicators, SEARCH_MODES, prep_cache)
+from .synthetic import write_synthetic_raw, write_final_features
+
+# Offline benchmark harness: generates (or reuses) a synthetic dataset, times and
+# memory-profiles each merge_pipeline step and each sl_utils training/eval entry
+# point through RunRecorder, and compares against a stored baseline JSON.
+#
+#   python -m src.bench.run_bench --scale 1000000                 # run and compare
+#   python -m src.bench.run_bench --scale 1000000 --save-baseline # store as the new baseline
+#
+# Wall time is best-of --repeat; memory is the stage's peak RSS above its start.
+# A benchmark that raises is recorded with its error and the suite carries on.
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run the offline data/model benchmark suite.")
+    p.add_argument("--scale", type=int, default=100_000, help="EV WATTS session rows (10k .. 10M)")
+    p.add_argument("--stations", type=int, default=None, help="AFS station rows (default scale/10)")
+    p.add_argument("--train-rows", type=int, default=20_000, help="Rows of the synthetic feature table for the model benchmarks")
+    p.add_argument("--data-dir", default=None, help="Synthetic data dir (default bench_data/<scale>); generated if missing")
+    p.add_argument("--only", choices=["all", "data", "models"], default="all")
+    p.add_argument("--models", nargs="*", default=None, help="Model families to tune (default: all)")
+    p.add_argument("--full-grid", action="store_true", help="Tune the full grids instead of one point per family")
+    p.add_argument("--cv-splits", type=int, default=3)
+    p.add_argument("--search", choices=SEARCH_MODES, default="grid")
+    p.add_argument("--prep-cache", default=None, help="Fitted-preprocessing cache dir, shared by families with the same matrix layout (default: off)")
+    p.add_argument("--importance-rows", type=int, default=1000, help="Held-out rows scored by export_feature_importance")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="results/bench", help="Where run results and the baseline live")
+    p.add_argument("--baseline", default=None, help="Baseline JSON (default <out>/baseline_<scale>.json)")
+    p.add_argument("--save-baseline", action="store_true", help="Write this run as the baseline")
+    p.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / memory growth before flagging")
+    p.add_argument("--fail-on-regression", action="store_true", help="Exit 1 when any benchmark regresses")
+    return p.parse_args()
+
+def bench_model_spaces(keys = None, full = False):
+    # the training grids, cut to their first point per parameter unless full
+    spaces = get_model_spaces()
+    out = {}
+    for key, (model, grid) in spaces.items():
+        if keys and key not in keys:
+            continue
+        out[key] = (model, grid if full else {k: v[:1] for k, v in grid.items()})
+    return out
+
+class Suite:
+    def __init__(self, recorder, repeat = 1):
+        self.recorder = recorder
+        self.repeat = repeat
+        self.results = {}
+
+    def run(self, name, func, *args, rows_in = None, **kwargs):
+        best, out = None, None
+        for _ in range(self.repeat):
+            try:
+                with self.recorder.stage(name, rows_in=rows_in) as rec:
+                    out = func(*args, **kwargs)
+                    rec["rows_out"] = count_rows(out)
+            except Exception as e:
+                print(f"[{name}] failed: {type(e).__name__}: {e}")
+                self.results[name] = {"error": f"{type(e).__name__}: {e}"}
+                return None
+            peak = None
+            if rec.get("peak_rss_mb") is not None and rec.get("rss_start_mb") is not None:
+                peak = round(rec["peak_rss_mb"] - rec["rss_start_mb"], 1)
+            res = {"wall_s": rec["wall_s"], "cpu_s": rec["cpu_s"], "peak_mem_mb": peak,
+                   "rows_in": rows_in, "rows_out": rec["rows_out"]}
+            if best is None or res["wall_s"] < best["wall_s"]:
+                best = res
+        self.results[name] = best
+        return out
+
+def _consume(chunks):
+    n = 0
+    for c in chunks:
+        n += len(c)
+    return pd.DataFrame(index=range(n))
+
+def run_data_benchmarks(suite, paths):
+    afs = suite.run("load_clean_afs", load_clean_afs, paths)
+    ev = suite.run("load_clean_evwatts[flat]", load_clean_evwatts, paths)
+    suite.run("load_clean_evwatts[normalized]", load_clean_evwatts, paths, layout="normalized")
+    suite.run("iter_clean_evwatts[flat]", lambda: _consume(iter_clean_evwatts(paths)))
+    regs = suite.run("load_clean_afdc_regs", load_clean_afdc_regs, paths)
+    census = suite.run("load_census[snapshot]", load_census, provider=SnapshotCensusProvider(paths.census_snapshot_csv))
+    if ev is None:
+        return
+    sm = suite.run("aggregate_state_month", aggregate_state_month, ev, rows_in=len(ev))
+    suite.run("aggregate_state_month_stream", lambda: aggregate_state_month_stream(iter_clean_evwatts(paths)))
+    suite.run("load_profile[state,60min]", load_profile_frame, ev, "state", 60, rows_in=len(ev))
+    suite.run("load_profile[evse,15min]", load_profile_frame, ev, "evse", 15, rows_in=len(ev))
+    if sm is not None and afs is not None and regs is not None and census is not None:
+        suite.run("merge_state_month", merge_state_month, sm, afs, regs, census=census, rows_in=len(sm))
+
+def run_model_benchmarks(suite, features_path, args):
+    df = suite.run("load_features", pd.read_csv, features_path, low_memory=False)
+    if df is None:
+        return
+    split = suite.run("split_features", split_features, df, "demand_score",
+                      drop_cols=["STATE_NAME","STATE","station_name","id"], rows_in=len(df))
+    if split is None:
+        return
+    X, y, num_cols, cat_cols = split
+    ind_cols = indicator_columns(X, num_cols)
+    X = compact_indicators(X, ind_cols)
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=args.seed)
+    prep = build_preprocessor(num_cols, cat_cols)
+    suite.run("build_preprocessor.fit_transform", prep.fit_transform, Xtr, rows_in=len(Xtr))
+    memory = prep_cache(args.prep_cache)
+    for key, (model, grid) in bench_model_spaces(args.models, args.full_grid).items():
+        # one family per run_search_jobs call, so each search is timed on its own
+        job = SearchJob("demand_score", key, Pipeline(steps=[("prep", family_preprocessor(key, num_cols, cat_cols, ind_cols)),
+                                                             ("model", model)], memory=memory),
+                        grid, Xtr, ytr, search=args.search)
+        tuned = suite.run(f"search[{key}]", run_search_jobs, [job], cv_splits=args.cv_splits, rows_in=len(Xtr))
+        if tuned is None:
+            continue
+        pipe = tuned[("demand_score", key)][0].best_estimator_
+        suite.run(f"export_feature_importance[{key}]", export_feature_importance,
+                  pipe, Xte.head(args.importance_rows), yte.head(args.importance_rows),
+                  str(Path(args.out) / f"feat_importance_{key}.csv"), rows_in=min(len(Xte), args.importance_rows))
+        suite.run(f"predict[{key}]", pipe.predict, Xte, rows_in=len(Xte))
+
+def compare(results, baseline, tolerance):
+    # one row per benchmark; a metric regresses when it grows by more than tolerance
+    rows = []
+    base = baseline.get("results", {}) if baseline else {}
+    for name, cur in results.items():
+        old = base.get(name) or {}
+        row = {"benchmark": name, "wall_s": cur.get("wall_s"), "peak_mem_mb": cur.get("peak_mem_mb"),
+               "base_wall_s": old.get("wall_s"), "base_peak_mem_mb": old.get("peak_mem_mb"), "status": "ok"}
+        if "error" in cur:
+            row["status"] = "error"
+        elif old.get("wall_s"):
+            row["wall_ratio"] = round(cur["wall_s"] / old["wall_s"], 3)
+            # sub-50ms timings are mostly noise
+            if row["wall_ratio"] > 1 + tolerance and cur["wall_s"] - old["wall_s"] > 0.05:
+                row["status"] = "slower"
+            mem, old_mem = cur.get("peak_mem_mb"), old.get("peak_mem_mb")
+            if mem is not None and old_mem is not None and mem > max(old_mem, 1.0) * (1 + tolerance) + 5:
+                row["status"] = "slower" if row["status"] == "slower" else "more_memory"
+        elif old:
+            row["status"] = "base_error" if "error" in old else "ok"
+        else:
+            row["status"] = "new"
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def main():
+    args = parse_args()
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    data_dir = Path(args.data_dir or f"bench_data/{args.scale}")
+    stations = args.stations or max(args.scale // 10, 1000)
+    paths = build_paths(str(data_dir))
+    features_path = paths.processed / "final_data" / f"bench_features_{args.train_rows}.csv"
+
+    meta_file = data_dir / "synthetic.json"
+    meta = json.loads(meta_file.read_text()) if meta_file.exists() else {}
+    if args.only != "models" and (meta.get("sessions") != args.scale or meta.get("stations") != stations or meta.get("seed") != args.seed):
+        print(f"Generating synthetic inputs in {data_dir} ({args.scale:,} sessions, {stations:,} stations)")
+        write_synthetic_raw(data_dir, args.scale, stations, seed=args.seed)
+    if args.only != "data" and not features_path.exists():
+        print(f"Generating synthetic feature table {features_path}")
+        write_final_features(features_path, args.train_rows, seed=args.seed)
+
+    recorder = RunRecorder(f"bench_{args.scale}")
+    suite = Suite(recorder, repeat=args.repeat)
+    if args.only in ("all", "data"):
+        run_data_benchmarks(suite, paths)
+    if args.only in ("all", "models"):
+        run_model_benchmarks(suite, features_path, args)
+
+    run = {
+        "scale": {"sessions": args.scale, "stations": stations, "train_rows": args.train_rows,
+                  "importance_rows": args.importance_rows, "full_grid": args.full_grid, "search": args.search, "prep_cache": bool(args.prep_cache), "cv_splits": args.cv_splits, "seed": args.seed},
+        "machine": {"python": sys.version.split()[0], "platform": platform.platform(), "processor": platform.processor(),
+                    "pandas": pd.__version__, "numpy": np.__version__},
+        "started_utc": recorder.started.isoformat(),
+        "results": suite.results,
+    }
+    baseline_path = Path(args.baseline) if args.baseline else out_dir / f"baseline_{args.scale}.json"
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+    if baseline and baseline.get("scale") != run["scale"]:
+        print(f"Warning: baseline {baseline_path} was recorded at {baseline.get('scale')}, this run is {run['scale']}")
+
+    table = compare(suite.results, baseline, args.tolerance)
+    print("\nBenchmark summary" + (f" (baseline {baseline_path})" if baseline else " (no baseline)") + ":")
+    print(table.to_string(index=False))
+    recorder.write_report(out_dir / "runs")
+    table.to_csv(out_dir / f"compare_{args.scale}.csv", index=False)
+
+    if args.save_baseline:
+        if baseline and baseline.get("scale") == run["scale"]:
+            # a partial run (--only) keeps the other half of the stored baseline
+            run["results"] = {**baseline.get("results", {}), **run["results"]}
+        with open(baseline_path, "w") as f:
+            json.dump(run, f, indent=2, default=str)
+        print(f"Baseline saved {baseline_path}")
+    if args.fail_on_regression and table["status"].isin(["slower", "more_memory"]).any():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import csv
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from src.data.data_config import build_paths
+from src.data.data_utils import STATE_ABBREV
+
+# Schema-faithful synthetic inputs for benchmarks and offline runs: AFS stations,
+# EV WATTS sessions (flat export and normalized session/evse/connector tables),
+# AFDC registrations, a county census snapshot, and the final feature table.
+# Raw files use the column names the loaders in src.data expect and are written
+# into the same layout as data_config.build_paths, so a generated directory can
+# be passed straight to main_data_build --data-dir. Sessions are generated and
+# written in chunks, so 10M-row inputs do not need 10M rows in memory.
+#
+#   python -m src.bench.synthetic --out data_synth --sessions 1000000 --stations 50000 --features 100000
+
+STATES = list(STATE_ABBREV.items())
+# rough share of US public charging per state (CA heavy, long tail)
+_STATE_W = np.array([30.0 if a == "CA" else 6.0 if a in ("NY","FL","TX") else 3.0 if a in ("WA","MA","CO","GA","IL") else 1.0
+                     for _, a in STATES])
+STATE_P = _STATE_W / _STATE_W.sum()
+
+CONNECTORS = ['["J1772"]', '["J1772", "J1772COMBO"]', '["CHADEMO", "J1772COMBO"]', '["TESLA"]',
+              '["J1772", "TESLA"]', '["NEMA520"]', '["CHADEMO", "J1772", "J1772COMBO"]']
+CONNECTOR_P = [0.55, 0.1, 0.1, 0.12, 0.05, 0.03, 0.05]
+PRICING = ["Free", "$0.30 per kWh", "$0.43/kWh", "$1.00 per hour", "$0.25 per minute", "$2.00 per session",
+           "Parking fee; charging free", "Monthly service fee", "Pay to park", "Unknown", None]
+PRICING_P = [0.22, 0.12, 0.08, 0.08, 0.04, 0.04, 0.04, 0.02, 0.03, 0.03, 0.30]
+FACILITIES = ["HOTEL", "PARKING_LOT", "CAR_DEALER", "OFFICE_BLDG", "PUBLIC", "PARKING_GARAGE", "MULTI_UNIT_DWELLING",
+              "MUNI_GOV", "COLLEGE_CAMPUS", "SHOPPING_CENTER", "RESTAURANT", "GAS_STATION", "HOSPITAL", "GROCERY", None]
+NETWORKS = ["ChargePoint Network", "Non-Networked", "Tesla Destination", "Tesla", "Blink Network", "SHELL_RECHARGE",
+            "Electrify America", "eVgo Network", "EV Connect", "AMPUP", "FLO", "Other"]
+NETWORK_P = [0.38, 0.2, 0.08, 0.06, 0.07, 0.04, 0.03, 0.03, 0.04, 0.03, 0.02, 0.02]
+ACCESS = ["24 hours daily", "7am-7pm daily", "Business hours only", "24 hours daily; pay lot"]
+
+REGIONS = ["Pacific", "Mountain", "West North Central", "East North Central", "Middle Atlantic",
+           "South Atlantic", "East South Central", "West South Central", "New England"]
+METROS = ["Undesignated", "Denver-Aurora", "Los Angeles-Long Beach", "New York-Newark", "Seattle-Tacoma",
+          "Chicago-Naperville", "Atlanta-Sandy Springs", "Boston-Cambridge", "Miami-Fort Lauderdale"]
+LAND_USE = ["Metro Area", "Rural", "Urban Center"]
+VENUES = ["Retail", "Workplace", "Corridor", "Multifamily", "Municipal", "Hospitality", "Education", "Undesignated"]
+CHARGE_LEVELS = ["L2", "DCFC"]
+SESSION_CONNECTORS = ["J1772", "CHAdeMO", "Combo", "Tesla"]
+POWER_BUCKETS = ["<8 kW", ">8 kW", "8 kW - 30 kW", "30 kW - 100 kW", ">100 kW"]
+
+SESSION_START = np.datetime64("2019-01-01T00:00")
+SESSION_MINUTES = 5 * 365 * 24 * 60
+
+def _pick(rng, values, n, p = None):
+    # choice over a small vocabulary via integer codes (much faster than choice on object arrays)
+    idx = rng.choice(len(values), size=n, p=p)
+    return np.asarray(values, dtype=object)[idx]
+
+def make_afs_stations(n, seed = 0):
+    rng = np.random.default_rng(seed)
+    states = _pick(rng, [a for _, a in STATES], n, STATE_P)
+    l2 = rng.poisson(2.0, n).astype(float)
+    dc = np.where(rng.random(n) < 0.15, rng.integers(1, 9, n), 0).astype(float)
+    l1 = np.where(rng.random(n) < 0.03, 1.0, np.nan)
+    # the AFS export leaves empty port counts blank rather than 0
+    l2[rng.random(n) < 0.1] = np.nan
+    confirmed = SESSION_START + rng.integers(0, SESSION_MINUTES // 1440, n).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "ID": np.arange(1, n + 1),
+        "Station_Name": pd.Series(np.arange(n)).map("Station {}".format),
+        "City": pd.Series(rng.integers(0, 2000, n)).map("City {}".format),
+        "State": states,
+        "Street_Address": pd.Series(rng.integers(1, 9999, n)).map("{} Main St".format),
+        "ZIP": rng.integers(1001, 99950, n),
+        "Latitude": rng.uniform(25.0, 49.0, n).round(6),
+        "Longitude": rng.uniform(-124.5, -67.0, n).round(6),
+        "EV_Connector_Types": _pick(rng, CONNECTORS, n, CONNECTOR_P),
+        "EV_Level1_EVSE_Num": l1,
+        "EV_Level2_EVSE_Num": l2,
+        "EV_DC_Fast_Num": dc,
+        "EV_Pricing": _pick(rng, PRICING, n, PRICING_P),
+        "Access_Days_Time": _pick(rng, ACCESS, n),
+        "Facility_Type": _pick(rng, FACILITIES, n),
+        "EV_Network": _pick(rng, NETWORKS, n, NETWORK_P),
+        "Date_Last_Confirmed": pd.Series(confirmed).dt.strftime("%Y-%m-%d"),
+    })
+
+def make_afdc_regs(years = range(2016, 2024), seed = 0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name, abbr in STATES:
+        base = 30_000 * STATE_P[[a for _, a in STATES].index(abbr)] * 50
+        for i, year in enumerate(years):
+            ev = int(base * 1.35 ** i * rng.uniform(0.9, 1.1))
+            rows.append({"State": name, "Year": year, "Electric_Vehicle_Reg_Count": ev,
+                         "Plug_In_Hybrid_Vehicle_Reg_Count": int(ev * rng.uniform(0.3, 0.5)),
+                         "Hybrid_Electric_Reg_Count": int(ev * rng.uniform(1.5, 3.0))})
+    return pd.DataFrame(rows)
+
+def make_census_snapshot(counties_per_state = 20, seed = 0):
+    # county rows in the shape of data/raw/census/census_data_2023.csv
+    rng = np.random.default_rng(seed)
+    rows = []
+    for fips, (name, abbr) in enumerate(STATES, start=1):
+        for c in range(1, counties_per_state + 1):
+            income = float(rng.integers(35_000, 140_000)) if rng.random() > 0.01 else -666666666.0
+            rows.append({"state_name": f"County {c} County, {name}", "population": float(rng.integers(2_000, 900_000)),
+                         "median_income": income, "state_fips": f"{fips:02d}", "county": f"{2 * c - 1:03d}",
+                         "county_fips": f"{fips:02d}{2 * c - 1:03d}", "county_name": f"COUNTY {c}", "state_abbr": abbr})
+    return pd.DataFrame(rows)
+
+def make_evse_table(n_evse, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "evse_id": np.arange(1, n_evse + 1),
+        "metro_area": _pick(rng, METROS, n_evse),
+        "land_use": _pick(rng, LAND_USE, n_evse),
+        "region": _pick(rng, REGIONS, n_evse),
+        "num_ports": rng.integers(1, 5, n_evse),
+        "charge_level": _pick(rng, CHARGE_LEVELS, n_evse, [0.8, 0.2]),
+        "venue": _pick(rng, VENUES, n_evse),
+        "pricing": _pick(rng, ["Paid", "Free", "Undesignated"], n_evse),
+    })
+
+def make_connector_table(evse, seed = 0):
+    # one or two connectors per EVSE
+    rng = np.random.default_rng(seed)
+    n2 = rng.random(len(evse)) < 0.3
+    evse_ids = np.concatenate([evse["evse_id"].to_numpy(), evse["evse_id"].to_numpy()[n2]])
+    number = np.concatenate([np.ones(len(evse), dtype=int), np.full(n2.sum(), 2)])
+    n = len(evse_ids)
+    return pd.DataFrame({
+        "connector_id": np.arange(1, n + 1),
+        "evse_id": evse_ids,
+        "connector_number": number,
+        "connector_type": _pick(rng, SESSION_CONNECTORS, n, [0.7, 0.08, 0.14, 0.08]),
+        "power_kw": _pick(rng, POWER_BUCKETS, n, [0.3, 0.35, 0.1, 0.15, 0.1]),
+    })
+
+def _session_core(rng, n, offset):
+    start = SESSION_START + rng.integers(0, SESSION_MINUTES, n).astype("timedelta64[m]")
+    charge = rng.gamma(2.0, 1.1, n)
+    total = charge + rng.exponential(1.5, n)
+    energy = charge * rng.uniform(3.0, 9.0, n)
+    energy[rng.random(n) < 0.01] = np.nan
+    start_s = pd.Series(start)
+    return {
+        "session_id": np.arange(offset, offset + n),
+        "start_datetime": start_s.dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_datetime": (start_s + pd.to_timedelta(total, unit="h")).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_duration": total.round(4),
+        "charge_duration": charge.round(4),
+        "energy_kwh": energy.round(4),
+    }
+
+def iter_flat_sessions(n, n_evse, seed = 0, chunk_rows = 500_000):
+    # the pre-flattened sessions export read by load_clean_evwatts(layout="flat")
+    rng = np.random.default_rng(seed)
+    for offset in range(0, n, chunk_rows):
+        m = min(chunk_rows, n - offset)
+        core = _session_core(rng, m, offset)
+        yield pd.DataFrame({
+            **core,
+            "evse_id": rng.integers(1, n_evse + 1, m),
+            "connector_type": _pick(rng, SESSION_CONNECTORS, m, [0.7, 0.08, 0.14, 0.08]),
+            "power_kw": rng.choice([6.6, 7.2, 11.5, 50.0, 150.0], m),
+            "charge_level": _pick(rng, CHARGE_LEVELS, m, [0.8, 0.2]),
+            "pricing": _pick(rng, ["Paid", "Free"], m),
+            "region": _pick(rng, REGIONS, m),
+            "state": _pick(rng, [a for _, a in STATES], m, STATE_P),
+            "metro_area": _pick(rng, METROS, m),
+            "venue": _pick(rng, VENUES, m),
+            "num_ports": rng.integers(1, 5, m),
+            # an extra column of the kind the raw export carries and the loader skips
+            "start_soc": np.nan,
+        })
+
+def iter_normalized_sessions(n, connectors, seed = 0, chunk_rows = 500_000):
+    # evwatts.public.session.csv: keys into the evse/connector tables, no attributes
+    rng = np.random.default_rng(seed)
+    conn_ids = connectors["connector_id"].to_numpy()
+    conn_evse = connectors["evse_id"].to_numpy()
+    for offset in range(0, n, chunk_rows):
+        m = min(chunk_rows, n - offset)
+        core = _session_core(rng, m, offset)
+        pick = rng.integers(0, len(conn_ids), m)
+        df = pd.DataFrame(core)
+        df.insert(1, "evse_id", conn_evse[pick])
+        df.insert(2, "connector_id", conn_ids[pick])
+        df["charge_level"] = _pick(rng, CHARGE_LEVELS, m, [0.8, 0.2])
+        df["start_soc"] = np.nan
+        df["end_soc"] = np.nan
+        df["flag_id"] = 0
+        yield df
+
+def _write_chunks(chunks, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+    return path
+
+def write_synthetic_raw(base, sessions = 100_000, stations = 10_000, evse = None, seed = 0, chunk_rows = 500_000):
+    # raw inputs under base/ in the build_paths layout; returns the Paths
+    paths = build_paths(base)
+    n_evse = evse or max(stations // 4, 10)
+    make_afs_stations(stations, seed).to_csv(paths.afs_stations_csv, index=False)
+    make_afdc_regs(seed=seed).to_csv(paths.afdc_regs_csv, index=False)
+    paths.census_snapshot_csv.parent.mkdir(parents=True, exist_ok=True)
+    make_census_snapshot(seed=seed).to_csv(paths.census_snapshot_csv)
+    _write_chunks(iter_flat_sessions(sessions, n_evse, seed, chunk_rows), paths.evwatts_sessions_csv)
+    evse_df = make_evse_table(n_evse, seed)
+    conn_df = make_connector_table(evse_df, seed)
+    paths.evwatts_evse_csv.parent.mkdir(parents=True, exist_ok=True)
+    evse_df.to_csv(paths.evwatts_evse_csv, index=False)
+    conn_df.to_csv(paths.evwatts_connector_csv, index=False)
+    _write_chunks(iter_normalized_sessions(sessions, conn_df, seed, chunk_rows), paths.evwatts_session_csv)
+    with open(Path(base) / "synthetic.json", "w") as f:
+        json.dump({"sessions": sessions, "stations": stations, "evse": n_evse, "seed": seed}, f, indent=1)
+    return paths
+
+# the committed 100-row sample, resolved from the repo root so the generator runs from any cwd
+FEATURES_TEMPLATE = Path(__file__).resolve().parents[2] / "data" / "processed" / "final_data" / "Sample_FinalFeaturesDF.csv"
+
+def _indicator(col):
+    vals = col.dropna().unique()
+    return len(vals) > 0 and set(np.asarray(vals, dtype=object).tolist()) <= {0, 1, 0.0, 1.0, True, False}
+
+def _template_header(template):
+    # the template repeats some one-hot names; read_csv would mangle those to "name.1"
+    with open(template, newline="") as f:
+        return next(csv.reader(f))
+
+def make_final_features(n, seed = 0, template = FEATURES_TEMPLATE):
+    # resamples rows of the committed feature sample so one-hot groups stay consistent within a row,
+    # then jitters the continuous columns; column names, order and dtypes follow the template
+    rng = np.random.default_rng(seed)
+    tmpl = pd.read_csv(template, low_memory=False)
+    out = tmpl.iloc[rng.integers(0, len(tmpl), n)].reset_index(drop=True)
+    for j, c in enumerate(out.columns):
+        if not pd.api.types.is_float_dtype(out[c]) or _indicator(tmpl[c]):
+            continue
+        vals = out[c].to_numpy(dtype="float64")
+        if np.allclose(vals[~np.isnan(vals)] % 1, 0):
+            continue    # counts, months, codes
+        out.isetitem(j, vals * rng.lognormal(0.0, 0.15, n))
+    if "STATION_NAME" in out.columns:
+        out["STATION_NAME"] = out["STATION_NAME"].astype(str) + " #" + pd.Series(np.arange(n)).astype(str)
+    out.columns = _template_header(template)
+    return out
+
+def write_final_features(path, n, seed = 0, chunk_rows = 500_000, template = FEATURES_TEMPLATE):
+    path = Path(path)
+    chunks = (make_final_features(min(chunk_rows, n - off), seed + i, template)
+              for i, off in enumerate(range(0, n, chunk_rows)))
+    return _write_chunks(chunks, path)
+
+def main():
+    p = argparse.ArgumentParser(description="Generate synthetic raw inputs and a synthetic final feature table.")
+    p.add_argument("--out", default="data_synth", help="Base data dir to generate (build_paths layout)")
+    p.add_argument("--sessions", type=int, default=100_000)
+    p.add_argument("--stations", type=int, default=10_000)
+    p.add_argument("--evse", type=int, default=None, help="EVSE count (default stations/4)")
+    p.add_argument("--features", type=int, default=0, help="Rows of the final feature table (0 = skip)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--chunk-rows", type=int, default=500_000)
+    args = p.parse_args()
+
+    paths = write_synthetic_raw(args.out, args.sessions, args.stations, args.evse, args.seed, args.chunk_rows)
+    print(f"Raw inputs written under {paths.raw}")
+    if args.features:
+        out = write_final_features(paths.processed / "final_data" / "FinalFeaturesDF.csv", args.features, args.seed, args.chunk_rows)
+        print(f"Feature table written {out}")
+
+if __name__ == "__main__":
+    main()
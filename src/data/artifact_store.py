@@ -0,0 +1,211 @@
+import json
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# typed columnar artifacts for interim/processed frames. Every artifact gets a
+# "<file>.schema.json" sidecar with its column dtypes (categories included) so a
+# reload never re-infers types, even for the CSV export.
+
+FORMATS = {"feather": ".feather", "parquet": ".parquet", "csv": ".csv"}
+
+def artifact_path(path, fmt = "feather"):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown artifact format '{fmt}', expected one of {sorted(FORMATS)}")
+    return Path(path).with_suffix(FORMATS[fmt])
+
+def schema_path(path):
+    path = Path(path)
+    return path.with_name(path.name + ".schema.json")
+
+def _fmt_from_suffix(path):
+    for fmt, suffix in FORMATS.items():
+        if Path(path).suffix.lower() == suffix:
+            return fmt
+    raise ValueError(f"Cannot infer artifact format from '{path}'")
+
+def frame_schema(df):
+    cols = {}
+    for c in df.columns:
+        dt = df[c].dtype
+        entry = {"dtype": str(dt)}
+        if isinstance(dt, pd.CategoricalDtype):
+            entry["categories"] = dt.categories.tolist()
+            entry["ordered"] = bool(dt.ordered)
+        cols[str(c)] = entry
+    return {"columns": cols}
+
+def write_schema(df, path):
+    with open(schema_path(path), "w") as f:
+        json.dump(frame_schema(df), f, indent=1, default=str)
+
+def read_schema(path):
+    sp = schema_path(path)
+    if not sp.exists():
+        return None
+    with open(sp) as f:
+        return json.load(f)
+
+def _write_one(df, path, fmt):
+    df = df.reset_index(drop=True)
+    if fmt == "feather":
+        # uncompressed so the file can be memory-mapped without a decode pass
+        feather.write_feather(df, path, compression="uncompressed")
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    write_schema(df, path)
+    return path
+
+def save_frame(df, path, fmt = "feather", export_csv = False):
+    # path may carry any suffix (e.g. the *_csv fields of Paths); the format decides the file written
+    out = _write_one(df, artifact_path(path, fmt), fmt)
+    if export_csv and fmt != "csv":
+        _write_one(df, artifact_path(path, "csv"), "csv")
+    return out
+
+def frame_columns(path):
+    path = Path(path)
+    schema = read_schema(path)
+    if schema is not None:
+        return list(schema["columns"].keys())
+    fmt = _fmt_from_suffix(path)
+    if fmt == "feather":
+        return feather.read_table(path, memory_map=True).schema.names
+    if fmt == "parquet":
+        return pq.read_schema(path).names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+def _restore_csv_dtypes(df, schema):
+    for c in df.columns:
+        entry = schema["columns"].get(c)
+        if entry is None:
+            continue
+        dtype = entry["dtype"]
+        if dtype == "category":
+            cats = pd.Index(entry["categories"])
+            # string categories come back as pandas' str dtype, not object, so test for numbers
+            if pd.api.types.is_numeric_dtype(cats):
+                df[c] = pd.to_numeric(df[c], errors="coerce")
+            df[c] = pd.Categorical(df[c], categories=cats, ordered=entry.get("ordered", False))
+        elif dtype.startswith("datetime64"):
+            df[c] = pd.to_datetime(df[c], errors="coerce", utc="UTC" in dtype)
+        elif dtype != str(df[c].dtype):
+            try:
+                df[c] = df[c].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
+
+def load_frame(path, columns = None):
+    # columns projects at read time; feather/parquet only touch the requested columns
+    path = Path(path)
+    fmt = _fmt_from_suffix(path)
+    if fmt == "feather":
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if fmt == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    schema = read_schema(path)
+    if schema is None:
+        return pd.read_csv(path, usecols=columns, low_memory=False)
+    str_cols = {c: "string" for c, e in schema["columns"].items() if e["dtype"] in ("object", "str", "string")}
+    df = pd.read_csv(path, usecols=columns, dtype=str_cols, low_memory=False)
+    return _restore_csv_dtypes(df, schema)
+
+def iter_frame(path, chunk_rows = 100_000, columns = None):
+    # streaming counterpart of load_frame: yields frames of at most chunk_rows rows
+    path = Path(path)
+    fmt = _fmt_from_suffix(path)
+    if fmt == "feather":
+        # memory-mapped, so each slice only pages in its own rows
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        for start in range(0, table.num_rows, chunk_rows):
+            yield table.slice(start, chunk_rows).to_pandas()
+        return
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    schema = read_schema(path)
+    str_cols = {c: "string" for c, e in schema["columns"].items() if e["dtype"] in ("object", "str", "string")} if schema else None
+    for chunk in pd.read_csv(path, usecols=columns, dtype=str_cols, chunksize=chunk_rows, low_memory=False):
+        yield _restore_csv_dtypes(chunk, schema) if schema else chunk
+
+class FrameWriter:
+    # appends frames chunk by chunk to a single artifact (used by the streaming build).
+    # Chunk categoricals carry different category sets, so chunks are spooled with plain values to
+    # "<file>.part" (an arrow stream) while the union of every chunk's categories is collected; close()
+    # then re-encodes the spool batch by batch against the sorted union into dictionary columns. The
+    # artifact reloads with the same categorical dtypes as the whole frame saved by save_frame.
+    def __init__(self, path, fmt = "feather"):
+        self.fmt = fmt
+        self.path = artifact_path(path, fmt)
+        self.spool = self.path.with_name(self.path.name + ".part")
+        self._schema = None
+        self._writer = None
+        self._first = None
+        self._categories = {}
+
+    def write(self, df):
+        df = df.reset_index(drop=True)
+        cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        for c in cats:
+            known = self._categories.get(c)
+            self._categories[c] = df[c].cat.categories if known is None else known.union(df[c].cat.categories, sort=False)
+        plain = df.assign(**{c: df[c].astype(df[c].cat.categories.dtype) for c in cats}) if cats else df
+        if self.fmt == "csv":
+            plain.to_csv(self.path, index=False, mode="a" if self._first is not None else "w", header=self._first is None)
+        else:
+            if self._schema is None:
+                table = pa.Table.from_pandas(plain, preserve_index=False)
+                self._schema = table.schema
+                self._writer = pa.ipc.new_stream(str(self.spool), self._schema)
+            else:
+                table = pa.Table.from_pandas(plain, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        if self._first is None:
+            self._first = df.head(0)
+
+    def _final_frame_head(self):
+        return self._first.assign(**{c: self._first[c].cat.set_categories(cats.sort_values())
+                                     for c, cats in self._categories.items()})
+
+    def _encode_spool(self):
+        head = self._final_frame_head()
+        # int32 indices whatever the category count; the pandas metadata comes from the categorical head
+        schema = pa.Table.from_pandas(head, preserve_index=False).schema
+        schema = pa.schema([pa.field(f.name, pa.dictionary(pa.int32(), self._schema.field(f.name).type))
+                            if pa.types.is_dictionary(f.type) else self._schema.field(f.name) for f in schema],
+                           metadata=schema.metadata)
+        dictionaries = {c: pa.array(head[c].cat.categories.tolist(), type=self._schema.field(c).type) for c in self._categories}
+        if self.fmt == "feather":
+            out = pa.ipc.new_file(str(self.path), schema)
+        else:
+            out = pq.ParquetWriter(str(self.path), schema)
+        with pa.ipc.open_stream(str(self.spool)) as reader, out:
+            for batch in reader:
+                cols = [pa.DictionaryArray.from_arrays(pc.index_in(batch.column(name), value_set=dictionaries[name]).cast(pa.int32()),
+                                                       dictionaries[name]) if name in dictionaries else batch.column(name)
+                        for name in schema.names]
+                out.write_table(pa.Table.from_arrays(cols, schema=schema))
+        self.spool.unlink()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._encode_spool()
+        if self._first is not None:
+            # sidecar written last, once every chunk's categories are known
+            write_schema(self._final_frame_head(), self.path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,170 @@
+import hashlib
+import inspect
+import json
+from functools import partial
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from .artifact_store import save_frame, load_frame, artifact_path
+
+# content-hashed stage DAG for the data build. A stage's key hashes its raw input
+# files, its params, the source of its code and the keys of the stages it depends on, so a key can be computed (and a dry run reported)
+# without running anything upstream.
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable                               # called as func(**{param: output of stage})
+    deps: Dict[str, str] = field(default_factory=dict)   # func param name -> upstream stage name
+    inputs: List[Path] = field(default_factory=list)
+    params: Dict = field(default_factory=dict)
+
+def _hash_file(path, block = 1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(block), b""):
+            h.update(b)
+    return h.hexdigest()
+
+def _module_source(module):
+    try:
+        return inspect.getsource(module)
+    except (OSError, TypeError):
+        return module.__name__
+
+def _func_source(func):
+    # the function's module plus the sibling modules it imports from, so edits to
+    # helpers a stage calls also invalidate it
+    while isinstance(func, partial):
+        func = func.func
+    module = inspect.getmodule(func)
+    if module is None:
+        return getattr(func, "__qualname__", repr(func))
+    package = module.__name__.rpartition(".")[0]
+    related = {module.__name__: module}
+    for obj in vars(module).values():
+        dep = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+        if dep is not None and package and dep.__name__.startswith(package + "."):
+            related[dep.__name__] = dep
+    return "".join(_module_source(related[n]) for n in sorted(related)) + func.__qualname__
+
+class StageCache:
+    def __init__(self, cache_dir):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._digest_index_path = self.dir / "file_digests.json"
+        self._digests = json.loads(self._digest_index_path.read_text()) if self._digest_index_path.exists() else {}
+
+    def file_digest(self, path):
+        # content hash, memoised on (size, mtime) so unchanged raw files are not re-read every run
+        path = Path(path)
+        if not path.exists():
+            return "missing"
+        st = path.stat()
+        memo_key = str(path.resolve())
+        stamp = [st.st_size, st.st_mtime_ns]
+        memo = self._digests.get(memo_key)
+        if memo and memo["stamp"] == stamp:
+            return memo["sha256"]
+        digest = _hash_file(path)
+        self._digests[memo_key] = {"stamp": stamp, "sha256": digest}
+        self._digest_index_path.write_text(json.dumps(self._digests, indent=1))
+        return digest
+
+    def stage_key(self, stage, dep_keys):
+        payload = {
+            "name": stage.name,
+            "code": _func_source(stage.func),
+            "params": stage.params,
+            "inputs": {str(p): self.file_digest(p) for p in stage.inputs},
+            "deps": dep_keys,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+    def entry(self, name, key):
+        return artifact_path(self.dir / f"{name}-{key}", "feather")
+
+    def has(self, name, key):
+        return self.entry(name, key).exists()
+
+    def load(self, name, key):
+        return load_frame(self.entry(name, key))
+
+    def latest(self, name):
+        entries = list(self.dir.glob(f"{name}-*.feather"))
+        return load_frame(entries[0]) if entries else None
+
+    def save(self, name, key, df):
+        # keep only the latest entry per stage
+        for old in self.dir.glob(f"{name}-*.feather*"):
+            old.unlink()
+        save_frame(df, self.entry(name, key), "feather")
+
+def plan_stages(stages, cache, force = False):
+    # returns [(stage, key, status)] in run order; status is "cached", "stale" or "forced"
+    keys, plan = {}, []
+    for s in stages:
+        missing = [d for d in s.deps.values() if d not in keys]
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on {missing}, which must be listed before it")
+        key = cache.stage_key(s, {param: keys[d] for param, d in s.deps.items()})
+        keys[s.name] = key
+        if force:
+            status = "forced"
+        elif cache.has(s.name, key):
+            status = "cached"
+        else:
+            status = "stale"
+        plan.append((s, key, status))
+    return plan
+
+def print_plan(plan):
+    width = max(len(s.name) for s, _, _ in plan)
+    for s, key, status in plan:
+        print(f"  {s.name:<{width}}  {status:<6}  {key}")
+
+def run_stages(stages, cache, force = False, dry_run = False, recorder = None):
+    # returns (outputs by stage name, names of stages that were recomputed)
+    plan = plan_stages(stages, cache, force=force)
+    print("Build plan:")
+    print_plan(plan)
+    if dry_run:
+        return {}, [s.name for s, _, status in plan if status != "cached"]
+
+    outputs, ran = {}, []
+    needed = _needed_outputs(plan)
+    for s, key, status in plan:
+        if status == "cached":
+            if s.name in needed:
+                outputs[s.name] = cache.load(s.name, key)
+            if recorder is not None:
+                recorder.note(s.name, status="cached", key=key)
+            continue
+        print(f"Running stage: {s.name}")
+        kwargs = {param: outputs[d] for param, d in s.deps.items()}
+        if recorder is not None:
+            rows_in = sum(len(v) for v in kwargs.values()) if kwargs else None
+            with recorder.stage(s.name, rows_in=rows_in, status=status, key=key, func=_func_name(s.func)) as rec:
+                out = s.func(**kwargs)
+                rec["rows_out"] = len(out)
+        else:
+            out = s.func(**kwargs)
+        cache.save(s.name, key, out)
+        outputs[s.name] = out
+        ran.append(s.name)
+    return outputs, ran
+
+def _func_name(func):
+    while isinstance(func, partial):
+        func = func.func
+    return getattr(func, "__qualname__", repr(func))
+
+def _needed_outputs(plan):
+    # cached outputs are only loaded when something downstream recomputes, or for the final stage
+    needed = {plan[-1][0].name}
+    for s, _, status in plan:
+        if status != "cached":
+            needed.update(s.deps.values())
+    return needed
@@ -1,23 +1,33 @@
 import os
+import json
+import time
+import hashlib
 import pandas as pd
 import requests
+from pathlib import Path
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 CENSUS_BASE = "https://api.census.gov/data/2022/acs/acs5"
+CENSUS_PARAMS = {
+    "get": "NAME,B01003_001E,B19013_001E",
+    "for": "state:*"
+}
+CENSUS_COLUMNS = ["STATE_NAME","POPULATION","MEDIAN_INCOME","STATE_FIPS"]
 
-def fetch_state_population_income(api_key = None):
-    params = {
-        "get": "NAME,B01003_001E,B19013_001E",
-        "for": "state:*"
-    }
-    if api_key:
-        params["key"] = api_key
+_session = None
 
-    r = requests.get(CENSUS_BASE, params=params, timeout=60)
-    r.raise_for_status()
-    data = r.json()
-    cols = data[0]
-    rows = data[1:]
+def census_session():
+    # one pooled session per process, with retries on transient upstream errors
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry))
+    return _session
+
+def _state_frame(rows, cols):
     df = pd.DataFrame(rows, columns=cols)
     df.rename(columns={
         "NAME": "STATE_NAME",
@@ -30,5 +40,110 @@ def fetch_state_population_income(api_key = None):
     df["MEDIAN_INCOME"] = pd.to_numeric(df["MEDIAN_INCOME"], errors="coerce")
     return df
 
+def fetch_state_population_income(api_key = None, session = None, timeout = 60):
+    params = dict(CENSUS_PARAMS)
+    if api_key:
+        params["key"] = api_key
+
+    r = (session or census_session()).get(CENSUS_BASE, params=params, timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    return _state_frame(data[1:], data[0])
+
+# Census providers: all return one row per state with CENSUS_COLUMNS.
+
+class CensusProvider:
+    def fetch(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def cache_token(self):
+        # identifies what this provider would return, for the build stage cache
+        return type(self).__name__
+
+    def input_files(self):
+        # local files the result is derived from, hashed by the build stage cache
+        return []
+
+class SnapshotCensusProvider(CensusProvider):
+    # offline: rolls the shipped county-level snapshot up to states
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def fetch(self):
+        df = pd.read_csv(self.path, usecols=["state_name","population","median_income","state_fips"],
+                         dtype={"state_fips": str})
+        df["STATE_NAME"] = df["state_name"].str.rsplit(",", n=1).str[-1].str.strip()
+        # ACS reports suppressed medians as large negative sentinels
+        income = df["median_income"].where(df["median_income"] > 0)
+        df["_pop_w"] = df["population"].where(income.notna())
+        df["_inc_w"] = income * df["_pop_w"]
+        g = df.groupby(["state_fips","STATE_NAME"], as_index=False).agg(
+            POPULATION=("population","sum"),
+            _inc_w=("_inc_w","sum"),
+            _pop_w=("_pop_w","sum"),
+        )
+        # state median income approximated by the population-weighted mean of county medians
+        g["MEDIAN_INCOME"] = g["_inc_w"] / g["_pop_w"]
+        g = g.rename(columns={"state_fips": "STATE_FIPS"})
+        return g[CENSUS_COLUMNS]
+
+    def cache_token(self):
+        return f"snapshot:{self.path}"
+
+    def input_files(self):
+        return [self.path]
+
+class HttpCensusProvider(CensusProvider):
+    def __init__(self, api_key = None, session = None, timeout = 60):
+        self.api_key = api_key
+        self.session = session
+        self.timeout = timeout
+
+    def fetch(self):
+        return fetch_state_population_income(self.api_key, session=self.session, timeout=self.timeout)[CENSUS_COLUMNS]
+
+    def cache_token(self):
+        return f"api:{CENSUS_BASE}"
+
+class CachedCensusProvider(CensusProvider):
+    # disk cache with a TTL in front of another provider (normally the HTTP one)
+    def __init__(self, inner, cache_dir, ttl_seconds = 7 * 24 * 3600):
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl_seconds
+
+    def _cache_file(self):
+        # the API key is deliberately not part of the cache name
+        key = hashlib.sha256(self.inner.cache_token().encode()).hexdigest()[:16]
+        return self.cache_dir / f"census_{key}.json"
+
+    def fetch(self):
+        f = self._cache_file()
+        if f.exists() and time.time() - f.stat().st_mtime < self.ttl:
+            with open(f) as fh:
+                return pd.DataFrame(json.load(fh))[CENSUS_COLUMNS]
+        df = self.inner.fetch()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(".tmp")
+        with open(tmp, "w") as fh:
+            json.dump(df.to_dict(orient="list"), fh)
+        os.replace(tmp, f)
+        return df
+
+    def cache_token(self):
+        # changes once per TTL window so the build stage re-checks an expired cache
+        return f"cached:{self.inner.cache_token()}:{int(time.time() // self.ttl)}"
+
+CENSUS_SOURCES = ["snapshot", "api", "cached-api"]
+
+def get_census_provider(source, paths, api_key = None, ttl_seconds = 7 * 24 * 3600):
+    if source == "snapshot":
+        return SnapshotCensusProvider(paths.census_snapshot_csv)
+    if source == "api":
+        return HttpCensusProvider(api_key)
+    if source == "cached-api":
+        return CachedCensusProvider(HttpCensusProvider(api_key), paths.census_cache_dir, ttl_seconds)
+    raise ValueError(f"Unknown census source '{source}', expected one of {CENSUS_SOURCES}")
+
 
-#print( fetch_state_population_income("dferr2e453434fefegerfret43fref") )
\ No newline at end of file
+#print( fetch_state_population_income("dferr2e453434fefegerfret43fref") )
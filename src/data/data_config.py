@@ -1,5 +1,6 @@
 from pathlib import Path
 from dataclasses import dataclass
+from .artifact_store import artifact_path
 
 @dataclass
 class Paths:
@@ -12,9 +13,15 @@ class Paths:
 
     # input file names 
     evwatts_sessions_csv: Path
+    evwatts_session_csv: Path
+    evwatts_evse_csv: Path
+    evwatts_connector_csv: Path
     afs_stations_csv: Path
     afdc_regs_csv: Path
     fips_ref_csv: Path
+    zip_county_csv: Path
+    census_snapshot_csv: Path
+    census_cache_dir: Path
 
     # interim file names 
     #ev_vehicle_df: Path
@@ -25,8 +32,26 @@ class Paths:
     sessions_clean_csv: Path
     state_month_agg_csv: Path
     station_month_merged_csv: Path
+    stations_fips_csv: Path
+    county_month_agg_csv: Path
+    state_load_profile_csv: Path
+    state_month_load_csv: Path
+    final_features_csv: Path
+    feature_vocab_json: Path
+    station_geo_index: Path
 
-def build_paths(base: str = "data"):
+    # content-hashed stage outputs for incremental rebuilds
+    stage_cache: Path
+
+    # artifact storage: "feather" / "parquet" (typed, memory-mapped) or "csv"
+    artifact_format: str = "feather"
+    export_csv: bool = False
+
+    def artifact(self, path):
+        # where an output field is actually written for the configured format
+        return artifact_path(path, self.artifact_format)
+
+def build_paths(base: str = "data", artifact_format: str = "feather", export_csv: bool = False):
     base_dir = Path(base)
     raw = base_dir / "raw"
     external = base_dir / "external"
@@ -45,13 +70,29 @@ def build_paths(base: str = "data"):
         interim=interim,
         processed=processed,
         evwatts_sessions_csv=raw / "evsessions.csv",  
+        evwatts_session_csv=raw / "evwatts" / "evwatts.public.session.csv",
+        evwatts_evse_csv=raw / "evwatts" / "evwatts.public.evse.csv",
+        evwatts_connector_csv=raw / "evwatts" / "evwatts.public.connector.csv",
         afs_stations_csv=raw / "Alternative_Fueling_Stations.csv",
         afdc_regs_csv=raw / "afdc_vehicle_registrations.csv",
-        fips_ref_csv=external / "State__County_and_City_FIPS_Reference_Table.csv",
+        fips_ref_csv=raw / "fips" / "FIPS_Reference_Table_20251006.csv",
+        zip_county_csv=raw / "fips" / "ZIP-COUNTY-FIPS_2017-06.csv",
+        census_snapshot_csv=raw / "census" / "census_data_2023.csv",
+        census_cache_dir=external / "census_cache",
         stations_clean_csv=interim / "afs_stations_clean.csv",
         sessions_clean_csv=interim / "evsessions_clean.csv",
         state_month_agg_csv=processed / "state_month_agg.csv",
         station_month_merged_csv=processed / "processed_ev_demand.csv",
+        stations_fips_csv=interim / "afs_stations_fips.csv",
+        county_month_agg_csv=processed / "county_month_agg.csv",
+        state_load_profile_csv=processed / "state_load_profile.csv",
+        state_month_load_csv=processed / "state_month_load.csv",
+        final_features_csv=processed / "final_data" / "FinalFeaturesDF.csv",
+        feature_vocab_json=processed / "final_data" / "feature_vocab.json",
+        station_geo_index=interim / "afs_station_geo_index.joblib",
+        stage_cache=interim / "stage_cache",
+        artifact_format=artifact_format,
+        export_csv=export_csv,
     )
 
 
@@ -14,14 +14,62 @@ STATE_ABBREV = {
     'West Virginia':'WV','Wisconsin':'WI','Wyoming':'WY'
 }
 
-def add_time_parts(df, dt_col) :
-    out = df.copy()
-    out[dt_col] = pd.to_datetime(out[dt_col], errors="coerce", utc=True).dt.tz_convert(None)
-    out["Year"]  = out[dt_col].dt.year
-    out["Month"] = out[dt_col].dt.month
-    out["Day"]   = out[dt_col].dt.day
-    out["Hour"]  = out[dt_col].dt.hour
-    out["month_label"] = out[dt_col].dt.to_period("M").astype(str)  
+# tried in order on values that are still unparsed; anything left goes through inference
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%m/%d/%Y %H:%M", "%m/%d/%Y"]
+
+def parse_datetimes(s, formats = DATETIME_FORMATS):
+    # naive UTC datetimes; offsets are converted to UTC like pd.to_datetime(utc=True)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.dt.tz_convert(None) if s.dt.tz is not None else s
+    vals = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[ns]")
+    todo = s.notna().to_numpy().copy()
+    for fmt in formats:
+        if not todo.any():
+            break
+        pos = np.flatnonzero(todo)
+        parsed = pd.to_datetime(s[todo], format=fmt, errors="coerce").to_numpy(dtype="datetime64[ns]")
+        ok = ~np.isnat(parsed)
+        vals[pos[ok]] = parsed[ok]
+        todo[pos[ok]] = False
+    if todo.any():
+        rest = pd.to_datetime(s[todo], format="mixed", errors="coerce", utc=True).dt.tz_convert(None)
+        vals[todo] = rest.to_numpy(dtype="datetime64[ns]")
+    return pd.Series(vals, index=s.index, name=s.name)
+
+def _nullable(values, nat, dtype):
+    return pd.arrays.IntegerArray(values.astype(dtype.numpy_dtype), nat)
+
+def month_codes_to_labels(codes, nat):
+    # "YYYY-MM" categorical from months-since-epoch codes; only unique months are formatted
+    uniq = np.unique(codes[~nat])
+    cats = [f"{m // 12 + 1970}-{m % 12 + 1:02d}" for m in uniq]
+    idx = np.where(nat, -1, np.searchsorted(uniq, codes))
+    return pd.Categorical.from_codes(idx, categories=cats)
+
+def month_label(year, month):
+    # vectorised "YYYY-MM" labels for Year/Month columns (rows with missing parts get NaN)
+    y = pd.to_numeric(year, errors="coerce").to_numpy(dtype="float64")
+    m = pd.to_numeric(month, errors="coerce").to_numpy(dtype="float64")
+    nat = np.isnan(y) | np.isnan(m)
+    codes = np.where(nat, 0, (y - 1970) * 12 + m - 1).astype(np.int64)
+    return pd.Series(month_codes_to_labels(codes, nat), index=getattr(year, "index", None))
+
+def add_time_parts(df, dt_col, formats = DATETIME_FORMATS) :
+    # Year/Month/Day/Hour from integer arithmetic on datetime64 values, stored as
+    # nullable Int16/Int8, plus a categorical month_label
+    out = df.copy(deep=False)
+    dt = parse_datetimes(out[dt_col], formats)
+    out[dt_col] = dt
+    vals = dt.to_numpy(dtype="datetime64[ns]")
+    nat = np.isnat(vals)
+    months = vals.astype("datetime64[M]")
+    days = vals.astype("datetime64[D]")
+    mcode = months.astype(np.int64)
+    out["Year"]  = _nullable(mcode // 12 + 1970, nat, pd.Int16Dtype())
+    out["Month"] = _nullable(mcode % 12 + 1, nat, pd.Int8Dtype())
+    out["Day"]   = _nullable((days - months.astype("datetime64[D]")).astype(np.int64) + 1, nat, pd.Int8Dtype())
+    out["Hour"]  = _nullable((vals.astype("datetime64[h]") - days.astype("datetime64[h]")).astype(np.int64), nat, pd.Int8Dtype())
+    out["month_label"] = month_codes_to_labels(mcode, nat)
     return out
 
 def month_label_nice(year, month):
@@ -30,7 +78,7 @@ def month_label_nice(year, month):
     return d.dt.strftime("%b, %Y")
 
 def safe_numeric(df, cols) :
-    out = df.copy()
+    out = df.copy(deep=False)
     for c in cols:
         out[c] = pd.to_numeric(out[c], errors="coerce")
     return out
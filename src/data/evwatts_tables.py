@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+# Loader for the normalized EV WATTS public release (session / evse / connector
+# tables). The dimension tables are read once with categorical columns and an
+# integer index; sessions pick up their EVSE and connector attributes by
+# positional take on those indexes, so the wide flattened file is never built.
+#
+# Note: the public release carries no state on any of these tables (region and
+# metro_area are the finest geography), so "state" is only present if the
+# session table itself provides it.
+
+EVSE_COLUMNS = ["evse_id","metro_area","land_use","region","num_ports","charge_level","venue","pricing"]
+EVSE_CATEGORICAL = ["metro_area","land_use","region","charge_level","venue","pricing"]
+CONNECTOR_COLUMNS = ["connector_id","evse_id","connector_number","connector_type","power_kw"]
+SESSION_COLUMNS = ["session_id","evse_id","connector_id","start_datetime","end_datetime","total_duration",
+                   "charge_duration","energy_kwh","charge_level","state"]
+
+_BUCKET = r"^\s*(?P<op><|>)?\s*(?P<lo>\d+(?:\.\d+)?)\s*(?:kW)?\s*(?:-\s*(?P<hi>\d+(?:\.\d+)?)\s*kW)?\s*$"
+
+def parse_power_buckets(labels):
+    # numeric range for each distinct power_kw label ("<8 kW", ">8 kW", "30 kW - 100 kW", ...).
+    # power_kw is the range midpoint, or the single known bound for open-ended buckets.
+    labels = pd.Index(labels)
+    m = labels.to_series().astype(str).str.extract(_BUCKET)
+    bound = pd.to_numeric(m["lo"], errors="coerce")
+    hi = pd.to_numeric(m["hi"], errors="coerce")
+    lo = bound.where(m["op"] != "<", 0.0)
+    hi = hi.where(hi.notna(), bound.where(m["op"] == "<"))
+    out = pd.DataFrame({"power_kw_min": lo.to_numpy(), "power_kw_max": hi.to_numpy()}, index=labels)
+    out["power_kw"] = out[["power_kw_min","power_kw_max"]].mean(axis=1)
+    out.loc[m["op"].eq(">").to_numpy(), "power_kw"] = out["power_kw_min"]
+    return out
+
+def _read(path, usecols, categorical = ()):
+    df = pd.read_csv(path, encoding="utf-8-sig", usecols=lambda c: c.strip().lower() in usecols,
+                     dtype={c: "category" for c in categorical}, low_memory=False)
+    df.columns = [c.strip().lower() for c in df.columns]
+    return df
+
+def load_evse_dim(path):
+    evse = _read(path, EVSE_COLUMNS, EVSE_CATEGORICAL)
+    evse["num_ports"] = pd.to_numeric(evse["num_ports"], errors="coerce")
+    return evse.set_index("evse_id").sort_index()
+
+def load_connector_dim(path):
+    conn = _read(path, CONNECTOR_COLUMNS, ["connector_type","power_kw"]).rename(columns={"power_kw": "power_kw_bucket"})
+    # parse each distinct bucket once and broadcast through the category codes
+    buckets = parse_power_buckets(conn["power_kw_bucket"].cat.categories)
+    codes = conn["power_kw_bucket"].cat.codes.to_numpy()
+    for c in buckets.columns:
+        vals = np.append(buckets[c].to_numpy(dtype="float64"), np.nan)
+        conn[c] = vals[codes]        # code -1 (missing) lands on the trailing NaN
+    return conn.set_index("connector_id").sort_index()
+
+def _take(dim, keys, columns):
+    # positional gather of dim rows for integer keys; unmatched keys give missing values
+    pos = dim.index.get_indexer(keys)
+    hit = pos >= 0
+    out = {}
+    for c in columns:
+        col = dim[c]
+        taken = col.take(np.where(hit, pos, 0)).reset_index(drop=True)
+        out[c] = taken.where(pd.Series(hit)) if not hit.all() else taken
+    return pd.DataFrame(out)
+
+def join_session_dims(sessions, evse, conn):
+    sessions = sessions.reset_index(drop=True)
+    sessions.columns = [c.strip().lower() for c in sessions.columns]
+    evse_cols = ["metro_area","land_use","region","num_ports","venue","pricing"]
+    if "charge_level" not in sessions.columns:
+        evse_cols.append("charge_level")
+    parts = [sessions, _take(evse, sessions["evse_id"].to_numpy(), evse_cols)]
+    conn_cols = ["connector_type","power_kw_bucket","power_kw","power_kw_min","power_kw_max"]
+    if "connector_id" in sessions.columns:
+        parts.append(_take(conn, sessions["connector_id"].to_numpy(), conn_cols))
+    else:
+        # no connector key on the session: use the EVSE's first connector
+        first = conn.reset_index().sort_values(["evse_id","connector_number"]).drop_duplicates("evse_id").set_index("evse_id")
+        parts.append(_take(first, sessions["evse_id"].to_numpy(), conn_cols))
+    return pd.concat(parts, axis=1)
+
+def load_evwatts_dims(paths):
+    return load_evse_dim(paths.evwatts_evse_csv), load_connector_dim(paths.evwatts_connector_csv)
+
+def _read_sessions(path, chunk_rows = None):
+    return pd.read_csv(path, encoding="utf-8-sig", usecols=lambda c: c.strip().lower() in SESSION_COLUMNS,
+                       chunksize=chunk_rows, low_memory=False)
+
+def load_evwatts_normalized(paths):
+    # sessions joined to their EVSE/connector attributes, same columns as the flat export
+    evse, conn = load_evwatts_dims(paths)
+    return join_session_dims(_read_sessions(paths.evwatts_session_csv), evse, conn)
+
+def iter_evwatts_normalized(paths, chunk_rows = 250_000):
+    # dimensions are loaded once; only session chunks stream
+    evse, conn = load_evwatts_dims(paths)
+    for chunk in _read_sessions(paths.evwatts_session_csv, chunk_rows):
+        yield join_session_dims(chunk, evse, conn)
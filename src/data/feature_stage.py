@@ -0,0 +1,343 @@
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .artifact_store import load_frame, save_frame, FORMATS
+from .data_utils import STATE_ABBREV
+
+# The FeatureEngineering notebook as a build stage: cleaned AFS stations (with county census from
+# fips_enrich) + state-month sessions + registrations -> the FinalFeaturesDF table train_supervised reads.
+#
+#   station_month_base  one row per (station attributes, Year, Month) of the confirmation date, with
+#                       county census, state registrations and the state's monthly session sums
+#                       (the notebook's ev_census_vehicle_data_all.csv, same upper-case columns),
+#                       plus the state's monthly load profile (LOAD_*, see load_profile) when given
+#   fit_feature_vocab   the encoder vocabulary: top networks / facility types, states, record counts,
+#                       demand quantiles. Fitted once and frozen in a JSON file so later batches
+#                       (scoring) get exactly the training columns, in the same order.
+#   engineer_features   base + vocab -> feature table
+#
+# Differences from the notebook:
+#   - EV_CONNECTOR_TYPES and EV_PRICING are parsed once per distinct value with vectorized string
+#     ops instead of ast.literal_eval / str.contains per row
+#   - every imputed numeric column (demographics, registrations, session sums) takes its state's
+#     median from one grouped median (overall median for states with none), frozen in the vocabulary
+#     with the encoders; the notebook's random forest imputers are not reproduced
+#   - EV_GROWTH_RATE is the notebook's consecutive-row registration change, taken on the training rows
+#     only and frozen per state (median) in the vocabulary, so a row's growth does not depend on the
+#     other rows of the batch it is scored with
+#   - one FACILITY_TYPE_* block (no ".1" duplicates, no FACILITY_TYPE_clean), indicators stored as
+#     uint8 and measures as float64
+#
+#   python -m src.data.feature_stage --base new_station_months.csv --vocab data/processed/final_data/feature_vocab.json --out features.parquet
+
+CONNECTOR_CATEGORIES = ["J1772", "CHAdeMO", "Combo"]
+# notebook mapping: CHAdeMO / CCS / J3271 plugs count as CHAdeMO, Tesla as Combo, anything else as J1772
+CONNECTOR_MAP = {"CHADEMO": "CHAdeMO", "J1772COMBO": "CHAdeMO", "J3271": "CHAdeMO", "TESLA": "Combo"}
+
+PRICING_PATTERNS = {
+    "PRICE_per_kwh_rate": r"\$\d+(?:\.\d+)?\s*(?:per\s*kwh|/kwh|kwh)",
+    "PRICE_per_minute_rate": r"\$\d+(?:\.\d+)?\s*(?:per\s*minute|/minute)",
+    "PRICE_per_hour_rate": r"\$\d+(?:\.\d+)?\s*(?:per\s*hour|/hour|\bhr\b)",
+    "PRICE_per_session_fee": r"\$\d+(?:\.\d+)?\s*(?:per\s*session|session fee)",
+    "PRICE_monthly_fee": r"monthly service fee",
+    "PRICE_activation_fee_present": r"activation fee|connection fee",
+    "PRICE_parking_fee_present": r"parking fee|/hr parking|per day parking|garage",
+    "PRICE_is_free": r"\bfree\b|donations accepted|no cost",
+    "PRICE_other_or_unknown": r"unknown|purchase|paid through|not specified|n/a",
+}
+
+IMPUTE_BY_STATE = ["POPULATION", "MEDIAN_INCOME", "ELECTRIC_VEHICLE_REG_COUNT", "PLUG_IN_HYBRID_VEHICLE_REG_COUNT",
+                   "HYBRID_ELECTRIC_REG_COUNT", "TOTAL_DURATION", "CHARGE_DURATION", "ENERGY_KWH", "NUM_PORTS",
+                   "TOTAL_SESSIONS"]
+PORT_COLUMNS = ["EV_LEVEL1_EVSE_NUM", "EV_LEVEL2_EVSE_CNUM", "EV_DC_FAST_NUM"]
+BASE_COLUMNS = ["STATION_NAME", "CITY", "LATITUDE", "LONGITUDE", "EV_CONNECTOR_TYPES"] + PORT_COLUMNS + [
+    "EV_PRICING", "FACILITY_TYPE", "EV_NETWORK", "Month", "POPULATION", "MEDIAN_INCOME", "record_count", "STATE_NAME",
+    "ELECTRIC_VEHICLE_REG_COUNT", "PLUG_IN_HYBRID_VEHICLE_REG_COUNT", "HYBRID_ELECTRIC_REG_COUNT",
+    "TOTAL_DURATION", "CHARGE_DURATION", "ENERGY_KWH", "NUM_PORTS", "TOTAL_SESSIONS", "STATE"]
+SEASONS = {12: "winter", 1: "winter", 2: "winter", 3: "spring", 4: "spring", 5: "spring",
+           6: "summer", 7: "summer", 8: "summer", 9: "fall", 10: "fall", 11: "fall"}
+# state-month load profile summaries (load_profile.summarize_months) joined as features
+LOAD_FEATURES = {"LOAD_PEAK_CONCURRENT": "peak_concurrent", "LOAD_MEAN_CONCURRENT": "mean_concurrent",
+                 "LOAD_PEAK_KW": "peak_kw", "LOAD_MEAN_KW": "mean_kw", "LOAD_FACTOR": "load_factor",
+                 "LOAD_KW_P05": "kw_p05", "LOAD_BUSY_SHARE": "busy_share"}
+TOP_NETWORKS = 15
+TOP_FACILITIES = 20
+
+STATE_NAMES = {abbr: name for name, abbr in STATE_ABBREV.items()}
+
+# ---------- base table ----------
+
+def station_month_base(afs, state_month, regs, load = None):
+    stations = afs.copy(deep=False)
+    stations["state"] = stations["state"].astype("string")
+    keys = [c for c in ["station_name", "city", "latitude", "longitude", "ev_connector_types", "ev_level1_evse_num",
+                        "ev_level2_evse_num", "ev_dc_fast_num", "ev_pricing", "facility_type", "ev_network",
+                        "state", "Year", "Month"] if c in stations.columns]
+    census = {"POPULATION": "county_population", "MEDIAN_INCOME": "county_median_income"}
+    aggs = {out: (c, "mean") for out, c in census.items() if c in stations.columns}
+    base = (stations.groupby(keys, dropna=False, observed=True, sort=False)
+                    .agg(record_count=("id", "count"), **aggs)
+                    .reset_index())
+    for out in census:
+        if out not in base.columns:
+            base[out] = np.nan
+
+    regs_sy = (regs.assign(state=regs["state"].astype("string"))
+                   .groupby(["state", "year"], as_index=False, observed=True)
+                   .agg(ELECTRIC_VEHICLE_REG_COUNT=("electric_vehicle_reg_count", "sum"),
+                        PLUG_IN_HYBRID_VEHICLE_REG_COUNT=("plug_in_hybrid_vehicle_reg_count", "sum"),
+                        HYBRID_ELECTRIC_REG_COUNT=("hybrid_electric_reg_count", "sum"))
+                   .rename(columns={"year": "Year"}))
+    sessions = pd.DataFrame({
+        "state": state_month["state"].astype("string"), "Year": state_month["Year"], "Month": state_month["Month"],
+        "TOTAL_DURATION": state_month["total_duration_sum"], "CHARGE_DURATION": state_month["charge_duration_sum"],
+        "ENERGY_KWH": state_month["energy_kwh_sum"], "NUM_PORTS": state_month.get("num_ports_sum", np.nan),
+        "TOTAL_SESSIONS": state_month["sessions"],
+    })
+    frames = [base, regs_sy, sessions]
+    if load is not None:
+        load = pd.DataFrame({"state": load["state"].astype("string"), "Year": load["Year"], "Month": load["Month"],
+                             **{out: load[c] for out, c in LOAD_FEATURES.items()}})
+        frames.append(load)
+    # nullable / narrowed key dtypes differ between the frames; join on plain Int64
+    for df in frames:
+        for c in [c for c in ("Year", "Month") if c in df.columns]:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    base = base.merge(regs_sy, on=["state", "Year"], how="left").merge(sessions, on=["state", "Year", "Month"], how="left")
+    if load is not None:
+        base = base.merge(load, on=["state", "Year", "Month"], how="left")
+
+    base = base.rename(columns={
+        "station_name": "STATION_NAME", "city": "CITY", "latitude": "LATITUDE", "longitude": "LONGITUDE",
+        "ev_connector_types": "EV_CONNECTOR_TYPES", "ev_level1_evse_num": "EV_LEVEL1_EVSE_NUM",
+        "ev_level2_evse_num": "EV_LEVEL2_EVSE_CNUM", "ev_dc_fast_num": "EV_DC_FAST_NUM", "ev_pricing": "EV_PRICING",
+        "facility_type": "FACILITY_TYPE", "ev_network": "EV_NETWORK", "state": "STATE",
+    })
+    base["STATE_NAME"] = base["STATE"].map(STATE_NAMES)
+    base["Month"] = base["Month"].astype("float64")
+    return base[[c for c in BASE_COLUMNS + list(LOAD_FEATURES) if c in base.columns]]
+
+# ---------- encoders ----------
+
+def _per_value(s, func):
+    # func applied to the distinct values only, broadcast back through the category codes
+    cat = pd.Categorical(s)
+    out = func(pd.Series(cat.categories, dtype=object))
+    codes = cat.codes
+    return out, codes
+
+def connector_flags(s):
+    # (n, 3) uint8 J1772 / CHAdeMO / Combo flags. Values are python-style lists of quoted names
+    # ('["J1772", "TESLA"]', CSV-escaped '[""J1772""]'); anything else (or missing) has no connectors,
+    # as when the notebook's literal_eval failed.
+    def parse(values):
+        text = values.astype(str).str.replace('""', '"', regex=False).str.strip()
+        is_list = text.str.fullmatch(r"\[\s*(?:(?:\"[^\"]*\"|'[^']*')\s*,?\s*)*\]")
+        tokens = text.str.findall(r"['\"]([^'\"]*)['\"]").where(is_list, None)
+        flags = np.zeros((len(values), len(CONNECTOR_CATEGORIES)), dtype=np.uint8)
+        for i, toks in enumerate(tokens):
+            for t in toks or []:
+                flags[i, CONNECTOR_CATEGORIES.index(CONNECTOR_MAP.get(t.strip().upper(), "J1772"))] = 1
+        return flags
+    flags, codes = _per_value(s, parse)
+    out = np.zeros((len(s), len(CONNECTOR_CATEGORIES)), dtype=np.uint8)
+    known = codes >= 0
+    out[known] = flags[codes[known]]
+    return out
+
+def pricing_flags(s):
+    # {PRICE_* column: uint8 flags} from the lower-cased EV_PRICING text; missing text matches nothing
+    def parse(values):
+        text = values.astype(str).str.lower()
+        return {label: text.str.contains(pat, regex=True).to_numpy(dtype=np.uint8) for label, pat in PRICING_PATTERNS.items()}
+    flags, codes = _per_value(s, parse)
+    known = codes >= 0
+    out = {}
+    for label, f in flags.items():
+        col = np.zeros(len(s), dtype=np.uint8)
+        col[known] = f[codes[known]]
+        out[label] = col
+    return out
+
+def _facility_column(name):
+    return f"FACILITY_TYPE_{name.replace(' ', '_').replace('-', '_')}"
+
+def _top(s, n):
+    # most frequent values, ties broken by name so the vocabulary does not depend on row order
+    counts = s.value_counts(dropna=True)
+    return sorted(counts.index, key=lambda v: (-counts[v], v))[:n]
+
+def _state_abbr(base):
+    # notebook standardisation: STATE_NAME given as an abbreviation or a full name; STATE as fallback
+    valid = set(STATE_ABBREV.values())
+    name = base["STATE_NAME"].astype("string").str.strip() if "STATE_NAME" in base.columns else pd.Series(pd.NA, index=base.index, dtype="string")
+    abbr = name.where(name.isin(valid), name.map(STATE_ABBREV))
+    if "STATE" in base.columns:
+        state = base["STATE"].astype("string").str.strip().str.upper()
+        abbr = abbr.fillna(state.where(state.isin(valid)))
+    return abbr
+
+def _clean_rows(base):
+    df = base[base["EV_CONNECTOR_TYPES"].notna()].copy()
+    df["STATE"] = _state_abbr(df)
+    df = df[df["STATE"].notna()]
+    df["STATION_NAME"] = df["STATION_NAME"].fillna("Blink Charging Station")
+    df["EV_NETWORK"] = df["EV_NETWORK"].astype(object).where(df["EV_NETWORK"].notna(), "Unknown")
+    df["FACILITY_TYPE"] = df["FACILITY_TYPE"].astype(object).where(df["FACILITY_TYPE"].notna(), "UNKNOWN")
+    for c in PORT_COLUMNS:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("float64")
+    for c in IMPUTE_BY_STATE + [c for c in LOAD_FEATURES if c in df.columns]:
+        vals = df[c] if pd.api.types.is_numeric_dtype(df[c]) else df[c].astype("string").str.replace(",", "", regex=False)
+        df[c] = pd.to_numeric(vals, errors="coerce").astype("float64")
+    df["Month"] = pd.to_numeric(df["Month"], errors="coerce").astype("float64")
+    return df
+
+def _demand_score(df):
+    return (df["TOTAL_SESSIONS"] / df["NUM_PORTS"]).replace([np.inf, -np.inf], np.nan)
+
+def _growth(df):
+    # change in registrations between a state's consecutive rows, as the notebook computed it;
+    # fit time only, engineer_features maps the per-state medians
+    return df["ELECTRIC_VEHICLE_REG_COUNT"].groupby(df["STATE"], sort=False).pct_change()
+
+def fit_feature_vocab(base):
+    # everything engineer_features learns from data, imputation medians included; JSON-serialisable
+    df = _clean_rows(base)
+    load_features = [c for c in LOAD_FEATURES if c in df.columns]
+    imputed = IMPUTE_BY_STATE + load_features
+    medians = df.groupby("STATE", observed=True)[imputed].median()
+    vocab = {"impute_medians": {c: medians[c].dropna().to_dict() for c in imputed},
+             "impute_overall": df[imputed].median().to_dict(),
+             "load_features": load_features}
+    df = _impute(df, vocab)
+    growth = _growth(df).replace([np.inf, -np.inf], np.nan)
+    score = _demand_score(df)
+    vocab.update({
+        "networks": _top(df["EV_NETWORK"], TOP_NETWORKS),
+        "facility_types": _top(df["FACILITY_TYPE"], TOP_FACILITIES),
+        "states": sorted(df["STATE"].unique().tolist()),
+        "record_counts": sorted(int(v) for v in pd.to_numeric(df["record_count"], errors="coerce").dropna().unique()),
+        "months": list(range(1, 13)),
+        "seasons": sorted(set(SEASONS.values())),
+        "demand_q25": float(score.quantile(0.25)),
+        "demand_q75": float(score.quantile(0.75)),
+        "growth_medians": growth.groupby(df["STATE"]).median().dropna().to_dict(),
+        "growth_overall": float(growth.median()),
+    })
+    return vocab
+
+def save_vocab(vocab, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(vocab, indent=1))
+    return path
+
+def load_vocab(path):
+    return json.loads(Path(path).read_text())
+
+def _by_state(df, per_state, overall):
+    # per-row value of a {state: value} table, overall where the state has none
+    return df["STATE"].map(per_state).astype("float64").fillna(overall)
+
+def _impute(df, vocab):
+    # every imputed column takes the frozen median of its state (one grouped median at fit time);
+    # load features the vocabulary was fitted with are added when a batch lacks them
+    for c in vocab["impute_medians"]:
+        if c not in df.columns:
+            df[c] = np.nan
+        df[c] = df[c].fillna(_by_state(df, vocab["impute_medians"][c], vocab["impute_overall"][c]))
+    return df
+
+def _one_hot(values, vocab, prefix, fmt = str):
+    # fixed column per vocabulary entry; values outside it are all zeros
+    codes = pd.Index(vocab).get_indexer(pd.Index(values))
+    block = np.zeros((len(values), len(vocab)), dtype=np.uint8)
+    known = codes >= 0
+    block[np.flatnonzero(known), codes[known]] = 1
+    return {f"{prefix}_{fmt(v)}": block[:, j] for j, v in enumerate(vocab)}
+
+def engineer_features(base, vocab):
+    # base rows (station_month_base columns) -> feature table with the vocabulary's fixed columns
+    df = _impute(_clean_rows(base), vocab)
+    idx = df.index
+    cols = {}
+
+    cols.update(dict(zip([f"CTYPE_{c}" for c in CONNECTOR_CATEGORIES], connector_flags(df["EV_CONNECTOR_TYPES"]).T)))
+
+    network = df["EV_NETWORK"].where(df["EV_NETWORK"].isin(vocab["networks"]), "Other")
+    cols.update(_one_hot(network, sorted(set(vocab["networks"]) | {"Other"}), "EV_NETWORK"))
+
+    cols.update(pricing_flags(df["EV_PRICING"]))
+
+    # one column per generated name: types differing only by space / hyphen (or an "Other" type) share it
+    facility = df["FACILITY_TYPE"].where(df["FACILITY_TYPE"].isin(vocab["facility_types"]), "Other")
+    suffix = {v: _facility_column(v)[len("FACILITY_TYPE_"):] for v in set(vocab["facility_types"]) | {"Other"}}
+    cols.update(_one_hot(facility.map(suffix), sorted(set(suffix.values())), "FACILITY_TYPE"))
+
+    season = df["Month"].map(SEASONS)
+    cols.update(_one_hot(df["STATE"], vocab["states"], "STATE"))
+    cols.update(_one_hot(pd.to_numeric(df["record_count"], errors="coerce"), vocab["record_counts"], "record_count"))
+    cols.update(_one_hot(season, vocab["seasons"], "season"))
+    cols.update(_one_hot(df["Month"], [float(m) for m in vocab["months"]], "Month"))
+
+    ev = df["ELECTRIC_VEHICLE_REG_COUNT"]
+    penetration = ev / df["POPULATION"]
+    growth = _by_state(df, vocab["growth_medians"], vocab["growth_overall"])
+    infra = df["NUM_PORTS"] / ev * 1000
+    score = _demand_score(df)
+    cols.update({
+        "EV_PENETRATION": penetration,
+        "EV_GROWTH_RATE": growth,
+        "EV_PER_STATION": ev / df["NUM_PORTS"],
+        "EV_INFRASTRUCTURE_INDEX": infra,
+        "LOG_EV_REG": np.log1p(ev),
+        "ADOPTION_DEMAND_SCORE": 0.5 * penetration.fillna(0) + 0.3 * growth.fillna(0) + 0.2 * (1 / (1 + infra.fillna(0))),
+        "sessions_per_port": score,
+        "avg_charge_time": df["CHARGE_DURATION"] / df["TOTAL_SESSIONS"],
+        "demand_score": score,
+        "high_demand": (score >= vocab["demand_q75"]).to_numpy(dtype=np.uint8),
+        "low_demand": (score <= vocab["demand_q25"]).to_numpy(dtype=np.uint8),
+    })
+
+    # LOAD_* columns follow the vocabulary, so batches get the training columns either way
+    raw = df[[c for c in BASE_COLUMNS + vocab.get("load_features", []) if c in df.columns]].copy()
+    raw["season"] = season
+    for c in ["STATION_NAME", "CITY", "EV_CONNECTOR_TYPES", "EV_PRICING", "FACILITY_TYPE", "EV_NETWORK", "STATE_NAME",
+              "STATE", "season"]:
+        if c in raw.columns:
+            raw[c] = raw[c].astype("category")
+    derived = pd.DataFrame({k: np.asarray(v) for k, v in cols.items()}, index=idx)
+    out = pd.concat([raw, derived], axis=1).reset_index(drop=True)
+    if out.columns.duplicated().any():
+        raise ValueError(f"Duplicated feature columns: {out.columns[out.columns.duplicated()].tolist()}")
+    return out
+
+def build_feature_table(afs, state_month, regs, vocab_path = None, load = None):
+    # build-stage entry point: fits and freezes the vocabulary on first use, reuses it afterwards
+    base = station_month_base(afs, state_month, regs, load)
+    if vocab_path is not None and Path(vocab_path).exists():
+        vocab = load_vocab(vocab_path)
+    else:
+        vocab = fit_feature_vocab(base)
+        if vocab_path is not None:
+            print(f"Feature vocabulary frozen {save_vocab(vocab, vocab_path)}")
+    features = engineer_features(base, vocab)
+    print(f"features: {len(base):,} station-month rows -> {features.shape[0]:,} x {features.shape[1]}")
+    return features
+
+def main():
+    p = argparse.ArgumentParser(description="Engineer features for new station-month rows with a frozen vocabulary.")
+    p.add_argument("--base", required=True, help="station_month_base-shaped rows (.csv, .feather or .parquet)")
+    p.add_argument("--vocab", required=True, help="Frozen vocabulary JSON written by the data build")
+    p.add_argument("--out", required=True, help="Feature table (.csv, .feather or .parquet)")
+    args = p.parse_args()
+    features = engineer_features(load_frame(args.base), load_vocab(args.vocab))
+    out = Path(args.out)
+    fmt = next((f for f, suffix in FORMATS.items() if out.suffix.lower() == suffix), "csv")
+    print(f"File Saved {save_frame(features, out, fmt=fmt)} ({features.shape[0]:,} x {features.shape[1]})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from .geo_index import to_radians
+from .schema import compact_frame, COUNTY_MONTH_SCHEMA
+
+# County FIPS enrichment for the AFS stations, replacing the notebook's point-by-point
+# reverse_geocoder calls and rounded-latitude city fixes.
+#
+# build_fips_lookup reads the shipped ZIP -> county crosswalk, the FIPS reference table and the
+# county census snapshot once into one compact ZIP-keyed frame (cached as a build stage).
+# enrich_stations attaches county FIPS / name and county census columns to every station with a
+# dense ZIP-indexed array lookup; stations whose ZIP is missing or unknown fall back to the
+# nearest county centroid. No county geometry ships with the repo, so centroids are the mean
+# location of each county's ZIP-matched stations. merge_county_month is the county-month level.
+
+ZIP_SPACE = 100_000
+FIPS_SOURCES = ["zip", "nearest_centroid"]
+MISSING_STATES = {"", "NAN", "NONE", "NULL"}
+
+def zip_codes(s):
+    # 5-digit ZIPs as float (NaN when unusable): "02134", "02134-1234", 2134 and 2134.0 all give 2134
+    digits = s.astype("string").str.strip().str.extract(r"^(\d{1,5})(?:\.0+)?(?:-\d{4})?$", expand=False)
+    return pd.to_numeric(digits, errors="coerce").astype("float64")
+
+def _county_census(path):
+    # county population / median income; ACS reports suppressed medians as large negative sentinels
+    df = pd.read_csv(path, usecols=["population", "median_income", "county_fips"], dtype={"county_fips": str})
+    df["county_fips"] = pd.to_numeric(df["county_fips"], errors="coerce")
+    df = df.dropna(subset=["county_fips"]).drop_duplicates("county_fips")
+    return pd.DataFrame({
+        "county_fips": df["county_fips"].astype("int32"),
+        "county_population": df["population"].astype("float64"),
+        "county_median_income": df["median_income"].where(df["median_income"] > 0).astype("float64"),
+    })
+
+def build_fips_lookup(paths):
+    # one row per ZIP: zip, county_fips, state, county_name and (when the snapshot is there) county census columns.
+    # ZIPs that straddle counties keep the crosswalk's first county.
+    z = pd.read_csv(paths.zip_county_csv, dtype=str, usecols=["ZIP", "COUNTYNAME", "STATE", "STCOUNTYFP"])
+    z["zip"] = zip_codes(z["ZIP"])
+    z["county_fips"] = pd.to_numeric(z["STCOUNTYFP"], errors="coerce")
+    z = z.dropna(subset=["zip", "county_fips"]).drop_duplicates("zip", keep="first")
+    lookup = pd.DataFrame({
+        "zip": z["zip"].astype("int32").to_numpy(),
+        "county_fips": z["county_fips"].astype("int32").to_numpy(),
+        "state": z["STATE"].str.upper().to_numpy(),
+        "county_name": z["COUNTYNAME"].str.upper().str.replace(r"\s+(COUNTY|PARISH|BOROUGH|CENSUS AREA)$", "", regex=True).to_numpy(),
+    })
+
+    # the reference table's county names take precedence over the crosswalk's
+    if paths.fips_ref_csv.exists():
+        ref = pd.read_csv(paths.fips_ref_csv, dtype=str, usecols=["County Name", "State Code", "StCnty FIPS Code"])
+        ref["county_fips"] = pd.to_numeric(ref["StCnty FIPS Code"], errors="coerce")
+        ref = ref.dropna(subset=["county_fips"]).drop_duplicates("county_fips")
+        names = pd.Series(ref["County Name"].str.upper().to_numpy(), index=ref["county_fips"].astype("int32").to_numpy())
+        lookup["county_name"] = lookup["county_fips"].map(names).fillna(lookup["county_name"])
+
+    if paths.census_snapshot_csv.exists():
+        lookup = lookup.merge(_county_census(paths.census_snapshot_csv), on="county_fips", how="left")
+    return compact_frame(lookup, {"categorical": ["state", "county_name"]}, name="fips_lookup")
+
+def _nearest_centroid_rows(lat, lon, counties, matched_rows, station_lat, station_lon):
+    # lookup row (one per county) of the nearest county centroid for each (lat, lon)
+    located = np.isfinite(station_lat) & np.isfinite(station_lon) & (matched_rows >= 0)
+    if not located.any():
+        return np.full(len(lat), -1, dtype=np.int64)
+    fips = counties["county_fips"].to_numpy()[matched_rows[located]]
+    cent = (pd.DataFrame({"fips": fips, "lat": station_lat[located], "lon": station_lon[located]})
+              .groupby("fips", sort=True)[["lat", "lon"]].mean())
+    tree = BallTree(to_radians(cent["lat"], cent["lon"]), metric="haversine")
+    _, idx = tree.query(to_radians(lat, lon), k=1)
+    county_row = pd.Series(np.arange(len(counties)), index=counties["county_fips"].to_numpy())
+    return county_row.reindex(cent.index[idx[:, 0]]).to_numpy()
+
+def enrich_stations(afs, lookup):
+    # afs + county_fips, county_name, county census columns and fips_source ("zip" / "nearest_centroid");
+    # stations with neither a known ZIP nor coordinates keep them missing. Missing states are
+    # filled from the matched county.
+    counties = lookup.drop_duplicates("county_fips").reset_index(drop=True)
+    by_zip = np.full(ZIP_SPACE, -1, dtype=np.int64)
+    by_zip[lookup["zip"].to_numpy()] = pd.Index(counties["county_fips"]).get_indexer(lookup["county_fips"])
+
+    z = zip_codes(afs["zip"]).to_numpy() if "zip" in afs.columns else np.full(len(afs), np.nan)
+    ok = np.isfinite(z) & (z >= 0) & (z < ZIP_SPACE)
+    rows = np.full(len(afs), -1, dtype=np.int64)
+    rows[ok] = by_zip[z[ok].astype(np.int64)]
+    source = np.where(rows >= 0, 0, -1)
+
+    lat = pd.to_numeric(afs["latitude"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    lon = pd.to_numeric(afs["longitude"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    fallback = (rows < 0) & np.isfinite(lat) & np.isfinite(lon)
+    if fallback.any():
+        rows[fallback] = _nearest_centroid_rows(lat[fallback], lon[fallback], counties, rows, lat, lon)
+        source[fallback & (rows >= 0)] = 1
+
+    out = afs.copy(deep=False)
+    hit = rows >= 0
+    take = counties.iloc[np.where(hit, rows, 0)].set_axis(out.index)
+    take = take.mask(np.broadcast_to(~hit[:, None], take.shape))
+    out["county_fips"] = take["county_fips"].astype("Int32")
+    for c in take.columns.drop(["zip", "county_fips", "state"]):
+        out[c] = take[c]
+    out["fips_source"] = pd.Categorical.from_codes(source, categories=FIPS_SOURCES)
+
+    state = out["state"].astype("string").str.strip().str.upper()
+    fill = state.isna().to_numpy() | state.isin(MISSING_STATES).to_numpy()
+    fill &= hit
+    if fill.any():
+        state = state.mask(fill, take["state"].astype("string"))
+        out["state"] = state.astype("category")
+    print(f"fips: {int((source == 0).sum()):,} stations by ZIP, {int((source == 1).sum()):,} by nearest county centroid, "
+          f"{int((~hit).sum()):,} unmatched; {int(fill.sum()):,} states filled")
+    return out
+
+def merge_county_month(state_month, afs):
+    # one row per (county, Year, Month): county station supply and census next to its state's monthly
+    # demand. EV WATTS sessions only carry a state, so the state's sums are apportioned to counties
+    # by each county's share of the state's L2 + DCFC ports.
+    stations = afs.dropna(subset=["county_fips"])
+    ports = stations[["ev_level2_evse_num", "ev_dc_fast_num"]].fillna(0).astype("float64")
+    supply = (
+        stations.assign(_ports=ports.sum(axis=1), _l2=ports["ev_level2_evse_num"], _dcfc=ports["ev_dc_fast_num"])
+                .groupby(["state", "county_fips"], as_index=False, observed=True)
+                .agg(county_name=("county_name", "first"), num_stations=("id", "count"),
+                     total_l2=("_l2", "sum"), total_dcfc=("_dcfc", "sum"), _ports=("_ports", "sum"),
+                     **{c: (c, "first") for c in ["county_population", "county_median_income"] if c in stations.columns})
+    )
+    state_ports = supply.groupby("state", observed=True)["_ports"].transform("sum")
+    supply["port_share"] = (supply["_ports"] / state_ports).where(state_ports > 0, 0.0)
+    supply = supply.drop(columns="_ports")
+
+    merged = state_month.merge(supply, on="state", how="inner")
+    for c in ["sessions", "energy_kwh_sum", "demand_score_sum"]:
+        if c in merged.columns:
+            merged[f"{c}_est"] = merged[c] * merged["port_share"]
+    if "county_population" in merged.columns:
+        merged["stations_per_100k"] = merged["num_stations"] / merged["county_population"] * 1e5
+    return compact_frame(merged, COUNTY_MONTH_SCHEMA)
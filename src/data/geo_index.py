@@ -0,0 +1,249 @@
+import argparse
+import time
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import BallTree
+
+from .artifact_store import load_frame, save_frame, FORMATS
+
+# Geospatial index over the cleaned AFS stations (load_clean_afs keeps latitude/longitude).
+#
+# One haversine BallTree per station kind (every station, stations with L2 ports, stations with
+# DC fast ports) is built once from the stations artifact and persisted with joblib next to it;
+# queries take arrays of points and run as one batched tree query, so e.g. ports within 25 miles
+# of every county centroid or the DCFC coverage of a corridor is a single call.
+#
+#   python -m src.data.geo_index build    --data-dir data
+#   python -m src.data.geo_index within   --points county_centroids.csv --miles 25 --out ports_25mi.csv
+#   python -m src.data.geo_index nearest  --points sites.csv --k 5 --kind dcfc --out nearest.csv
+#   python -m src.data.geo_index corridor --points i80.csv --kind dcfc --max-miles 50 --out i80_gaps.csv
+#   python -m src.data.geo_index cluster  --eps-miles 1 --min-samples 5 --out station_geo_clusters.csv
+#
+# --points files need latitude/longitude columns (any case); other columns are carried to the output.
+
+EARTH_RADIUS_MILES = 3958.8
+PORT_COLS = ["ev_level1_evse_num", "ev_level2_evse_num", "ev_dc_fast_num"]
+STATION_KINDS = {"all": None, "l2": "ev_level2_evse_num", "dcfc": "ev_dc_fast_num"}
+ID_COLS = ["id", "station_name", "city", "state", "zip"]
+
+def to_radians(lat, lon):
+    # (n, 2) [lat, lon] in radians, the layout sklearn's haversine metric expects
+    return np.radians(np.column_stack([np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")]))
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+class StationGeoIndex:
+    def __init__(self, stations, leaf_size = 40):
+        # stations: cleaned AFS frame; rows without usable coordinates are left out of the index
+        lat = pd.to_numeric(stations["latitude"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        lon = pd.to_numeric(stations["longitude"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        ok = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        keep = [c for c in ID_COLS if c in stations.columns]
+        self.stations = stations.loc[ok, keep].reset_index(drop=True)
+        self.stations["latitude"], self.stations["longitude"] = lat[ok], lon[ok]
+        # port counts as float32 sums; missing counts are 0 as in the notebooks
+        self.ports = np.column_stack([
+            pd.to_numeric(stations[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[ok]
+            if c in stations.columns else np.zeros(ok.sum())
+            for c in PORT_COLS
+        ])
+        self.ports = np.nan_to_num(self.ports).astype("float32")
+        self.coords = to_radians(lat[ok], lon[ok])
+        self.dropped = int((~ok).sum())
+        self.trees = {}
+        for kind, col in STATION_KINDS.items():
+            rows = np.arange(len(self.coords)) if col is None else np.flatnonzero(self.ports[:, PORT_COLS.index(col)] > 0)
+            self.trees[kind] = (rows, BallTree(self.coords[rows], leaf_size=leaf_size, metric="haversine"))
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _tree(self, kind):
+        if kind not in self.trees:
+            raise ValueError(f"Unknown station kind '{kind}', expected one of {list(STATION_KINDS)}")
+        return self.trees[kind]
+
+    def save(self, path):
+        # uncompressed so load_index can memory-map the arrays
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    def within(self, lat, lon, miles, kind = "all", sort = False):
+        # station rows (into .stations) within `miles` of each query point, one array per point
+        rows, tree = self._tree(kind)
+        hits = tree.query_radius(to_radians(lat, lon), r=miles / EARTH_RADIUS_MILES, sort_results=sort,
+                                 return_distance=sort)
+        if sort:
+            return [rows[h] for h in hits[0]], [d * EARTH_RADIUS_MILES for d in hits[1]]
+        return [rows[h] for h in hits]
+
+    def ports_within(self, lat, lon, miles, kind = "all"):
+        # one row per query point: stations and L1 / L2 / DCFC ports within `miles`
+        hits = self.within(lat, lon, miles, kind=kind)
+        counts = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+        flat = np.concatenate(hits) if len(hits) else np.empty(0, dtype=np.int64)
+        point = np.repeat(np.arange(len(hits)), counts)
+        out = pd.DataFrame({"stations": counts})
+        for j, c in enumerate(PORT_COLS):
+            out[c] = np.bincount(point, weights=self.ports[flat, j], minlength=len(hits)).astype("int64")
+        return out
+
+    def nearest(self, lat, lon, k = 1, kind = "all"):
+        # (miles, station rows), both (n_points, k), nearest first
+        rows, tree = self._tree(kind)
+        k = min(k, len(rows))
+        if k == 0:
+            raise ValueError(f"No '{kind}' stations in the index")
+        dist, idx = tree.query(to_radians(lat, lon), k=k)
+        return dist * EARTH_RADIUS_MILES, rows[idx]
+
+    def corridor_gaps(self, lat, lon, step_miles = 1.0, max_miles = 50.0, kind = "dcfc"):
+        # walks the polyline through (lat, lon) every step_miles; a gap is a run of consecutive
+        # samples farther than max_miles from the nearest `kind` station.
+        # returns (samples with mile marker and nearest distance, one row per gap)
+        plat, plon, mile = densify_path(lat, lon, step_miles)
+        dist, near = self.nearest(plat, plon, k=1, kind=kind)
+        samples = pd.DataFrame({"mile": mile, "latitude": plat, "longitude": plon,
+                                "nearest_miles": dist[:, 0], "nearest_row": near[:, 0]})
+        if "id" in self.stations.columns:
+            samples["nearest_id"] = self.stations["id"].to_numpy()[near[:, 0]]
+        uncovered = samples["nearest_miles"].to_numpy() > max_miles
+        run = np.diff(np.concatenate([[0], uncovered.astype(np.int8), [0]]))
+        starts, ends = np.flatnonzero(run == 1), np.flatnonzero(run == -1) - 1
+        gaps = pd.DataFrame({
+            "start_mile": mile[starts], "end_mile": mile[ends], "length_miles": mile[ends] - mile[starts],
+            "start_latitude": plat[starts], "start_longitude": plon[starts],
+            "end_latitude": plat[ends], "end_longitude": plon[ends],
+            "max_nearest_miles": [samples["nearest_miles"].iloc[s:e + 1].max() for s, e in zip(starts, ends)],
+        })
+        return samples, gaps
+
+    def dbscan(self, eps_miles = 1.0, min_samples = 5, kind = "all"):
+        # density clusters of station locations (-1 = noise), one label per indexed station.
+        # Stations sharing a coordinate are fitted once with a sample weight: core points and noise
+        # are the same as fitting every row while the tree only sees distinct points.
+        rows, _ = self._tree(kind)
+        uniq, inverse, counts = np.unique(self.coords[rows], axis=0, return_inverse=True, return_counts=True)
+        model = DBSCAN(eps=eps_miles / EARTH_RADIUS_MILES, min_samples=min_samples, metric="haversine",
+                       algorithm="ball_tree")
+        labels = np.full(len(self), -1, dtype=np.int32)
+        labels[rows] = model.fit_predict(uniq, sample_weight=counts)[inverse.ravel()]
+        return labels
+
+def densify_path(lat, lon, step_miles = 1.0):
+    # points every ~step_miles along the polyline (vertices kept), with their cumulative mile marker;
+    # segments are interpolated linearly in lat/lon, which is close enough at corridor-vertex spacing
+    lat, lon = np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")
+    if len(lat) < 2:
+        return lat, lon, np.zeros(len(lat))
+    seg = haversine_miles(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    n = np.maximum(1, np.ceil(seg / step_miles).astype(int))
+    seg_id = np.repeat(np.arange(len(seg)), n)
+    frac = np.concatenate([np.arange(m) / m for m in n])
+    plat = np.append(lat[seg_id] + frac * (lat[seg_id + 1] - lat[seg_id]), lat[-1])
+    plon = np.append(lon[seg_id] + frac * (lon[seg_id + 1] - lon[seg_id]), lon[-1])
+    start = np.concatenate([[0], np.cumsum(seg)])
+    mile = np.append(start[seg_id] + frac * seg[seg_id], start[-1])
+    return plat, plon, mile
+
+def build_index(stations_path, index_path, leaf_size = 40):
+    df = load_frame(stations_path)
+    index = StationGeoIndex(df, leaf_size=leaf_size)
+    index.save(index_path)
+    return index
+
+def load_index(path):
+    return joblib.load(path, mmap_mode="r")
+
+def read_points(path):
+    # query points with latitude/longitude columns in any case (LATITUDE, Latitude, lat, ...)
+    df = load_frame(path)
+    lower = {c.lower(): c for c in df.columns}
+    lat = next((lower[c] for c in ("latitude", "lat") if c in lower), None)
+    lon = next((lower[c] for c in ("longitude", "lon", "lng") if c in lower), None)
+    if lat is None or lon is None:
+        raise ValueError(f"{path} needs latitude and longitude columns, found {list(df.columns)}")
+    return df, df[lat].to_numpy(dtype="float64"), df[lon].to_numpy(dtype="float64")
+
+def parse_args():
+    from .data_config import build_paths
+    p = argparse.ArgumentParser(description="Build or query the station geospatial index.")
+    p.add_argument("--data-dir", default="data", help="Base data directory")
+    p.add_argument("--format", default="feather", choices=sorted(FORMATS), help="Storage format of the stations artifact")
+    p.add_argument("--index", default=None, help="Index file (default: interim/afs_station_geo_index.joblib)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build", help="Build the index from the cleaned stations artifact")
+
+    w = sub.add_parser("within", help="Stations and ports within --miles of each point")
+    w.add_argument("--miles", type=float, default=25.0)
+    n = sub.add_parser("nearest", help="k nearest stations of each point")
+    n.add_argument("--k", type=int, default=5)
+    c = sub.add_parser("corridor", help="Coverage gaps along the polyline through --points (in file order)")
+    c.add_argument("--step-miles", type=float, default=1.0)
+    c.add_argument("--max-miles", type=float, default=50.0, help="Samples farther than this from a station are a gap")
+    for q in (w, n, c):
+        q.add_argument("--points", required=True, help="Query points (.csv, .feather or .parquet)")
+        q.add_argument("--kind", choices=list(STATION_KINDS), default="dcfc" if q is c else "all")
+    d = sub.add_parser("cluster", help="DBSCAN over station locations")
+    d.add_argument("--eps-miles", type=float, default=1.0)
+    d.add_argument("--min-samples", type=int, default=5)
+    d.add_argument("--kind", choices=list(STATION_KINDS), default="all")
+    for q in (w, n, c, d):
+        q.add_argument("--out", required=True, help="Output file (.csv, .feather or .parquet)")
+    args = p.parse_args()
+    paths = build_paths(args.data_dir, artifact_format=args.format)
+    args.stations = paths.artifact(paths.stations_clean_csv)
+    args.index = Path(args.index) if args.index else paths.station_geo_index
+    return args
+
+def _write(df, out):
+    out = Path(out)
+    fmt = next((f for f, suffix in FORMATS.items() if out.suffix.lower() == suffix), "csv")
+    path = save_frame(df, out, fmt=fmt)
+    print(f"File Saved {path} ({len(df):,} rows)")
+
+def main():
+    args = parse_args()
+    t0 = time.perf_counter()
+    if args.cmd == "build":
+        index = build_index(args.stations, args.index)
+        print(f"Indexed {len(index):,} stations ({index.dropped:,} without coordinates) "
+              f"in {time.perf_counter() - t0:.2f}s -> {args.index}")
+        return
+    if not args.index.exists():
+        raise FileNotFoundError(f"{args.index} not found; run `python -m src.data.geo_index build` first")
+    index = load_index(args.index)
+    t1 = time.perf_counter()
+    if args.cmd == "cluster":
+        out = index.stations.copy()
+        out["geo_cluster"] = index.dbscan(args.eps_miles, args.min_samples, kind=args.kind)
+        n_clusters = out["geo_cluster"].max() + 1
+        print(f"{n_clusters:,} clusters, {(out['geo_cluster'] == -1).sum():,} noise stations")
+    else:
+        points, lat, lon = read_points(args.points)
+        if args.cmd == "within":
+            out = pd.concat([points.reset_index(drop=True), index.ports_within(lat, lon, args.miles, kind=args.kind)], axis=1)
+        elif args.cmd == "nearest":
+            dist, rows = index.nearest(lat, lon, k=args.k, kind=args.kind)
+            out = points.iloc[np.repeat(np.arange(len(points)), dist.shape[1])].reset_index(drop=True)
+            near = index.stations.iloc[rows.ravel()].add_prefix("station_").reset_index(drop=True)
+            out = pd.concat([out, near], axis=1)
+            out["rank"] = np.tile(np.arange(1, dist.shape[1] + 1), len(points))
+            out["miles"] = dist.ravel()
+        else:
+            samples, out = index.corridor_gaps(lat, lon, step_miles=args.step_miles, max_miles=args.max_miles, kind=args.kind)
+            print(f"{len(samples):,} samples over {samples['mile'].iloc[-1]:,.1f} miles, {len(out)} gap(s) "
+                  f"over {args.max_miles:g} miles from a '{args.kind}' station")
+    print(f"Query: {time.perf_counter() - t1:.3f}s (index load {t1 - t0:.3f}s)")
+    _write(out, args.out)
+
+if __name__ == "__main__":
+    main()
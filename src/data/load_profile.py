@@ -0,0 +1,292 @@
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .artifact_store import iter_frame, save_frame, FORMATS
+from .data_utils import parse_datetimes
+from .schema import compact_frame, LOAD_PROFILE_SCHEMA
+
+# Hourly / 15-minute occupancy and load profiles from the cleaned session intervals.
+#
+# A session is plugged in over [start_datetime, end_datetime) and draws energy_kwh at a constant
+# rate over its first charge_duration hours. Per group (EVSE, state or state x venue) and time
+# bucket the engine reports
+#
+#   sessions_started    sessions starting in the bucket
+#   mean_concurrent     time-averaged sessions plugged in (plugged hours / bucket hours)
+#   peak_concurrent     most sessions plugged in at any instant of the bucket
+#   energy_kwh, avg_kw  energy delivered in the bucket and its average power
+#
+# Everything is vectorized: each session is expanded to the buckets it overlaps with np.repeat
+# and summed with bincount, and peak concurrency comes from one sweep line (+1 / -1 events
+# sorted by group and time, cumulative sum). Bucket sums add across chunks, so sessions are read
+# chunk by chunk; only the compact event arrays are kept until the final sweep.
+#
+# summarize_months gives the per group-month peaks, load factor and load-duration percentiles
+# (state level feeds feature_stage); load_duration_curve the full curve per group.
+#
+#   python -m src.data.load_profile --sessions data/interim/evsessions_clean.feather --level evse --bucket-minutes 15 --out results/load_profile
+
+LOAD_LEVELS = {"evse": ["evse_id"], "state": ["state"], "venue": ["state", "venue"]}
+BUCKET_MINUTES = [15, 60]
+# fractions of the period a load is exceeded, for summarize_months' kw_pXX columns
+SUMMARY_EXCEEDANCE = [0.01, 0.05, 0.10, 0.50]
+LDC_POINTS = [0.0, 0.01, 0.02, 0.05, 0.10, 0.20, 0.30, 0.40, 0.50, 0.60, 0.70, 0.80, 0.90, 1.0]
+SESSION_COLUMNS = ["start_datetime", "end_datetime", "total_duration", "charge_duration", "energy_kwh"]
+
+# ---------- session intervals ----------
+
+def session_intervals(ev):
+    # (start, plug end, charge end) in epoch seconds and the charging power in kW, plus the mask of
+    # usable rows. end_datetime wins; start + total_duration fills it when missing or before start.
+    # Sessions without a charge_duration charge over the whole plug-in.
+    start = parse_datetimes(ev["start_datetime"]).to_numpy(dtype="datetime64[ns]")
+    total = pd.to_numeric(ev["total_duration"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    by_total = start + pd.to_timedelta(total, unit="h").to_numpy(dtype="timedelta64[ns]")
+    if "end_datetime" in ev.columns:
+        end = parse_datetimes(ev["end_datetime"]).to_numpy(dtype="datetime64[ns]")
+        end = np.where(np.isnat(end) | (end < start), by_total, end)
+    else:
+        end = by_total
+    ok = ~np.isnat(start) & ~np.isnat(end) & (end >= start)
+
+    s = start[ok].astype("datetime64[s]").astype(np.int64)
+    e = end[ok].astype("datetime64[s]").astype(np.int64)
+    charge = pd.to_numeric(ev["charge_duration"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[ok] * 3600
+    charge = np.where(np.isfinite(charge) & (charge > 0), np.minimum(charge, e - s), e - s)
+    c = s + np.round(charge).astype(np.int64)
+    energy = pd.to_numeric(ev["energy_kwh"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[ok]
+    energy = np.where(np.isfinite(energy) & (energy > 0), energy, 0.0)
+    kw = np.divide(energy * 3600, c - s, out=np.zeros_like(energy), where=c > s)
+    return s, e, c, kw, ok
+
+# ---------- accumulator ----------
+
+class _GroupCodes:
+    # stable integer code per group key across chunks
+    def __init__(self, cols):
+        self.cols = cols
+        self.keys = None
+
+    def encode(self, df):
+        local, uniques = pd.factorize(pd.MultiIndex.from_frame(df[self.cols].astype(object)))
+        if self.keys is None:
+            self.keys = uniques
+        else:
+            new = uniques[self.keys.get_indexer(uniques) < 0]
+            if len(new):
+                self.keys = self.keys.append(new)
+        return self.keys.get_indexer(uniques)[local].astype(np.int64)
+
+    def frame(self, codes):
+        return self.keys[codes].to_frame(index=False, name=self.cols)
+
+def _reduce(keys, *values):
+    # sum values per distinct key (keys come back sorted)
+    uniq, inv = np.unique(keys, return_inverse=True)
+    return uniq, [np.bincount(inv, weights=v, minlength=len(uniq)) for v in values]
+
+class LoadProfileBuilder:
+    # add() cleaned session chunks, finish() -> one row per (group, bucket) with at least one session plugged in
+    def __init__(self, level = "state", bucket_minutes = 60):
+        if level not in LOAD_LEVELS:
+            raise ValueError(f"level must be one of {sorted(LOAD_LEVELS)}")
+        self.level = level
+        self.cols = LOAD_LEVELS[level]
+        self.bucket = int(bucket_minutes) * 60
+        self.codes = _GroupCodes(self.cols)
+        self.parts = []
+        self.events = []
+        self.rows = 0
+        self.dropped = 0
+
+    def add(self, ev):
+        keyed = ev[self.cols].notna().all(axis=1).to_numpy()
+        s, e, c, kw, ok = session_intervals(ev)
+        usable = keyed[ok]
+        s, e, c, kw = s[usable], e[usable], c[usable], kw[usable]
+        self.rows += len(s)
+        self.dropped += len(ev) - len(s)
+        if not len(s):
+            return self
+        g = self.codes.encode(ev[ok & keyed])
+        B = self.bucket
+
+        # every (session, bucket) overlap; zero-length sessions touch their start bucket
+        b0 = s // B
+        n = np.maximum(e - 1, s) // B - b0 + 1
+        rep = np.repeat(np.arange(len(s)), n)
+        b = b0[rep] + np.arange(len(rep)) - np.repeat(np.cumsum(n) - n, n)
+        lo = b * B
+        plugged = np.minimum(e[rep], lo + B) - np.maximum(s[rep], lo)
+        charged = np.clip(np.minimum(c[rep], lo + B) - np.maximum(s[rep], lo), 0, None)
+        keys, sums = _reduce((g[rep] << 32) | b, plugged.astype("float64"), charged * kw[rep] / 3600,
+                             (b == b0[rep]).astype("float64"))
+        self.parts.append((keys, sums))
+
+        # sweep-line events; ends sort before starts at the same instant, so back-to-back sessions do not overlap
+        busy = e > s
+        self.events.append((np.concatenate([g[busy], g[busy]]).astype(np.int32),
+                            np.concatenate([s[busy], e[busy]]),
+                            np.concatenate([np.ones(busy.sum(), np.int8), -np.ones(busy.sum(), np.int8)])))
+        # fold bucket sums as we go so memory follows the distinct (group, bucket) count, not the sessions
+        if len(self.parts) > 1:
+            self.parts = [self._combined()]
+        return self
+
+    def _combined(self):
+        keys = np.concatenate([k for k, _ in self.parts])
+        return _reduce(keys, *[np.concatenate([v[i] for _, v in self.parts]) for i in range(3)])
+
+    def _peaks(self, keys):
+        # most sessions plugged in at any instant of each (group, bucket) key
+        g = np.concatenate([x[0] for x in self.events]).astype(np.int64)
+        t = np.concatenate([x[1] for x in self.events])
+        d = np.concatenate([x[2] for x in self.events])
+        order = np.lexsort((d, t, g))
+        g, t = g[order], t[order]
+        level = np.cumsum(d[order], dtype=np.int32)
+        if not len(level):
+            return np.zeros(len(keys), dtype=np.int32)
+
+        # level entering each bucket: after every event at or before its start, so a session ending
+        # exactly on the boundary is no longer counted. Every group's events sum to zero, so the
+        # running total is also right across group boundaries.
+        kg, kb = keys >> 32, keys & 0xFFFFFFFF
+        t0 = min(t.min(), kb.min() * self.bucket)
+        span = t.max() - t0 + 1
+        at = np.searchsorted(g * span + (t - t0), kg * span + (kb * self.bucket - t0), side="right")
+        peak = np.where(at > 0, level[np.maximum(at - 1, 0)], 0)
+
+        # highest level inside the bucket, read after the last event of each instant: between the
+        # ends and the starts of one instant the running total is not a level that ever held
+        last = np.r_[(g[1:] != g[:-1]) | (t[1:] != t[:-1]), True]
+        g, t, level = g[last], t[last], level[last]
+        ekey = (g << 32) | (t // self.bucket)
+        first = np.flatnonzero(np.r_[True, ekey[1:] != ekey[:-1]])
+        inside = np.maximum.reduceat(level, first)
+        pos = np.searchsorted(keys, ekey[first])
+        hit = pos < len(keys)
+        hit[hit] = keys[pos[hit]] == ekey[first][hit]
+        peak[pos[hit]] = np.maximum(peak[pos[hit]], inside[hit])
+        return peak
+
+    def finish(self):
+        if not self.parts:
+            out = pd.DataFrame(columns=self.cols + ["bucket_start", "sessions_started", "mean_concurrent",
+                                                    "peak_concurrent", "energy_kwh", "avg_kw"])
+            return out
+        keys, (plugged, energy, started) = self._combined()
+        hours = self.bucket / 3600
+        out = self.codes.frame(keys >> 32)
+        out["bucket_start"] = ((keys & 0xFFFFFFFF) * self.bucket).astype("datetime64[s]").astype("datetime64[ns]")
+        out["sessions_started"] = started.astype(np.int64)
+        out["mean_concurrent"] = plugged / self.bucket
+        out["peak_concurrent"] = self._peaks(keys)
+        out["energy_kwh"] = energy
+        out["avg_kw"] = energy / hours
+        print(f"load profile ({self.level}, {self.bucket // 60} min): {self.rows:,} sessions -> {len(out):,} group-buckets "
+              f"over {len(self.codes.keys):,} groups; {self.dropped:,} sessions without a usable interval or key")
+        return compact_frame(out, LOAD_PROFILE_SCHEMA)
+
+def build_load_profile(chunks, level = "state", bucket_minutes = 60):
+    builder = LoadProfileBuilder(level, bucket_minutes)
+    for chunk in chunks:
+        builder.add(chunk)
+    return builder.finish()
+
+def load_profile_frame(ev, level = "state", bucket_minutes = 60, chunk_rows = 250_000):
+    # build stage over an in-memory sessions frame, in chunk_rows slices to bound the expansion
+    return build_load_profile((ev.iloc[i:i + chunk_rows] for i in range(0, len(ev), chunk_rows)), level, bucket_minutes)
+
+def load_profile_artifact(path, level = "state", bucket_minutes = 60, chunk_rows = 250_000, state_month = None):
+    # build stage over the persisted sessions artifact (--stream); state_month only orders the stage
+    # after stream_clean_evwatts has written it
+    cols = SESSION_COLUMNS + [c for c in LOAD_LEVELS[level] if c not in SESSION_COLUMNS]
+    return build_load_profile(iter_frame(path, chunk_rows, columns=cols), level, bucket_minutes)
+
+# ---------- summaries ----------
+
+def _exceedance(values, groups, n_buckets, qs):
+    # (len(qs), groups) array: per group, the value exceeded during a q share of its n_buckets
+    # buckets; buckets missing from values (nothing plugged in) count as zero load
+    G = len(n_buckets)
+    order = np.lexsort((-values, groups))
+    v, g = values[order], groups[order]
+    first = np.searchsorted(g, np.arange(G))
+    nnz = np.bincount(g, minlength=G)
+    out = np.zeros((len(qs), G))
+    for i, q in enumerate(qs):
+        rank = np.minimum(np.floor(q * n_buckets).astype(np.int64), np.maximum(n_buckets - 1, 0))
+        take = rank < nnz
+        out[i, take] = v[first[take] + rank[take]]
+    return out
+
+def _group_ids(df, cols):
+    return df.groupby(cols, observed=True, sort=True).ngroup().to_numpy()
+
+def summarize_months(profile, bucket_minutes = 60):
+    # one row per (group, Year, Month): sessions, energy, peak / mean concurrency and power, load
+    # factor, busy share and the kW exceeded SUMMARY_EXCEEDANCE of the calendar month
+    cols = [c for c in profile.columns if c in {c for v in LOAD_LEVELS.values() for c in v}]
+    df = profile.assign(Year=profile["bucket_start"].dt.year.astype("int64"),
+                        Month=profile["bucket_start"].dt.month.astype("int64"))
+    keys = cols + ["Year", "Month"]
+    out = (df.groupby(keys, as_index=False, observed=True, sort=True)
+             .agg(sessions=("sessions_started", "sum"), energy_kwh=("energy_kwh", "sum"),
+                  plugged_buckets=("mean_concurrent", "sum"), busy_buckets=("avg_kw", "size"),
+                  peak_concurrent=("peak_concurrent", "max"), peak_kw=("avg_kw", "max")))
+    hours = pd.to_datetime(dict(year=out["Year"], month=out["Month"], day=1)).dt.days_in_month.to_numpy() * 24
+    n_buckets = (hours * 60 // bucket_minutes).astype(np.int64)
+    out["mean_concurrent"] = out.pop("plugged_buckets") / n_buckets
+    out["busy_share"] = out.pop("busy_buckets") / n_buckets
+    out["mean_kw"] = out["energy_kwh"] / hours
+    out["load_factor"] = (out["mean_kw"] / out["peak_kw"]).where(out["peak_kw"] > 0)
+    gid = _group_ids(df, keys)
+    kw = df["avg_kw"].to_numpy(dtype="float64")
+    for q, col in zip(SUMMARY_EXCEEDANCE, _exceedance(kw, gid, n_buckets, SUMMARY_EXCEEDANCE)):
+        out[f"kw_p{round(q * 100):02d}"] = col
+    return compact_frame(out, LOAD_PROFILE_SCHEMA)
+
+def load_duration_curve(profile, bucket_minutes = 60, points = LDC_POINTS):
+    # per group: kW and concurrency exceeded during each share of the hours between its first and
+    # last bucket (the sorted load-duration curve, sampled)
+    cols = [c for c in profile.columns if c in {c for v in LOAD_LEVELS.values() for c in v}]
+    span = profile.groupby(cols, observed=True, sort=True)["bucket_start"].agg(["min", "max"]).reset_index()
+    n_buckets = ((span["max"] - span["min"]) // pd.Timedelta(minutes=bucket_minutes)).to_numpy(dtype=np.int64) + 1
+    gid = _group_ids(profile, cols)
+    kw = _exceedance(profile["avg_kw"].to_numpy(dtype="float64"), gid, n_buckets, points)
+    conc = _exceedance(profile["peak_concurrent"].to_numpy(dtype="float64"), gid, n_buckets, points)
+    parts = []
+    for i, q in enumerate(points):
+        part = span[cols].copy()
+        part["exceedance"] = q
+        part["hours"] = n_buckets * bucket_minutes / 60
+        part["kw"] = kw[i]
+        part["concurrent"] = conc[i]
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True).sort_values(cols + ["exceedance"], kind="stable", ignore_index=True)
+
+def main():
+    p = argparse.ArgumentParser(description="Occupancy and load profiles from cleaned EV WATTS sessions.")
+    p.add_argument("--sessions", default="data/interim/evsessions_clean.feather", help="Cleaned sessions (.csv, .feather or .parquet)")
+    p.add_argument("--level", choices=sorted(LOAD_LEVELS), default="state")
+    p.add_argument("--bucket-minutes", type=int, choices=BUCKET_MINUTES, default=60)
+    p.add_argument("--chunk-rows", type=int, default=250_000)
+    p.add_argument("--format", choices=sorted(FORMATS), default="feather", help="Format of the profile table")
+    p.add_argument("--out", default="results/load_profile", help="Output dir")
+    args = p.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    profile = load_profile_artifact(args.sessions, args.level, args.bucket_minutes, args.chunk_rows)
+    tag = f"{args.level}_{args.bucket_minutes}min"
+    print(f"File Saved {save_frame(profile, out / f'{tag}_profile', fmt=args.format)}")
+    summary = summarize_months(profile, args.bucket_minutes)
+    summary.to_csv(out / f"{tag}_monthly.csv", index=False)
+    load_duration_curve(profile, args.bucket_minutes).to_csv(out / f"{tag}_ldc.csv", index=False)
+    print(f"File Saved {out / f'{tag}_monthly.csv'} ({len(summary):,} group-months), {out / f'{tag}_ldc.csv'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 import os
 import argparse
+from functools import partial
 from dotenv import load_dotenv
 from pathlib import Path
 
-from data_config import build_paths
-from merge_pipeline import load_clean_afs, load_clean_evwatts, load_clean_afdc_regs, merge_station_month
+from src.instrumentation import RunRecorder
+from .data_config import build_paths
+from .artifact_store import save_frame, FORMATS
+from .build_cache import Stage, StageCache, run_stages, plan_stages
+from .geo_index import StationGeoIndex
+from .fips_enrich import build_fips_lookup, enrich_stations, merge_county_month
+from .feature_stage import build_feature_table
+from .load_profile import BUCKET_MINUTES, load_profile_frame, load_profile_artifact, summarize_months
+from .census_api import get_census_provider, CENSUS_SOURCES
+from .merge_pipeline import ( EVWATTS_LAYOUTS, load_clean_afs, load_clean_evwatts, stream_clean_evwatts, load_clean_afdc_regs, load_census,
+                              aggregate_state_month, merge_state_month )
 
 def parse_args():
     p = argparse.ArgumentParser(
@@ -12,42 +22,143 @@ def parse_args():
     )
     p.add_argument("--data-dir", default="data", help="Base data directory")
     p.add_argument("--evwatts", default=None, help="Override EV WATTS CSV path")
+    p.add_argument("--evwatts-layout", default="flat", choices=EVWATTS_LAYOUTS,
+                   help="flat: one pre-flattened sessions CSV; normalized: public session/evse/connector tables")
     p.add_argument("--afs", default=None, help="Override AFS stations CSV path")
     p.add_argument("--regs", default=None, help="Override AFDC registrations CSV path")
     p.add_argument("--fips", default=None, help="Override FIPS reference CSV path (optional)")
+    p.add_argument("--zip-county", default=None, help="Override ZIP -> county FIPS crosswalk CSV path (county stages are skipped without it)")
+    p.add_argument("--stream", action="store_true", help="Stream EV WATTS sessions in chunks instead of loading them whole")
+    p.add_argument("--chunk-rows", type=int, default=250_000, help="Rows per EV WATTS chunk in --stream mode")
+    p.add_argument("--load-bucket-minutes", type=int, default=60, choices=BUCKET_MINUTES,
+                   help="Bucket width of the state occupancy / load profile")
+    p.add_argument("--format", default="feather", choices=sorted(FORMATS), help="Storage format for interim/processed artifacts")
+    p.add_argument("--export-csv", action="store_true", help="Also write a CSV copy of every artifact")
+    p.add_argument("--force", action="store_true", help="Rebuild every stage, ignoring the stage cache")
+    p.add_argument("--dry-run", action="store_true", help="Show which stages are stale without running them")
+    p.add_argument("--census", default="snapshot", choices=CENSUS_SOURCES,
+                   help="Census source: shipped county snapshot (offline), live API, or API behind a TTL disk cache")
+    p.add_argument("--census-ttl-hours", type=float, default=24 * 7, help="TTL for --census cached-api")
+    p.add_argument("--report-dir", default="results/run_reports", help="Where the JSON run report is written")
+    p.add_argument("--profile", action="store_true", help="Also dump cProfile output per stage next to the run report")
     return p.parse_args()
 
+def build_stages(paths, census_provider, stream = False, chunk_rows = 250_000, layout = "flat", load_bucket_minutes = 60):
+    if layout == "normalized":
+        ev_inputs = [paths.evwatts_session_csv, paths.evwatts_evse_csv, paths.evwatts_connector_csv]
+    else:
+        ev_inputs = [paths.evwatts_sessions_csv]
+    stages = [
+        Stage("afs", partial(load_clean_afs, paths), inputs=[paths.afs_stations_csv]),
+    ]
+    if stream:
+        # sessions are written to interim chunk by chunk; only the state-month sums are cached
+        stages.append(Stage("state_month", partial(stream_clean_evwatts, paths, chunk_rows, layout),
+                            inputs=ev_inputs, params={"mode": "stream", "format": paths.artifact_format, "layout": layout}))
+    else:
+        stages += [
+            Stage("sessions", partial(load_clean_evwatts, paths, layout), inputs=ev_inputs, params={"layout": layout}),
+            Stage("state_month", aggregate_state_month, deps={"ev": "sessions"}),
+        ]
+    # state occupancy / load profile; in --stream mode it re-reads the sessions artifact in chunks
+    load_params = {"level": "state", "bucket_minutes": load_bucket_minutes}
+    if stream:
+        stages.append(Stage("load_profile", partial(load_profile_artifact, paths.artifact(paths.sessions_clean_csv), "state",
+                                                    load_bucket_minutes, chunk_rows),
+                            deps={"state_month": "state_month"}, params={**load_params, "mode": "stream"}))
+    else:
+        stages.append(Stage("load_profile", partial(load_profile_frame, level="state", bucket_minutes=load_bucket_minutes,
+                                                    chunk_rows=chunk_rows),
+                            deps={"ev": "sessions"}, params=load_params))
+    stages.append(Stage("state_load", partial(summarize_months, bucket_minutes=load_bucket_minutes),
+                        deps={"profile": "load_profile"}, params=load_params))
+    stages += [
+        Stage("regs", partial(load_clean_afdc_regs, paths), inputs=[paths.afdc_regs_csv]),
+        Stage("census", partial(load_census, provider=census_provider),
+              inputs=census_provider.input_files(),
+              params={"source": census_provider.cache_token()}),
+        Stage("merged", merge_state_month,
+              deps={"state_month": "state_month", "afs": "afs", "regs": "regs", "census": "census"}),
+    ]
+    if paths.zip_county_csv.exists():
+        lookup_inputs = [p for p in [paths.zip_county_csv, paths.fips_ref_csv, paths.census_snapshot_csv] if p.exists()]
+        stages += [
+            Stage("fips_lookup", partial(build_fips_lookup, paths), inputs=lookup_inputs),
+            Stage("afs_fips", enrich_stations, deps={"afs": "afs", "lookup": "fips_lookup"}),
+            Stage("county_month", merge_county_month, deps={"state_month": "state_month", "afs": "afs_fips"}),
+            # the vocabulary file is written on the first run and frozen after; deleting it refits.
+            # It is always a key input ("missing" until written); see main for the re-keying after the first run
+            Stage("features", partial(build_feature_table, vocab_path=paths.feature_vocab_json),
+                  deps={"afs": "afs_fips", "state_month": "state_month", "regs": "regs", "load": "state_load"},
+                  inputs=[paths.feature_vocab_json]),
+        ]
+    else:
+        print(f"No ZIP -> county crosswalk at {paths.zip_county_csv}; skipping the county stages")
+    return stages
+
 def main():
     print("Data building started...")
     load_dotenv()
     args = parse_args()
-    paths = build_paths(args.data_dir)
+    paths = build_paths(args.data_dir, artifact_format=args.format, export_csv=args.export_csv)
 
-    if args.evwatts: paths.evwatts_sessions_csv = Path(args.evwatts)
+    if args.evwatts and args.evwatts_layout == "normalized":
+        paths.evwatts_session_csv = Path(args.evwatts)
+    elif args.evwatts:
+        paths.evwatts_sessions_csv = Path(args.evwatts)
     if args.afs:     paths.afs_stations_csv    = Path(args.afs)
     if args.regs:    paths.afdc_regs_csv       = Path(args.regs)
     if args.fips:    paths.fips_ref_csv        = Path(args.fips)
+    if args.zip_county: paths.zip_county_csv   = Path(args.zip_county)
 
-    print("Loading Alternative Fueling Stations...")
-    afs = load_clean_afs(paths)
-    afs.to_csv(paths.stations_clean_csv, index=False)
-    print(f"File Saved {paths.stations_clean_csv}")
-
-    print("Loading EV WATTS sessions...")
-    ev = load_clean_evwatts(paths)
-    ev.to_csv(paths.sessions_clean_csv, index=False)
-    print(f"File Saved {paths.sessions_clean_csv}")
+    census = get_census_provider(args.census, paths, api_key=os.getenv("CENSUS_API_KEY"),
+                                 ttl_seconds=args.census_ttl_hours * 3600)
+    stages = build_stages(paths, census, stream=args.stream, chunk_rows=args.chunk_rows, layout=args.evwatts_layout,
+                          load_bucket_minutes=args.load_bucket_minutes)
+    cache = StageCache(paths.stage_cache)
+    recorder = RunRecorder("data_build", profile_dir=Path(args.report_dir) / "profiles" if args.profile else None)
+    vocab_existed = paths.feature_vocab_json.exists()
+    outputs, ran = run_stages(stages, cache, force=args.force, dry_run=args.dry_run, recorder=recorder)
+    if "features" in ran and not vocab_existed and paths.feature_vocab_json.exists():
+        # the stage just froze the vocabulary, which the next build hashes into its key: file the output
+        # under that key too, so the second build is fully cached
+        key = next(key for s, key, _ in plan_stages(stages, cache) if s.name == "features")
+        cache.save("features", key, outputs["features"])
+    if args.dry_run:
+        print(f"Dry run: {len(ran)} of {len(stages)} stages would run.")
+        return
 
-    print("Loading AFDC vehicle registrations...")
-    regs = load_clean_afdc_regs(paths)
+    # publish stage outputs that changed (or whose artifact is missing)
+    publish = {
+        "afs": paths.stations_clean_csv,
+        "sessions": paths.sessions_clean_csv,
+        "merged": paths.state_month_agg_csv,
+        "afs_fips": paths.stations_fips_csv,
+        "county_month": paths.county_month_agg_csv,
+        "load_profile": paths.state_load_profile_csv,
+        "state_load": paths.state_month_load_csv,
+        "features": paths.final_features_csv,
+    }
+    for name, target in publish.items():
+        if name not in {s.name for s in stages}:
+            continue
+        if name not in ran and paths.artifact(target).exists():
+            continue
+        df = outputs[name] if name in outputs else cache.latest(name)
+        with recorder.stage(f"save_{name}", rows_in=len(df)):
+            out = save_frame(df, target, paths.artifact_format, export_csv=paths.export_csv)
+        print(f"File Saved {out}")
 
-    print("Merging to state-month layer with demographics...")
-    api_key = os.getenv("CENSUS_API_KEY")
-    merged = merge_station_month(ev, afs, regs, api_key=api_key)
-    merged.to_csv(paths.state_month_agg_csv, index=False)
-    print(f"File Saved {paths.state_month_agg_csv}")
+    # station geo index follows the published stations (see geo_index)
+    if "afs" in ran or not paths.station_geo_index.exists():
+        df = outputs["afs"] if "afs" in outputs else cache.latest("afs")
+        with recorder.stage("geo_index", rows_in=len(df)):
+            index = StationGeoIndex(df)
+            index.save(paths.station_geo_index)
+        print(f"File Saved {paths.station_geo_index} ({len(index):,} stations)")
 
+    recorder.write_report(args.report_dir)
     print("Data build complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,8 +3,11 @@ import pandas as pd
 import numpy as np
 from typing import Tuple
 from .data_config import Paths
-from .data_utils import ( add_time_parts, safe_numeric, normalize_state_name, abbr_from_state )
-from .census_api import fetch_state_population_income
+from .artifact_store import FrameWriter
+from .data_utils import ( add_time_parts, month_label, safe_numeric, normalize_state_name, abbr_from_state )
+from .census_api import HttpCensusProvider
+from .schema import compact_frame, AFS_SCHEMA, SESSIONS_SCHEMA, REGS_SCHEMA, STATE_MONTH_SCHEMA
+from .evwatts_tables import load_evwatts_normalized, iter_evwatts_normalized
 #from data_utils import add_time_parts, month_label_nice, abbr_from_state, normalize_state_name, safe_numeric
 
 def load_clean_afs(paths):
@@ -27,25 +30,31 @@ def load_clean_afs(paths):
     df["facility_type"] = df["facility_type"].fillna("UNKNOWN")
     df["ev_pricing"] = df["ev_pricing"].fillna("UNSPECIFIED")
     df = add_time_parts(df, "date_last_confirmed")
-    return df
-
-def load_clean_evwatts(paths):
-    df = pd.read_csv(paths.evwatts_sessions_csv, low_memory=False)
+    return compact_frame(df, AFS_SCHEMA, name="afs")
+
+EVWATTS_RENAME = {
+    "session_id":"session_id","evse_id":"evse_id","start_datetime":"start_datetime",
+    "end_datetime":"end_datetime","total_duration":"total_duration",
+    "charge_duration":"charge_duration","energy_kwh":"energy_kwh",
+    "connector_type":"connector_type","power_kw":"power_kw",
+    "charge_level":"charge_level","pricing":"pricing","region":"region","state":"state",
+    "metro_area":"metro_area","venue":"venue","num_ports":"num_ports",
+    # only present in the normalized release (see evwatts_tables)
+    "connector_id":"connector_id","land_use":"land_use","power_kw_bucket":"power_kw_bucket",
+    "power_kw_min":"power_kw_min","power_kw_max":"power_kw_max"
+}
+EVWATTS_NUMERIC = ["total_duration","charge_duration","energy_kwh","power_kw","num_ports"]
+
+def _evwatts_usecols(col):
+    # only parse the columns we keep; the raw export carries many more
+    return col.strip().lower() in EVWATTS_RENAME
+
+def clean_evwatts_frame(df, report = None):
     df.columns = [c.strip().lower() for c in df.columns]
-    rename_map = {
-        "session_id":"session_id","evse_id":"evse_id","start_datetime":"start_datetime",
-        "end_datetime":"end_datetime","total_duration":"total_duration",
-        "charge_duration":"charge_duration","energy_kwh":"energy_kwh",
-        "connector_type":"connector_type","power_kw":"power_kw",
-        "charge_level":"charge_level","pricing":"pricing","region":"region","state":"state",
-        "metro_area":"metro_area","venue":"venue","num_ports":"num_ports"
-    }
-    
-    keep_cols = {k:v for k,v in rename_map.items() if k in df.columns}
+    keep_cols = {k:v for k,v in EVWATTS_RENAME.items() if k in df.columns}
     df = df[list(keep_cols.keys())].rename(columns=keep_cols)
 
-    numeric_cols = ["total_duration","charge_duration","energy_kwh","power_kw","num_ports"]
-    df = safe_numeric(df, [c for c in numeric_cols if c in df.columns])
+    df = safe_numeric(df, [c for c in EVWATTS_NUMERIC if c in df.columns])
     #df["state"] = df["state"].astype(str).str.upper()
     df["state"] = df["state"].astype(str).str.upper() if "state" in df.columns else np.nan
     df = add_time_parts(df, "start_datetime")
@@ -56,7 +65,25 @@ def load_clean_evwatts(paths):
 
     if "energy_kwh" in df.columns and "charge_duration" in df.columns:
         df["demand_score"] = df["energy_kwh"].fillna(0) + 0.1 * df["charge_duration"].fillna(0)
-    return df
+    return compact_frame(df, SESSIONS_SCHEMA, name=report)
+
+EVWATTS_LAYOUTS = ["flat", "normalized"]
+
+def load_clean_evwatts(paths, layout = "flat"):
+    # layout "flat" reads the pre-flattened sessions CSV, "normalized" joins the public session/evse/connector tables
+    if layout == "normalized":
+        return clean_evwatts_frame(load_evwatts_normalized(paths), report="sessions")
+    df = pd.read_csv(paths.evwatts_sessions_csv, usecols=_evwatts_usecols, low_memory=False)
+    return clean_evwatts_frame(df, report="sessions")
+
+def iter_clean_evwatts(paths, chunk_rows = 250_000, layout = "flat"):
+    # streaming variant of load_clean_evwatts: yields cleaned chunks of at most chunk_rows rows
+    if layout == "normalized":
+        reader = iter_evwatts_normalized(paths, chunk_rows)
+    else:
+        reader = pd.read_csv(paths.evwatts_sessions_csv, usecols=_evwatts_usecols, chunksize=chunk_rows, low_memory=False)
+    for chunk in reader:
+        yield clean_evwatts_frame(chunk)
 
 def load_clean_afdc_regs(paths):
     df = pd.read_csv(paths.afdc_regs_csv, low_memory=False)
@@ -74,47 +101,103 @@ def load_clean_afdc_regs(paths):
     for c in ["electric_vehicle_reg_count","plug_in_hybrid_vehicle_reg_count","hybrid_electric_reg_count","year"]:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
-    return df
+    return compact_frame(df, REGS_SCHEMA, name="regs")
 
-def attach_census(df_state: pd.DataFrame, api_key: str | None) -> pd.DataFrame:
-    census = fetch_state_population_income(api_key)
+def load_census(api_key: str | None = None, provider = None) -> pd.DataFrame:
+    # provider is any census_api.CensusProvider; defaults to the live API
+    provider = provider or HttpCensusProvider(api_key)
+    census = provider.fetch()
     census["STATE_NAME"] = normalize_state_name(census["STATE_NAME"])
     census["state"] = abbr_from_state(census["STATE_NAME"])
-    census = census[["state","STATE_NAME","POPULATION","MEDIAN_INCOME"]]
+    return census[["state","STATE_NAME","POPULATION","MEDIAN_INCOME"]]
+
+def attach_census(df_state: pd.DataFrame, api_key: str | None, census: pd.DataFrame | None = None) -> pd.DataFrame:
+    if census is None:
+        census = load_census(api_key)
     out = df_state.merge(census, on="state", how="left")
     return out
 
 
 
-def aggregate_state_month(ev):
-    cols_present = [c for c in ["state","Year","Month","energy_kwh","charge_duration","total_duration","demand_score"] if c in ev.columns]
-    g = ev[cols_present].groupby(["state","Year","Month"], as_index=False).agg(
-        energy_kwh_sum=("energy_kwh","sum"),
-        charge_duration_sum=("charge_duration","sum"),
-        total_duration_sum=("total_duration","sum"),
+STATE_MONTH_KEYS = ["state","Year","Month"]
+STATE_MONTH_SUMS = ["energy_kwh_sum","charge_duration_sum","total_duration_sum","sessions","demand_score_sum","num_ports_sum"]
+
+# summed session column -> its state-month column; sessions (a row count) is always there
+STATE_MONTH_SUM_OF = {"energy_kwh":"energy_kwh_sum","charge_duration":"charge_duration_sum","total_duration":"total_duration_sum",
+                      "demand_score":"demand_score_sum","num_ports":"num_ports_sum"}
+
+def partial_state_month(ev):
+    # additive (state, Year, Month) partial sums; partials from different chunks combine by summing.
+    # Sums are only taken for the session columns the layout actually has.
+    sums = {out: (c, "sum") for c, out in STATE_MONTH_SUM_OF.items() if c in ev.columns}
+    cols_present = [c for c in STATE_MONTH_KEYS + list(STATE_MONTH_SUM_OF) if c in ev.columns]
+    g = ev[cols_present].groupby(STATE_MONTH_KEYS, as_index=False, observed=True).agg(
         sessions=("state","count"),
-        demand_score_sum=("demand_score","sum"),
+        **sums,
     )
-    g["month_label"] = g.apply(lambda r: f"{int(r['Year'])}-{int(r['Month']):02d}", axis=1)
+    return g[STATE_MONTH_KEYS + [c for c in STATE_MONTH_SUMS if c in g.columns]]
+
+def combine_state_month(parts):
+    parts = [p for p in parts if p is not None]
+    g = pd.concat(parts, ignore_index=True)
+    if len(parts) > 1:
+        g = g.groupby(STATE_MONTH_KEYS, as_index=False, observed=True)[[c for c in STATE_MONTH_SUMS if c in g.columns]].sum()
     return g
 
+def finalize_state_month(g):
+    g = g.copy()
+    g["month_label"] = month_label(g["Year"], g["Month"]).values
+    return g
+
+def aggregate_state_month(ev):
+    return finalize_state_month(partial_state_month(ev))
+
+def aggregate_state_month_stream(chunks, on_chunk = None):
+    # folds partial sums chunk by chunk so only one cleaned chunk is alive at a time
+    acc = None
+    for chunk in chunks:
+        if on_chunk is not None:
+            on_chunk(chunk)
+        acc = combine_state_month([acc, partial_state_month(chunk)])
+    if acc is None:
+        # no chunks (an empty source): an empty, numerically typed table so the merges downstream still work
+        acc = pd.DataFrame({c: pd.Series(dtype="str" if c == "state" else "int64" if c in ["Year","Month","sessions"] else "float64")
+                            for c in STATE_MONTH_KEYS + STATE_MONTH_SUMS})
+    return finalize_state_month(acc)
+
+def stream_clean_evwatts(paths, chunk_rows = 250_000, layout = "flat"):
+    # clean, persist and aggregate sessions one chunk at a time; returns the state-month sums
+    writers = [FrameWriter(paths.sessions_clean_csv, paths.artifact_format)]
+    if paths.export_csv and paths.artifact_format != "csv":
+        writers.append(FrameWriter(paths.sessions_clean_csv, "csv"))
+    def write_chunk(chunk):
+        for w in writers:
+            w.write(chunk)
+    try:
+        return aggregate_state_month_stream(iter_clean_evwatts(paths, chunk_rows, layout), on_chunk=write_chunk)
+    finally:
+        for w in writers:
+            w.close()
+
 def merge_station_month(ev, afs, regs, api_key = None):
     # EV sessions monthly at (state, Year, Month)
     state_month = aggregate_state_month(ev)
+    return merge_state_month(state_month, afs, regs, api_key=api_key)
 
+def merge_state_month(state_month, afs, regs, api_key = None, census = None):
     # station counts by state (from AFS)
     if {"state","ev_level2_evse_num","ev_dc_fast_num"}.issubset(afs.columns):
         station_counts = (
-            afs.groupby("state", as_index=False)
+            afs.groupby("state", as_index=False, observed=True)
                .agg(num_stations=("id","count"),
                     total_l2=("ev_level2_evse_num","sum"),
                     total_dcfc=("ev_dc_fast_num","sum"))
         )
     else:
-        station_counts = afs.groupby("state", as_index=False).agg(num_stations=("id","count"))
+        station_counts = afs.groupby("state", as_index=False, observed=True).agg(num_stations=("id","count"))
 
     # vehicle registrations (state-year)
-    regs_sm = regs.groupby(["state","year"], as_index=False).agg(
+    regs_sm = regs.groupby(["state","year"], as_index=False, observed=True).agg(
         ev_regs=("electric_vehicle_reg_count","sum"),
         phev_regs=("plug_in_hybrid_vehicle_reg_count","sum"),
         hev_regs=("hybrid_electric_reg_count","sum"),
@@ -128,9 +211,9 @@ def merge_station_month(ev, afs, regs, api_key = None):
     merged = merged.merge(station_counts, on="state", how="left")
 
     # add census demographics
-    merged = attach_census(merged, api_key)
+    merged = attach_census(merged, api_key, census=census)
 
     # derived ratios
     merged["adoption_ratio"] = merged["ev_regs"] / merged["POPULATION"]
     merged["infra_balance_ratio"] = merged["num_stations"] / merged["ev_regs"]
-    return merged
\ No newline at end of file
+    return compact_frame(merged, STATE_MONTH_SCHEMA)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Compact in-memory dtypes for the cleaned frames: low-cardinality strings become
+# categoricals, counts/flags the narrowest integer type that holds them (nullable
+# when the column has gaps). An "integer" dict instead declares each column's dtype
+# up front: frames cleaned in chunks need the same dtype in every chunk, so values
+# that do not fit it are set to missing rather than changing the column's type.
+
+AFS_SCHEMA = {
+    "categorical": ["state","city","facility_type","ev_network","ev_pricing","ev_connector_types","access_days_time"],
+    "integer": ["ev_level1_evse_num","ev_level2_evse_num","ev_dc_fast_num"],
+}
+SESSIONS_SCHEMA = {
+    "categorical": ["state","connector_type","charge_level","pricing","region","metro_area","venue","land_use","power_kw_bucket"],
+    # declared, not narrowed: the streaming build cleans sessions chunk by chunk into one artifact
+    "integer": {"num_ports": "UInt16"},
+}
+REGS_SCHEMA = {
+    "categorical": ["state","state_name"],
+    "integer": ["year","electric_vehicle_reg_count","plug_in_hybrid_vehicle_reg_count","hybrid_electric_reg_count"],
+}
+STATE_MONTH_SCHEMA = {
+    "categorical": ["state","STATE_NAME","month_label"],
+    "integer": ["sessions","num_stations","total_l2","total_dcfc","ev_regs","phev_regs","hev_regs"],
+}
+COUNTY_MONTH_SCHEMA = {
+    "categorical": ["state","county_name","STATE_NAME","month_label"],
+    "integer": ["sessions","num_stations","total_l2","total_dcfc"],
+}
+LOAD_PROFILE_SCHEMA = {
+    "categorical": ["state","venue"],
+    "integer": ["sessions_started","peak_concurrent","sessions"],
+}
+
+_INT_TYPES = [(np.uint8, "UInt8"), (np.int8, "Int8"), (np.uint16, "UInt16"), (np.int16, "Int16"),
+              (np.uint32, "UInt32"), (np.int32, "Int32"), (np.int64, "Int64")]
+
+def narrow_integer(s):
+    # smallest (nullable if needed) integer dtype for an integral numeric column; others are returned unchanged
+    vals = pd.to_numeric(s, errors="coerce")
+    arr = vals.to_numpy(dtype="float64", na_value=np.nan)
+    has_na = np.isnan(arr).any()
+    ok = arr[~np.isnan(arr)]
+    if ok.size and not np.array_equal(ok, np.floor(ok)):
+        return s
+    lo, hi = (ok.min(), ok.max()) if ok.size else (0, 0)
+    for np_t, nullable in _INT_TYPES:
+        info = np.iinfo(np_t)
+        if info.min <= lo and hi <= info.max:
+            return vals.astype(nullable) if has_na else vals.astype(np_t)
+    return s
+
+def declared_integer(s, dtype):
+    # s cast to a declared nullable integer dtype; values it cannot hold (fractional, negative for
+    # unsigned, out of range) become missing instead of failing the cast, so the dtype never varies
+    vals = pd.to_numeric(s, errors="coerce")
+    arr = vals.to_numpy(dtype="float64", na_value=np.nan, copy=True)
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    bad = ~np.isnan(arr) & ((arr != np.floor(arr)) | (arr < info.min) | (arr > info.max))
+    if bad.any():
+        print(f"{s.name}: {int(bad.sum()):,} values outside {dtype} set to missing")
+        arr[bad] = np.nan
+    return pd.Series(arr, index=s.index, name=s.name).astype(dtype)
+
+def frame_memory(df):
+    return int(df.memory_usage(deep=True).sum())
+
+def compact_frame(df, schema, name = None):
+    # casts in place on a shallow copy; prints memory before/after when name is given
+    before = frame_memory(df) if name else None
+    out = df.copy(deep=False)
+    for c in schema.get("categorical", []):
+        if c in out.columns and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype("category")
+    integer = schema.get("integer", [])
+    for c in integer:
+        if c in out.columns:
+            out[c] = declared_integer(out[c], integer[c]) if isinstance(integer, dict) else narrow_integer(out[c])
+    if name:
+        after = frame_memory(out)
+        print(f"{name}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / max(after, 1):.1f}x smaller)")
+    return out
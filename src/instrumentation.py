@@ -0,0 +1,150 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-stage run metrics (wall/CPU time, peak RSS, rows in/out) for the data build
+# and training entry points, written as one JSON report per run. With a profile
+# dir every stage is also run under cProfile (.prof dump + top-N text summary).
+# cProfile and the CPU clock only see this process; joblib/loky workers show up
+# in wall time and in children_cpu_s once they have exited.
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE / 1e6
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss_mb():
+    # process high-water mark (ru_maxrss is KB on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / 1e6 if sys.platform == "darwin" else r / 1e3
+
+def children_cpu_s():
+    t = os.times()
+    return t.children_user + t.children_system
+
+class _RssSampler(threading.Thread):
+    # polls RSS so each stage gets its own peak, not the process-lifetime one
+    def __init__(self, interval = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_mb() or 0.0
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            rss = current_rss_mb()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+        rss = current_rss_mb()
+        return max(self.peak, rss or 0.0)
+
+def count_rows(obj):
+    # rows of a frame/array, or of the first element of a tuple result
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    shape = getattr(obj, "shape", None)
+    if shape:
+        return int(shape[0])
+    return None
+
+class RunRecorder:
+    def __init__(self, run_name, profile_dir = None, profile_top = 25):
+        self.run_name = run_name
+        self.started = datetime.now(timezone.utc)
+        stamp = self.started.strftime("%Y%m%dT%H%M%SZ")
+        self.profile_dir = Path(profile_dir) / f"{run_name}_{stamp}" if profile_dir else None
+        self.profile_top = profile_top
+        self.stages = []
+        if self.profile_dir:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, rows_in = None, **extra):
+        # yields the stage record; callers may set rec["rows_out"] or other fields on it
+        rec = {"stage": name, "rows_in": rows_in, "rows_out": None, **extra}
+        sampler = _RssSampler() if current_rss_mb() is not None else None
+        if sampler:
+            sampler.start()
+        prof = cProfile.Profile() if self.profile_dir else None
+        rss0 = current_rss_mb()
+        wall0, cpu0, child0 = time.perf_counter(), time.process_time(), children_cpu_s()
+        if prof:
+            prof.enable()
+        try:
+            yield rec
+        finally:
+            if prof:
+                prof.disable()
+            rec["wall_s"] = round(time.perf_counter() - wall0, 4)
+            rec["cpu_s"] = round(time.process_time() - cpu0, 4)
+            rec["children_cpu_s"] = round(children_cpu_s() - child0, 4)
+            peak = sampler.stop() if sampler else max_rss_mb()
+            rec["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+            rec["rss_start_mb"] = round(rss0, 1) if rss0 is not None else None
+            if prof:
+                rec["profile"] = str(self._dump_profile(prof, name))
+            self.stages.append(rec)
+            print(f"[{name}] {rec['wall_s']:.2f}s wall, {rec['cpu_s']:.2f}s cpu, peak RSS {rec['peak_rss_mb']} MB")
+
+    def track(self, name, func, *args, rows_in = None, **kwargs):
+        # runs func(*args, **kwargs) as a stage and counts its output rows
+        with self.stage(name, rows_in=rows_in, func=getattr(func, "__qualname__", None)) as rec:
+            out = func(*args, **kwargs)
+            rec["rows_out"] = count_rows(out)
+        return out
+
+    def note(self, name, **fields):
+        # records a stage that did not run (e.g. served from cache)
+        self.stages.append({"stage": name, "wall_s": 0.0, **fields})
+
+    def _dump_profile(self, prof, name):
+        stem = self.profile_dir / name.replace(" ", "_").replace("/", "_")
+        prof.dump_stats(str(stem) + ".prof")
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(self.profile_top)
+        Path(str(stem) + ".txt").write_text(buf.getvalue())
+        return str(stem) + ".prof"
+
+    def report(self):
+        return {
+            "run": self.run_name,
+            "started_utc": self.started.isoformat(),
+            "argv": sys.argv,
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 4),
+            "max_rss_mb": max_rss_mb(),
+            "stages": self.stages,
+        }
+
+    def write_report(self, out_dir):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{self.run_name}_{self.started.strftime('%Y%m%dT%H%M%SZ')}.json"
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        print(f"Run report saved {path}")
+        return path
@@ -0,0 +1,233 @@
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer, make_column_selector
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+# Multi-horizon state-month demand forecasting on the state_month_agg table.
+#
+# monthly_panel completes every state's month grid (months without sessions are 0) and sorts it by
+# (state, month), so every grouped shift / rolling window below is an index offset into one array
+# masked at the state boundaries: no per-state loops. forecast_rows stacks each origin month with
+# the horizons 1..H ("direct" pooled strategy: one model, horizon is a feature), so a forecast for
+# every state and horizon is a single predict call, and a rolling-origin backtest is "train on the
+# rows whose target month is <= origin, predict the origin's rows". Origins are independent and
+# run in parallel on one joblib pool.
+#
+# Targets and lag features are modelled on log1p; forecasts are clipped at 0. Baselines: naive
+# (last observed month) and seasonal naive (same month a year earlier).
+
+LAGS = [1, 2, 3, 6, 12]
+ROLL_WINDOWS = [3, 6, 12]
+MAX_HORIZON = 12
+# state-level columns of state_month_agg used as they stood at the origin month
+EXOG_COLS = ["ev_regs", "phev_regs", "num_stations", "total_l2", "total_dcfc", "POPULATION", "MEDIAN_INCOME"]
+BASELINES = ["naive", "seasonal_naive"]
+
+def get_forecast_models():
+    return {
+        # splits the state natively; lags are already on log scale
+        "hgb": HistGradientBoostingRegressor(max_iter=300, learning_rate=0.05, max_leaf_nodes=31, l2_regularization=1.0,
+                                             categorical_features="from_dtype", random_state=42),
+        "ridge": Pipeline(steps=[
+            ("prep", ColumnTransformer([
+                ("state", OneHotEncoder(handle_unknown="ignore"), ["state"]),
+                ("num", Pipeline([("impute", SimpleImputer(strategy="median")), ("scale", StandardScaler())]),
+                 make_column_selector(dtype_include="number")),
+            ])),
+            ("model", Ridge(alpha=1.0, random_state=42)),
+        ]),
+    }
+
+# ---------- panel and features ----------
+
+def month_index(year, month):
+    return pd.to_numeric(year).astype("int64").to_numpy() * 12 + pd.to_numeric(month).astype("int64").to_numpy() - 1
+
+def monthly_panel(state_month, targets):
+    # one row per (state, month) from the state's first month to the table's last, sorted by both.
+    # Targets are 0 in months without sessions; exogenous columns carry their last known value.
+    sm = state_month.assign(state=state_month["state"].astype("string"))
+    sm = sm[sm["state"].notna()]
+    t = month_index(sm["Year"], sm["Month"])
+    states = np.sort(sm["state"].unique())
+    code = np.searchsorted(states, sm["state"].to_numpy())
+    first = np.full(len(states), t.max())
+    np.minimum.at(first, code, t)
+    last = t.max()
+    n = last - first + 1
+    offset = np.r_[0, np.cumsum(n)[:-1]]
+
+    rows = int(n.sum())
+    g = np.repeat(np.arange(len(states)), n)
+    pos = np.arange(rows) - offset[g]
+    panel = pd.DataFrame({"state": pd.Categorical.from_codes(g, categories=states), "t": first[g] + pos})
+    at = offset[code] + (t - first[code])
+    for c in targets:
+        vals = np.zeros(rows)
+        vals[at] = pd.to_numeric(sm[c], errors="coerce").fillna(0).to_numpy(dtype="float64")
+        panel[c] = vals
+    exog = [c for c in EXOG_COLS if c in sm.columns]
+    for c in exog:
+        vals = np.full(rows, np.nan)
+        vals[at] = pd.to_numeric(sm[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        panel[c] = vals
+    if exog:
+        panel[exog] = panel.groupby("state", observed=True)[exog].ffill()
+    panel["Year"], panel["Month"] = panel["t"] // 12, panel["t"] % 12 + 1
+    return panel
+
+def _group_pos(panel):
+    # position of every panel row within its state
+    g = panel["state"].cat.codes.to_numpy()
+    new = np.r_[True, g[1:] != g[:-1]]
+    start = np.flatnonzero(new)
+    return np.arange(len(g)) - start[np.cumsum(new) - 1]
+
+def grouped_shift(values, pos, k):
+    # values[i - k] within the same state, NaN before the state's k-th month
+    out = np.full(len(values), np.nan)
+    ok = pos >= k
+    out[ok] = values[np.flatnonzero(ok) - k]
+    return out
+
+def grouped_rolling(values, pos, w):
+    # (mean, std) of the last w values up to and including each row, within its state (shorter at the start).
+    # Window sums are differences of one cumulative sum; values are centred on their state's mean first
+    # so the sum of squares does not cancel catastrophically.
+    g = np.cumsum(pos == 0) - 1
+    centre = (np.bincount(g, weights=values) / np.bincount(g))[g]
+    x = values - centre
+    c1 = np.r_[0.0, np.cumsum(x)]
+    c2 = np.r_[0.0, np.cumsum(x * x)]
+    i = np.arange(len(values))
+    lo = i - np.minimum(pos, w - 1)
+    cnt = i + 1 - lo
+    mean = (c1[i + 1] - c1[lo]) / cnt
+    var = np.maximum((c2[i + 1] - c2[lo]) / cnt - mean * mean, 0.0)
+    return mean + centre, np.sqrt(var)
+
+def origin_features(panel, target):
+    # features of every panel row as a forecast origin (the last observed month)
+    pos = _group_pos(panel)
+    y = np.log1p(np.maximum(panel[target].to_numpy(dtype="float64"), 0))
+    feats = {"state": panel["state"], "trend": (panel["t"] - panel["t"].min()).to_numpy(dtype="float64")}
+    for k in LAGS:
+        feats[f"lag_{k}"] = grouped_shift(y, pos, k - 1)
+    for w in ROLL_WINDOWS:
+        mean, std = grouped_rolling(y, pos, w)
+        feats[f"roll_mean_{w}"], feats[f"roll_std_{w}"] = mean, std
+    feats["diff_12"] = feats["lag_1"] - grouped_shift(y, pos, 12)
+    for c in [c for c in EXOG_COLS if c in panel.columns]:
+        feats[c] = np.log1p(np.maximum(panel[c].to_numpy(dtype="float64"), 0))
+    return pd.DataFrame(feats)
+
+def forecast_rows(panel, target, origins_mask = None, horizon = MAX_HORIZON):
+    # origin rows x horizons 1..horizon stacked: (X, y_log, index frame). y is NaN past the panel's end.
+    # index has state, origin t, horizon, target t and the naive / seasonal naive forecasts.
+    pos = _group_pos(panel)
+    feats = origin_features(panel, target)
+    n_rows = np.diff(np.r_[np.flatnonzero(pos == 0), len(panel)])
+    group_len = np.repeat(n_rows, n_rows)
+    rows = np.flatnonzero(origins_mask) if origins_mask is not None else np.arange(len(panel))
+    rep = np.repeat(rows, horizon)
+    h = np.tile(np.arange(1, horizon + 1), len(rows))
+
+    y = panel[target].to_numpy(dtype="float64")
+    has_y = pos[rep] + h < group_len[rep]
+    y_log = np.full(len(rep), np.nan)
+    y_log[has_y] = np.log1p(np.maximum(y[rep[has_y] + h[has_y]], 0))
+    # same calendar month a year before the target: inside the observed history for h <= 12
+    back = h - 12
+    seasonal = np.full(len(rep), np.nan)
+    ok = (back <= 0) & (pos[rep] + back >= 0)
+    seasonal[ok] = y[rep[ok] + back[ok]]
+
+    t = panel["t"].to_numpy()
+    target_t = t[rep] + h
+    X = feats.iloc[rep].reset_index(drop=True)
+    X.insert(1, "horizon", h.astype("float64"))
+    X["month_sin"] = np.sin(2 * np.pi * (target_t % 12) / 12)
+    X["month_cos"] = np.cos(2 * np.pi * (target_t % 12) / 12)
+    index = pd.DataFrame({"state": panel["state"].to_numpy()[rep], "origin_t": t[rep], "horizon": h, "target_t": target_t,
+                          "naive": y[rep], "seasonal_naive": seasonal})
+    return X, y_log, index
+
+# ---------- fit / predict ----------
+
+def _predict(model, X):
+    return np.maximum(np.expm1(model.predict(X)), 0)
+
+def fit_forecaster(model, X, y_log):
+    known = np.isfinite(y_log)
+    return clone(model).fit(X[known], y_log[known])
+
+def _backtest_origin(key, model, X, y_log, index, origin_t, min_train_months):
+    # one rolling origin: fit on targets observed by origin_t, forecast origin_t's rows
+    train = (index["target_t"].to_numpy() <= origin_t) & np.isfinite(y_log)
+    test = (index["origin_t"].to_numpy() == origin_t) & np.isfinite(y_log)
+    if not test.any() or index["target_t"].to_numpy()[train].size == 0 or \
+            np.unique(index["target_t"].to_numpy()[train]).size < min_train_months:
+        return key, origin_t, None, {}
+    t0 = time.perf_counter()
+    fitted = clone(model).fit(X[train], y_log[train])
+    fit_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pred = _predict(fitted, X[test])
+    predict_s = time.perf_counter() - t0
+    out = index[test].reset_index(drop=True)
+    out["actual"] = np.expm1(y_log[test])
+    out["forecast"] = pred
+    return key, origin_t, out, {"n_train": int(train.sum()), "fit_seconds": round(fit_s, 4), "predict_seconds": round(predict_s, 4)}
+
+def backtest_origins(panel, n_origins = 12, step = 1):
+    # the n_origins latest origins (step months apart) that leave at least one month to score
+    last = int(panel["t"].max())
+    return [last - 1 - i * step for i in range(n_origins)][::-1]
+
+def run_backtests(jobs, origins, n_jobs = -1, min_train_months = 24):
+    # jobs: {(target, family): (model, X, y_log, index)}. Every (job, origin) fit goes to one pool.
+    # Returns {(target, family): (predictions, per-origin timings)}
+    units = [delayed(_backtest_origin)(key, model, X, y_log, index, o, min_train_months)
+             for key, (model, X, y_log, index) in jobs.items() for o in origins]
+    done = Parallel(n_jobs=n_jobs, batch_size=1, verbose=5)(units)
+    out = {key: ([], []) for key in jobs}
+    for key, origin_t, preds, timing in done:
+        if preds is None:
+            continue
+        out[key][0].append(preds)
+        out[key][1].append({"origin_t": origin_t, **timing})
+    return {key: (pd.concat(p, ignore_index=True) if p else None, pd.DataFrame(tm)) for key, (p, tm) in out.items()}
+
+def forecast_errors(df, by, forecast_cols = None):
+    # MAE / RMSE / WAPE / bias of each forecast column against actual, per `by` group
+    forecast_cols = forecast_cols or ["forecast"] + BASELINES
+    frames = []
+    for col in forecast_cols:
+        d = df.dropna(subset=[col])
+        err = d[col] - d["actual"]
+        g = pd.DataFrame({"abs": err.abs(), "sq": err * err, "err": err, "actual": d["actual"].abs(),
+                          **{b: d[b] for b in by}}).groupby(by)
+        s = g.sum(numeric_only=True)
+        n = g.size()
+        frames.append(pd.DataFrame({"method": col, "n": n, "mae": s["abs"] / n, "rmse": np.sqrt(s["sq"] / n),
+                                    "wape": s["abs"] / s["actual"].where(s["actual"] > 0), "bias": s["err"] / n}).reset_index())
+    return pd.concat(frames, ignore_index=True)
+
+def forecast_latest(model, panel, target, horizon = MAX_HORIZON):
+    # every state's 1..horizon month forecasts from the panel's last month, one predict call
+    last = panel["t"].to_numpy() == panel["t"].max()
+    X, _, index = forecast_rows(panel, target, origins_mask=last, horizon=horizon)
+    t0 = time.perf_counter()
+    pred = _predict(model, X)
+    seconds = time.perf_counter() - t0
+    out = pd.DataFrame({"state": index["state"], "Year": index["target_t"] // 12, "Month": index["target_t"] % 12 + 1,
+                        "horizon": index["horizon"], "forecast": pred, "naive": index["naive"],
+                        "seasonal_naive": index["seasonal_naive"]})
+    return out, seconds
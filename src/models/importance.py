@@ -0,0 +1,177 @@
+import copy
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import r2_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+# Feature importance for fitted prep+model pipelines.
+#
+# "permutation": the rows passed in (train_supervised passes its training split) are preprocessed once and the baseline prediction is computed once;
+# each feature group is then permuted directly in the model's input matrix (every preprocessing step
+# here is column-wise, so this equals permuting the raw column) and only the model step predicts.
+# Groups are scored in parallel on a row subsample, with the model's own n_jobs set to 1 meanwhile. A raw categorical column is permuted as its whole
+# one-hot block; the one-hot families already in the feature table (STATE_*, EV_NETWORK_*, ...) are
+# grouped by prefix so a block is permuted together rather than one indicator at a time.
+# "native": the model's own feature_importances_ (trees) or |coef| x column std (linear), summed per
+# group; no predictions at all.
+#
+# Importance is the drop in R^2 (the pipeline's default score), reported one row per group.
+
+IMPORTANCE_MODES = ["permutation", "native"]
+
+# one-hot families in the final feature table, matched longest prefix first
+ONE_HOT_PREFIXES = ["STATE_", "EV_NETWORK_", "FACILITY_TYPE_", "Month_", "season_", "CTYPE_", "PRICE_", "record_count_"]
+
+def importance_groups(columns, indicator_cols = None):
+    # {group name: [input columns]}; indicator columns sharing a one-hot prefix form one group, the rest stand alone
+    indicator_cols = set(columns if indicator_cols is None else indicator_cols)
+    prefixes = sorted(ONE_HOT_PREFIXES, key=len, reverse=True)
+    groups = {}
+    for c in columns:
+        prefix = next((p for p in prefixes if str(c).startswith(p)), None) if c in indicator_cols else None
+        groups.setdefault(f"{prefix}*" if prefix else str(c), []).append(c)
+    return groups
+
+def _column_transformer(prep):
+    if isinstance(prep, ColumnTransformer):
+        return prep
+    if isinstance(prep, Pipeline) and isinstance(prep.steps[0][1], ColumnTransformer):
+        # the other steps of the project preprocessors are one-to-one casts
+        return prep.steps[0][1]
+    return None
+
+def output_sources(prep, n_out):
+    # input column behind each output column of a fitted preprocessor
+    ct = _column_transformer(prep)
+    if ct is None:
+        return None
+    src = [None] * n_out
+    for name, trans, cols in ct.transformers_:
+        if name == "remainder" or trans == "drop":
+            continue
+        sl = ct.output_indices_[name]
+        cols = list(cols)
+        if isinstance(trans, OneHotEncoder):
+            sizes = [len(c) for c in trans.categories_]
+            if trans.drop_idx_ is not None:
+                sizes = [s - (d is not None) for s, d in zip(sizes, trans.drop_idx_)]
+            out = [c for c, s in zip(cols, sizes) for _ in range(s)]
+        else:
+            out = cols
+        if len(out) != sl.stop - sl.start:
+            return None
+        src[sl] = out
+    return src
+
+def _split(fitted_pipeline):
+    steps = fitted_pipeline.steps
+    prep = steps[0][1] if len(steps) > 1 else None
+    model = Pipeline(steps[1:]) if len(steps) > 2 else steps[-1][1]
+    return prep, model
+
+def _subsample(X, y, max_rows, random_state):
+    if max_rows and len(X) > max_rows:
+        rows = np.random.default_rng(random_state).choice(len(X), size=max_rows, replace=False)
+        rows.sort()
+        return X.iloc[rows], y.iloc[rows]
+    return X, y
+
+def _permute(M, idx, perm):
+    # M with the columns in idx shuffled row-wise by perm (the same shuffle for the whole group)
+    if isinstance(M, pd.DataFrame):
+        out = M.copy(deep=False)
+        for j in idx:
+            out.isetitem(j, M.iloc[:, j].take(perm).set_axis(M.index))
+        return out
+    if sparse.issparse(M):
+        mask = np.zeros(M.shape[1])
+        mask[idx] = 1.0
+        block = M @ sparse.diags(mask)
+        return (M - block + block[perm]).tocsr()
+    out = M.copy()
+    out[:, idx] = M[np.ix_(perm, idx)]
+    return out
+
+def _single_threaded(model):
+    # a forest predicting with n_jobs=-1 inside every group worker oversubscribes the cores; the
+    # copy shares the fitted trees, so the caller's pipeline keeps its own n_jobs
+    est = model.steps[-1][1] if isinstance(model, Pipeline) else model
+    if getattr(est, "n_jobs", None) in (None, 1):
+        return model
+    est = copy.copy(est)
+    est.n_jobs = 1
+    return Pipeline(model.steps[:-1] + [(model.steps[-1][0], est)]) if isinstance(model, Pipeline) else est
+
+def _group_drop(model, M, y, idx, base_score, n_repeats, seed):
+    rng = np.random.default_rng(seed)
+    drops = np.empty(n_repeats)
+    for r in range(n_repeats):
+        drops[r] = base_score - r2_score(y, model.predict(_permute(M, idx, rng.permutation(M.shape[0]))))
+    return drops
+
+def _group_indices(groups, sources):
+    pos = {}
+    for j, c in enumerate(sources):
+        pos.setdefault(c, []).append(j)
+    return {g: [j for c in cols for j in pos.get(c, [])] for g, cols in groups.items()}
+
+def _native_scores(model, M):
+    if hasattr(model, "feature_importances_"):
+        return np.asarray(model.feature_importances_, dtype=float)
+    if hasattr(model, "coef_"):
+        coef = np.abs(np.ravel(model.coef_))
+        if sparse.issparse(M):
+            Mc = M.tocsc()
+            mean = np.asarray(Mc.mean(axis=0)).ravel()
+            std = np.sqrt(np.maximum(np.asarray(Mc.multiply(Mc).mean(axis=0)).ravel() - mean ** 2, 0))
+        else:
+            std = np.asarray(M, dtype=float).std(axis=0)
+        return coef * std
+    return None
+
+def feature_importance(fitted_pipeline, X, y, mode = "permutation", groups = None, max_rows = 5000,
+                       n_repeats = 5, n_jobs = -1, random_state = 42):
+    # one row per group: feature, mean_importance, std_importance, n_columns (output columns in the group)
+    if mode not in IMPORTANCE_MODES:
+        raise ValueError(f"Unknown importance mode '{mode}', expected one of {IMPORTANCE_MODES}")
+    X, y = _subsample(X, y, max_rows, random_state)
+    groups = groups or importance_groups(X.columns, indicator_cols=[])
+    prep, model = _split(fitted_pipeline)
+    M = prep.transform(X) if prep is not None else X
+    sources = output_sources(prep, M.shape[1]) if prep is not None else list(X.columns)
+    if sources is None:
+        raise ValueError("Cannot map the preprocessor's output columns back to input columns")
+    index = _group_indices(groups, sources)
+    names = [g for g in groups if index[g]]
+
+    scores = _native_scores(model, M) if mode == "native" else None
+    if mode == "native" and scores is None:
+        print(f"{type(model).__name__} has no native importances; using permutation")
+    if scores is not None:
+        mean = np.array([scores[index[g]].sum() for g in names])
+        std = np.full(len(names), np.nan)
+    else:
+        y_arr = np.asarray(y)
+        base_score = r2_score(y_arr, model.predict(M))
+        seeds = np.random.SeedSequence(random_state).generate_state(len(names))
+        if n_jobs != 1:
+            model = _single_threaded(model)
+        drops = Parallel(n_jobs=n_jobs)(
+            delayed(_group_drop)(model, M, y_arr, index[g], base_score, n_repeats, int(s)) for g, s in zip(names, seeds)
+        )
+        mean = np.array([d.mean() for d in drops])
+        std = np.array([d.std() for d in drops])
+    return (
+        pd.DataFrame({
+            "feature": [g.replace(" ", "_") for g in names],
+            "mean_importance": mean,
+            "std_importance": std,
+            "n_columns": [len(index[g]) for g in names],
+        })
+        .sort_values("mean_importance", ascending=False)
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,289 @@
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, hash as joblib_hash
+from scipy.stats import rankdata
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler
+from sklearn.pipeline import Pipeline
+
+from .sl_utils import SEARCH_MODES, SUMMARY_COLUMNS, HALVING_RESOURCE, HALVING_FACTOR, scorer_dict, _grid_size
+
+# Hyperparameter search for every (target, model family) of a training run, on one shared worker pool.
+#
+# A *SearchCV per job would run one search at a time, each with n_jobs=-1 (and RandomForest adding
+# its own n_jobs=-1 inside), so a run would be a sequence of pool start-ups with the cores contending
+# inside each. Here every search is unrolled into (candidate, fold) fit-and-score units, all jobs'
+# units go to the same joblib Parallel, and every estimator inside a unit is single-threaded.
+# The pool runs in passes: a grid/random search is one round of units, successive halving is one
+# round per rung (a rung's survivors depend on its scores), and a job's refit of its winner joins
+# the pass after its last round. Each pass holds the current round of every job still searching.
+# With a preprocessing cache, a pass first fits each distinct (preprocessor, fold) once, so the
+# candidates of a fold, and jobs sharing its layout, load that fit instead of racing to fit it.
+#
+# Candidates, folds, scorers and ranking follow GridSearchCV/RandomizedSearchCV (error_score=nan);
+# halving follows HalvingGridSearchCV's schedule (min_resources="exhaust"), with every round scored
+# on all three metrics and candidates ranked by the last round they reached, then by score.
+
+@dataclass
+class SearchJob:
+    target: str
+    model_key: str
+    pipeline: Pipeline  # unfitted prep + model
+    param_grid: dict
+    X: pd.DataFrame
+    y: pd.Series
+    search: str = "grid"
+    budget: Optional[int] = None
+
+@dataclass
+class SearchResult:
+    # the parts of a fitted *SearchCV that train_supervised reads
+    best_estimator_: Pipeline
+    best_params_: dict
+    refit_time_: float
+    search_seconds: float  # summed worker time of this job's units
+
+def _candidates(job, random_state):
+    if job.search == "random":
+        n_iter = int(job.budget) if job.budget else max(1, int(np.ceil(_grid_size(job.param_grid) / 3)))
+        return list(ParameterSampler(job.param_grid, min(n_iter, _grid_size(job.param_grid)), random_state=random_state))
+    return list(ParameterGrid(job.param_grid))
+
+def _single_threaded(pipe):
+    # inner parallelism would oversubscribe the shared pool; returns the model's own n_jobs to restore later
+    params = pipe.get_params()
+    n_jobs = params.get("model__n_jobs")
+    pipe = clone(pipe)
+    if n_jobs is not None and n_jobs != 1:
+        pipe.set_params(model__n_jobs=1)
+    return pipe, n_jobs
+
+class _Predicted(RegressorMixin, BaseEstimator):
+    # stands in for the fitted estimator so every scorer reuses one prediction, as sklearn's multimetric scoring does
+    def __init__(self, y_pred):
+        self.y_pred = y_pred
+
+    def predict(self, X):
+        return self.y_pred
+
+def _fit_fold(j, c, pipe, params, X, y, train, test):
+    t0 = time.perf_counter()
+    try:
+        est = clone(pipe).set_params(**params).fit(X.iloc[train], y.iloc[train])
+        Xt, yt = X.iloc[test], y.iloc[test]
+        pred = _Predicted(est.predict(Xt))
+        scores = {name: scorer(pred, Xt, yt) for name, scorer in scorer_dict().items()}
+    except Exception as e:
+        warnings.warn(f"fit failed for {params}: {type(e).__name__}: {e}")
+        scores = {name: np.nan for name in scorer_dict()}
+    return j, (c, scores), time.perf_counter() - t0
+
+def _fit_prep(j, pipe, X, y, train):
+    # fits only the preprocessing of pipe on a fold, which fills its Pipeline memory entry
+    t0 = time.perf_counter()
+    try:
+        clone(pipe).set_params(model="passthrough").fit(X.iloc[train], y.iloc[train])
+    except Exception as e:
+        warnings.warn(f"preprocessing fit failed: {type(e).__name__}: {e}")
+    return j, time.perf_counter() - t0
+
+def _refit(j, pipe, params, X, y):
+    t0 = time.perf_counter()
+    est = clone(pipe).set_params(**params).fit(X, y)
+    return j, est, time.perf_counter() - t0
+
+def _rank(means, rounds = None):
+    # GridSearchCV's ranking: failed (nan) candidates go last, ties share the better rank.
+    # rounds (successive halving): a candidate that reached a later round ranks above every earlier one
+    if np.isnan(means).all():
+        return np.ones(len(means), dtype=np.int32)
+    means = np.nan_to_num(means, nan=np.nanmin(means) - 1)
+    if rounds is not None:
+        means = rankdata(means, method="dense") + np.asarray(rounds) * len(means)
+    return rankdata(-means, method="min").astype(np.int32)
+
+def _summary(model_key, cands, fold_scores, rounds = None):
+    # fold_scores[metric]: (n_candidates, n_folds) scorer values (rmse negated, as sklearn reports it)
+    cols = {}
+    for name, scores in fold_scores.items():
+        cols[f"mean_test_{name}"] = scores.mean(axis=1)
+        cols[f"std_test_{name}"] = scores.std(axis=1)
+        cols[f"rank_test_{name}"] = _rank(cols[f"mean_test_{name}"], rounds)
+    df = pd.DataFrame(cols)
+    df["params"] = cands
+    best = int(df["rank_test_rmse"].argmin())
+    df["mean_test_rmse"] = -df["mean_test_rmse"]
+    summary = df[SUMMARY_COLUMNS].sort_values("rank_test_rmse")
+    summary.insert(0, "model", model_key)
+    return summary, best
+
+def _ilog(n, base):
+    # floor(log_base(n)) for n >= 1, without float rounding
+    k = 0
+    while n >= base:
+        n //= base
+        k += 1
+    return k
+
+def _halving_plan(job, n_samples, n_splits, factor = HALVING_FACTOR):
+    # (candidates, resource param or None for rows, resource of each round), as HalvingGridSearchCV
+    # plans it with min_resources="exhaust": as many rounds as the candidates need, the last one at max
+    grid = dict(job.param_grid)
+    resource = HALVING_RESOURCE.get(job.model_key)
+    if resource in grid:
+        # the tree count becomes the budget: candidates start small and the survivors get the largest forest
+        max_resources, min_resources = int(max(grid.pop(resource))), 1
+    else:
+        resource, max_resources, min_resources = None, n_samples, n_splits * 2
+    if job.budget:
+        max_resources = int(job.budget) if resource else min(int(job.budget), n_samples)
+    cands = list(ParameterGrid(grid))
+    n_required = 1 + _ilog(len(cands), factor)
+    min_resources = max(min_resources, max_resources // factor ** (n_required - 1))
+    n_rounds = min(1 + _ilog(max(max_resources // min_resources, 1), factor), n_required)
+    return cands, resource, [min(factor ** r * min_resources, max_resources) for r in range(n_rounds)]
+
+class _Search:
+    # one job's progress on the shared pool: each call to units() hands out its next round of
+    # (candidate, fold) units (or the refit once the rounds are done) and collect() takes their results
+    def __init__(self, j, job, cv, random_state):
+        self.j = j
+        self.job = job
+        self.pipe, self.n_jobs_model = _single_threaded(job.pipeline)
+        self.folds = list(cv.split(job.X, job.y))
+        self.random_state = random_state
+        if job.search == "halving":
+            self.cands, self.resource, self.resources = _halving_plan(job, len(job.X), len(self.folds))
+        else:
+            self.cands, self.resource, self.resources = _candidates(job, random_state), None, [None]
+        self.alive = list(range(len(self.cands)))
+        self.round = 0
+        self.history = []  # per round: (candidate indices, their params, {metric: (n_alive, n_folds)})
+        self.best = None
+        self.summary = None
+        self.result = None
+        self.seconds = 0.0
+
+    def _params(self, c):
+        params = dict(self.cands[c])
+        if self.resource is not None:
+            params[self.resource] = self.resources[self.round]
+        return params
+
+    def _round_folds(self):
+        n = self.resources[self.round]
+        if self.resource is not None or n is None or n >= len(self.job.X):
+            return self.folds
+        # a rows-budget round scores every fold on the same fraction of its train and test rows
+        rng = np.random.default_rng([self.random_state, self.round])
+        frac = n / len(self.job.X)
+        return [(np.sort(rng.choice(train, max(int(frac * len(train)), 1), replace=False)),
+                 np.sort(rng.choice(test, max(int(frac * len(test)), 1), replace=False))) for train, test in self.folds]
+
+    def prep_folds(self):
+        # {cache key: train rows} of the folds the next round fits on; empty without a cache or at the refit
+        if self.pipe.memory is None or self.best is not None or self.result is not None:
+            return {}
+        job, prep = self.job, joblib_hash(self.pipe.steps[0][1])
+        return {(id(job.X), id(job.y), prep, joblib_hash(train)): train for train, _ in self._round_folds()}
+
+    def units(self):
+        if self.result is not None:
+            return []
+        if self.best is not None:
+            return [delayed(_refit)(self.j, self.pipe, self.best, self.job.X, self.job.y)]
+        job, folds = self.job, self._round_folds()
+        if job.search == "halving":
+            at = f"{self.resource}={self.resources[self.round]}" if self.resource else f"{self.resources[self.round]} rows"
+            print(f"{job.target}/{job.model_key}: halving round {self.round + 1}/{len(self.resources)}, "
+                  f"{len(self.alive)} candidates x {len(folds)} folds at {at}")
+        else:
+            print(f"{job.target}/{job.model_key}: {len(folds)} folds for each of {len(self.cands)} candidates")
+        return [delayed(_fit_fold)(self.j, c, self.pipe, self._params(c), job.X, job.y, train, test)
+                for c in self.alive for train, test in folds]
+
+    def collect(self, done):
+        # done: [(payload, seconds)] of this job's units from the last pass
+        if self.best is not None:
+            (est, secs), = done
+            self.result = (est, secs)
+            return
+        self.seconds += sum(secs for _, secs in done)
+        pos = {c: i for i, c in enumerate(self.alive)}
+        scores = {}
+        for (c, s), _ in done:
+            for name, v in s.items():
+                scores.setdefault(name, [[] for _ in self.alive])[pos[c]].append(v)
+        scores = {name: np.array(v, dtype=float) for name, v in scores.items()}
+        self.history.append((list(self.alive), [self._params(c) for c in self.alive], scores))
+        self.round += 1
+        if self.round < len(self.resources):
+            # the best 1/factor of the round go on (nan fits last)
+            keep = int(np.ceil(len(self.alive) / HALVING_FACTOR))
+            order = np.argsort(-np.nan_to_num(scores["rmse"].mean(axis=1), nan=-np.inf), kind="stable")
+            self.alive = sorted(self.alive[i] for i in order[:keep])
+            return
+        self._finish()
+
+    def _finish(self):
+        job = self.job
+        if np.isnan(self.history[-1][2]["rmse"]).all():
+            raise ValueError(f"All {self.history[-1][2]['rmse'].size} fits failed for {job.target}/{job.model_key}")
+        if len(self.history) == 1:
+            _, params, scores = self.history[0]
+            self.summary, best = _summary(job.model_key, params, scores)
+        else:
+            # every candidate as scored in the last round it reached
+            last = {}
+            for r, (alive, params, scores) in enumerate(self.history):
+                for i, c in enumerate(alive):
+                    last[c] = (r, params[i], {name: v[i] for name, v in scores.items()})
+            rows = list(last.values())
+            params = [p for _, p, _ in rows]
+            scores = {name: np.array([s[name] for _, _, s in rows]) for name in rows[0][2]}
+            self.summary, best = _summary(job.model_key, params, scores, rounds=[r for r, _, _ in rows])
+        self.best = params[best]
+
+def run_search_jobs(jobs, cv_splits = 5, n_jobs = -1, random_state = 42):
+    # {(target, model_key): (SearchResult, cv summary)} for every job, all fitted on one pool
+    for job in jobs:
+        if job.search not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{job.search}', expected one of {SEARCH_MODES}")
+    cv = KFold(n_splits=cv_splits, shuffle=True, random_state=42)
+    searches = [_Search(j, job, cv, random_state) for j, job in enumerate(jobs)]
+
+    pool = Parallel(n_jobs=n_jobs, batch_size=1, verbose=5)
+    warmed = set()
+    while True:
+        # one fit per distinct cached preprocessing of this pass's folds, before any candidate needs it
+        warm = {}
+        for s in searches:
+            for key, train in s.prep_folds().items():
+                if key not in warmed and key not in warm:
+                    warm[key] = delayed(_fit_prep)(s.j, s.pipe, s.job.X, s.job.y, train)
+        if warm:
+            print(f"Fitting {len(warm)} preprocessing folds into the cache")
+            for j, secs in pool(warm.values()):
+                searches[j].seconds += secs
+            warmed.update(warm)
+        units = [u for s in searches for u in s.units()]
+        if not units:
+            break
+        done = {}
+        for j, payload, secs in pool(units):
+            done.setdefault(j, []).append((payload, secs))
+        for j, results in done.items():
+            searches[j].collect(results)
+
+    out = {}
+    for s in searches:
+        est, refit_time = s.result
+        if s.n_jobs_model is not None and s.n_jobs_model != 1:
+            # the saved model predicts with the family's own parallelism again
+            est.set_params(model__n_jobs=s.n_jobs_model)
+        out[(s.job.target, s.job.model_key)] = (SearchResult(est, s.best, refit_time, round(float(s.seconds), 3)), s.summary)
+    return out
@@ -0,0 +1,310 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from src.instrumentation import RunRecorder
+from src.data.artifact_store import iter_frame, frame_columns, FrameWriter, FORMATS
+from src.models.sl_utils import load_model, align_features
+
+# Scoring for the models saved by train_supervised (models/<family>_best.joblib + .meta.json).
+#
+#   batch: streams a csv/feather/parquet file chunk by chunk, scores chunks on parallel workers and
+#          writes predictions (plus any --keep id columns) in input order.
+#   serve: long-running local HTTP service. The model is loaded once (memory-mapped), concurrent
+#          requests are micro-batched into one predict call, and GET /metrics reports latency and
+#          throughput.
+#
+# Both paths go through align_features, i.e. the --drop / column order / dtype rules of training.
+#
+#   python -m src.models.predict batch --model models/rf_best.joblib --data new_rows.parquet --out preds.csv
+#   python -m src.models.predict serve --model models/rf_best.joblib --port 8080
+#   curl -s localhost:8080/predict -d '{"rows": [{"TOTAL_SESSIONS": 12, ...}]}'
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Score feature rows with a saved supervised model.")
+    sub = p.add_subparsers(dest="mode", required=True)
+
+    b = sub.add_parser("batch", help="Score a file chunk by chunk")
+    b.add_argument("--model", required=True, help="Saved pipeline (*.joblib)")
+    b.add_argument("--data", required=True, help="Input rows (.csv, .feather or .parquet)")
+    b.add_argument("--out", required=True, help="Predictions file (.csv, .feather or .parquet)")
+    b.add_argument("--keep", nargs="*", default=None,
+                   help="Input columns copied next to the prediction (default: the training --drop columns present)")
+    b.add_argument("--chunk-rows", type=int, default=100_000)
+    b.add_argument("--n-jobs", type=int, default=-1, help="Worker processes (1 scores in this process)")
+    b.add_argument("--report-dir", default=None, help="Run report dir (default: run_reports next to --out)")
+
+    s = sub.add_parser("serve", help="Serve predictions over HTTP")
+    s.add_argument("--model", required=True, help="Saved pipeline (*.joblib)")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8080)
+    s.add_argument("--max-batch", type=int, default=1024, help="Rows per micro-batch")
+    s.add_argument("--max-wait-ms", type=float, default=5.0, help="How long a micro-batch waits to fill")
+    return p.parse_args()
+
+def prediction_column(meta):
+    return f"pred_{meta.get('target') or 'target'}"
+
+# ---------- batch ----------
+
+@lru_cache(maxsize=2)
+def _worker_model(model_path):
+    # one load per worker process; workers are reused across chunks
+    return load_model(model_path)
+
+def _score_chunk(model_path, chunk, keep):
+    model, meta = _worker_model(model_path)
+    out = chunk[keep].reset_index(drop=True) if keep else pd.DataFrame(index=range(len(chunk)))
+    out[prediction_column(meta)] = model.predict(align_features(chunk, meta))
+    return out
+
+def score_file(model_path, data_path, out_path, keep = None, chunk_rows = 100_000, n_jobs = -1):
+    # returns the number of rows scored; chunks are read lazily so only a few are in flight at once
+    model_path = str(model_path)
+    _, meta = _worker_model(model_path)
+    available = frame_columns(data_path)
+    if keep is None:
+        keep = [c for c in meta["drop"] if c in available]
+    missing = [c for c in meta["columns"] + keep if c not in available]
+    if missing:
+        raise ValueError(f"{data_path} is missing {len(missing)} column(s): {missing[:10]}")
+    keep_set = set(keep)
+    read_cols = keep + [c for c in meta["columns"] if c not in keep_set]
+    chunks = iter_frame(data_path, chunk_rows=chunk_rows, columns=read_cols)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    fmt = next((f for f, suffix in FORMATS.items() if out_path.suffix.lower() == suffix), "csv")
+    n = 0
+    with FrameWriter(out_path, fmt=fmt) as writer:
+        if n_jobs == 1:
+            results = (_score_chunk(model_path, c, keep) for c in chunks)
+        else:
+            results = Parallel(n_jobs=n_jobs, return_as="generator", pre_dispatch="2*n_jobs")(
+                delayed(_score_chunk)(model_path, c, keep) for c in chunks
+            )
+        for scored in results:
+            writer.write(scored)
+            n += len(scored)
+            print(f"scored {n:,} rows")
+    return n
+
+# ---------- service ----------
+
+class LatencyStats:
+    # request counters plus a rolling window of per-request latencies
+    def __init__(self, window = 10_000):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.latencies_ms = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.predict_s = 0.0
+
+    def record_request(self, rows, latency_ms, ok = True):
+        with self.lock:
+            self.requests += 1
+            self.rows += rows if ok else 0
+            self.errors += 0 if ok else 1
+            self.latencies_ms.append(latency_ms)
+
+    def record_batch(self, rows, seconds):
+        with self.lock:
+            self.batches += 1
+            self.batch_rows += rows
+            self.predict_s += seconds
+
+    def snapshot(self):
+        with self.lock:
+            lat = np.array(self.latencies_ms) if self.latencies_ms else None
+            up = time.perf_counter() - self.started
+            pct = {f"latency_p{q}_ms": round(float(np.percentile(lat, q)), 3) if lat is not None else None for q in (50, 95, 99)}
+            return {
+                "uptime_s": round(up, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "rows": self.rows,
+                "requests_per_s": round(self.requests / up, 2) if up else None,
+                "rows_per_s": round(self.rows / up, 2) if up else None,
+                **pct,
+                "latency_max_ms": round(float(lat.max()), 3) if lat is not None else None,
+                "batches": self.batches,
+                "mean_batch_rows": round(self.batch_rows / self.batches, 1) if self.batches else None,
+                "predict_rows_per_s": round(self.batch_rows / self.predict_s, 1) if self.predict_s else None,
+            }
+
+class MicroBatcher:
+    # one thread owns the model: it drains queued requests into batches of up to max_batch rows
+    # (waiting at most max_wait_ms for more to arrive), aligns and predicts once per batch and
+    # resolves each request's future. Pipeline.predict has a fixed per-call cost of tens of ms,
+    # so this is what keeps concurrent single-row requests from queueing behind each other.
+    def __init__(self, model, meta, stats, max_batch = 1024, max_wait_ms = 5.0):
+        self.model = model
+        self.meta = meta
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        fut = Future()
+        self.queue.put((rows, fut))
+        return fut
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch, rows
+
+    def _predict(self, records):
+        return self.model.predict(align_features(pd.DataFrame.from_records(records), self.meta))
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            t0 = time.perf_counter()
+            try:
+                pred = self._predict([r for req, _ in batch for r in req])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # one bad request (e.g. a value align_features cannot cast) must not fail the others
+                # batched with it: score each request on its own so only the offending one errors
+                for req, fut in batch:
+                    t0 = time.perf_counter()
+                    try:
+                        pred = self._predict(req)
+                    except Exception as e:
+                        fut.set_exception(e)
+                        continue
+                    self.stats.record_batch(len(req), time.perf_counter() - t0)
+                    fut.set_result(pred)
+                continue
+            self.stats.record_batch(rows, time.perf_counter() - t0)
+            start = 0
+            for req, fut in batch:
+                fut.set_result(pred[start:start + len(req)])
+                start += len(req)
+
+def make_handler(batcher, meta, stats):
+    info = {"target": meta.get("target"), "model": meta.get("model"), "n_features": len(meta["columns"]),
+            "columns": meta["columns"]}
+    pred_col = prediction_column(meta)
+    required = set(meta["columns"])
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code, body):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send(200, stats.snapshot())
+            elif self.path == "/model":
+                self._send(200, info)
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            t0 = time.perf_counter()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                rows = body.get("rows") if isinstance(body, dict) else body
+                if isinstance(rows, dict):
+                    rows = [rows]
+                if not rows:
+                    raise ValueError('expected {"rows": [{column: value, ...}, ...]}')
+                for r in rows:
+                    missing = required - r.keys()
+                    if missing:
+                        raise ValueError(f"Input is missing {len(missing)} feature column(s): {sorted(missing)[:10]}")
+            except (ValueError, TypeError, AttributeError) as e:
+                stats.record_request(0, (time.perf_counter() - t0) * 1000, ok=False)
+                self._send(400, {"error": str(e)})
+                return
+            try:
+                pred = batcher.submit(rows).result()
+            except Exception as e:
+                stats.record_request(0, (time.perf_counter() - t0) * 1000, ok=False)
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            stats.record_request(len(rows), (time.perf_counter() - t0) * 1000)
+            self._send(200, {pred_col: pred.tolist()})
+
+        def log_message(self, format, *args):
+            # per-request access logs would dominate at serving rates; /metrics has the numbers
+            pass
+
+    return Handler
+
+def serve(model_path, host = "127.0.0.1", port = 8080, max_batch = 1024, max_wait_ms = 5.0):
+    model, meta = load_model(model_path)
+    stats = LatencyStats()
+    batcher = MicroBatcher(model, meta, stats, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, meta, stats))
+    server.daemon_threads = True
+    print(f"Serving {model_path} on http://{host}:{server.server_address[1]} (POST /predict, GET /metrics /model /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(stats.snapshot(), indent=1))
+
+def main():
+    args = parse_args()
+    if args.mode == "serve":
+        serve(args.model, host=args.host, port=args.port, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        return
+    out = Path(args.out)
+    report_dir = Path(args.report_dir) if args.report_dir else out.parent / "run_reports"
+    recorder = RunRecorder(f"predict_{Path(args.model).stem}")
+    n = recorder.track("score_file", score_file, args.model, args.data, out, keep=args.keep,
+                       chunk_rows=args.chunk_rows, n_jobs=args.n_jobs)
+    recorder.stages[-1]["rows_out"] = n
+    print(f"Predictions for {n:,} rows saved {out}")
+    recorder.write_report(report_dir)
+
+if __name__ == "__main__":
+    # run through the importable module so loky workers can unpickle _score_chunk (and keep its model cache)
+    from src.models.predict import main as _main
+    _main()
@@ -1,14 +1,21 @@
 from typing import Dict, List, Tuple, Optional
+import json
+import shutil
+from pathlib import Path
+import joblib
 import numpy as np
 import pandas as pd
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler, RobustScaler
+from scipy import sparse
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler, RobustScaler, FunctionTransformer
 from sklearn.pipeline import Pipeline
+from sklearn.base import BaseEstimator, TransformerMixin, clone
 from sklearn.linear_model import Ridge
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.model_selection import GridSearchCV, KFold, cross_validate
-from sklearn.metrics import make_scorer, mean_squared_error, mean_absolute_error, r2_score
-from sklearn.inspection import permutation_importance
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import make_scorer, root_mean_squared_error, mean_absolute_error, r2_score
+from joblib import Memory
+import sklearn
+from .importance import feature_importance
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -32,22 +39,154 @@ def split_features( df, target_col, drop_cols = None ) :
     #X = df.drop(columns=[target_col])
     X = df.drop(columns=[target_col] + drop_cols, errors="ignore")
 
-    # infer column types
-    num_cols = X.select_dtypes(include=["int", "int32", "int64", "float", "float32", "float64"]).columns.tolist()
+    # infer column types; feature_stage tables keep their one-hot blocks as uint8
+    num_cols = X.select_dtypes(include=["number"], exclude=["bool"]).columns.tolist()
     cat_cols = [c for c in X.columns if c not in num_cols]
     return X, y, num_cols, cat_cols
 
-def build_preprocessor(num_cols, cat_cols):
-    return ColumnTransformer(
+def prep_cache(location):
+    # on-disk cache of fitted preprocessing for Pipeline(memory=...). Entries are keyed on the
+    # transformer's params (column lists included) and a hash of the fold's X/y, so changed data or
+    # columns miss instead of serving stale matrices. A fold's preprocessing is fitted once and reused
+    # by every candidate of a search, and by every family with the same MATRIX_FORMAT layout (ridge and
+    # gbr share one entry per fold; rf's auto and hgb's native preprocessors each have their own).
+    return Memory(location=str(location), verbose=0) if location else None
+
+def trim_prep_cache(memory, bytes_limit = "2G"):
+    # evicts least recently used entries until the cache fits bytes_limit
+    if memory is not None:
+        memory.reduce_size(bytes_limit=bytes_limit)
+
+def indicator_columns(X, num_cols):
+    # numeric columns that are complete 0/1 indicators (the one-hot blocks already in the feature table)
+    if not num_cols:
+        return []
+    vals = X[num_cols]
+    is_ind = (vals.isin([0, 1]) & vals.notna()).all(axis=0)
+    return [c for c in num_cols if is_ind[c]]
+
+def compact_indicators(X, indicator_cols):
+    # float64 0/1 columns -> uint8 (8x smaller); returns a new frame
+    if not indicator_cols:
+        return X
+    X = X.copy(deep=False)
+    X[indicator_cols] = X[indicator_cols].astype(np.uint8)
+    return X
+
+# matrix layout handed to each family (measured with src.bench.feature_matrix-style fits on 3k rows):
+#   sparse  float32 CSR. Ridge and GBR fit fastest on it at any width (gbr: 4.5s vs 6.5s dense at 271
+#           columns, 7.2s vs 96s at 3.3k), and its size follows the non-zeros, not the one-hot width.
+#   auto    float32 CSR, densified when the fitted width is at most DENSE_MAX_COLUMNS. The forest fits
+#           3x faster dense on a narrow table (271 columns: 10.1s vs 29.8s on CSR) but no faster on a
+#           wide one (3.3k columns: 50.5s dense vs 46.9s) at 11x the memory (39 MB vs 3.5 MB); high-
+#           cardinality categoricals (CITY, station names) push the dense matrix to GBs.
+#   native  the histogram booster's frame with ordinal-coded categoricals it splits on natively
+MATRIX_FORMAT = {"ridge": "sparse", "rf": "auto", "gbr": "sparse", "hgb": "native"}
+DENSE_MAX_COLUMNS = 1000
+
+# the histogram booster bins every feature into at most 255 buckets, categories included
+HGB_MAX_CATEGORIES = 250
+
+def _to_csr(X):
+    return sparse.csr_matrix(X, dtype=np.float32)
+
+def _to_float32(X):
+    return X.astype(np.float32) if not sparse.issparse(X) else X.astype(np.float32).toarray()
+
+class DenseIfNarrow(TransformerMixin, BaseEstimator):
+    # float32 CSR in, float32 CSR out, or a dense float32 array when the matrix it was fitted on had
+    # at most max_columns columns; the choice is made once at fit, so scoring sees the training layout
+    def __init__(self, max_columns = DENSE_MAX_COLUMNS):
+        self.max_columns = max_columns
+
+    def fit(self, X, y = None):
+        self.n_features_in_ = X.shape[1]
+        self.dense_ = X.shape[1] <= self.max_columns
+        return self
+
+    def transform(self, X):
+        X = _to_csr(X)
+        return X.toarray() if self.dense_ else X
+
+    def get_feature_names_out(self, input_features = None):
+        return np.asarray(input_features, dtype=object)
+
+def _as_category(X, columns):
+    # ordinal codes -> pandas categoricals, which HistGradientBoosting picks up as categorical features
+    return X.astype({c: "category" for c in columns})
+
+def build_preprocessor(num_cols, cat_cols, indicator_cols = None, output = None):
+    # indicator_cols/output None keeps the original behaviour (all numerics scaled, sklearn picks the
+    # output layout). With indicator_cols the 0/1 blocks pass through unscaled, like the one-hot
+    # columns, and output fixes the matrix layout handed to the model: "sparse" (float32 CSR), "dense"
+    # (float32 array) or "auto" (CSR, densified when narrow; see MATRIX_FORMAT).
+    # output="native" leaves numerics unscaled and ordinal-codes the categoricals (rare levels pooled,
+    # unseen/missing -> NaN) into a categorical-typed frame for the histogram booster.
+    if output == "native":
+        cols = ColumnTransformer(
+            transformers=[
+                ("num", "passthrough", num_cols),
+                ("cat", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=np.nan,
+                                       encoded_missing_value=np.nan, max_categories=HGB_MAX_CATEGORIES), cat_cols),
+            ],
+            remainder="drop",
+            verbose_feature_names_out=False
+        ).set_output(transform="pandas")
+        return Pipeline(steps=[("cols", cols), ("categorical", FunctionTransformer(
+            _as_category, kw_args={"columns": list(cat_cols)}, feature_names_out="one-to-one"))])
+    if indicator_cols is None and output is None:
+        return ColumnTransformer(
+            transformers=[
+                ("num", StandardScaler(), num_cols),
+                #("num", RobustScaler(), num_cols),
+                ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
+            ],
+            remainder="drop",
+            verbose_feature_names_out=True
+        )
+    indicator_cols = indicator_cols or []
+    scaled = [c for c in num_cols if c not in set(indicator_cols)]
+    dense = output == "dense"
+    ind = "passthrough" if dense else FunctionTransformer(_to_csr, feature_names_out="one-to-one", accept_sparse=True)
+    cols = ColumnTransformer(
         transformers=[
-            ("num", StandardScaler(), num_cols),
-            #("num", RobustScaler(), num_cols),
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols),
+            ("num", StandardScaler(), scaled),
+            ("ind", ind, indicator_cols),
+            ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=not dense, dtype=np.float32), cat_cols),
         ],
         remainder="drop",
+        sparse_threshold=0.0 if dense else 1.0,
         verbose_feature_names_out=True
     )
+    if output == "auto":
+        return Pipeline(steps=[("cols", cols), ("layout", DenseIfNarrow())])
+    # the scaled block comes out of StandardScaler as float64, which would make the whole matrix float64
+    to_float32 = _to_float32 if dense else _to_csr
+    return Pipeline(steps=[("cols", cols), ("float32", FunctionTransformer(to_float32, feature_names_out="one-to-one",
+                                                                           accept_sparse=True))])
+
+def family_preprocessor(model_key, num_cols, cat_cols, indicator_cols = None):
+    # the preprocessor for one model family: its MATRIX_FORMAT layout when indicator columns were
+    # detected, otherwise the original one (families that need their own input format always get it)
+    output = MATRIX_FORMAT.get(model_key, "auto")
+    if indicator_cols is None and output != "native":
+        return build_preprocessor(num_cols, cat_cols)
+    return build_preprocessor(num_cols, cat_cols, indicator_cols or [], output=output)
 
+def feature_matrix_stats(prep, X):
+    # size and density of the matrix a fitted preprocessor hands to the model
+    M = prep.transform(X)
+    if isinstance(M, pd.DataFrame):
+        return {"layout": "frame", "dtype": "mixed", "shape": M.shape, "mb": round(M.memory_usage(deep=True).sum() / 1e6, 2),
+                "density": round(float(M.notna().to_numpy().mean()), 4)}
+    if sparse.issparse(M):
+        nbytes = M.data.nbytes + M.indices.nbytes + M.indptr.nbytes
+        nnz = M.nnz
+    else:
+        nbytes = M.nbytes
+        nnz = int(np.count_nonzero(M))
+    return {"layout": "sparse" if sparse.issparse(M) else "dense", "dtype": str(M.dtype), "shape": M.shape,
+            "mb": round(nbytes / 1e6, 2), "density": round(nnz / max(M.shape[0] * M.shape[1], 1), 4)}
 
 #complexity_settings = [
 #    {"n_estimators": 10, "max_depth": 5},
@@ -86,75 +225,170 @@ def get_model_spaces():
                 "model__max_depth": [2, 3],
             }
         ),
+        # binned, multithreaded boosting; splits categoricals natively and stops once the
+        # held-out 10% stops improving, so max_iter is a cap rather than a tuned value
+        "hgb": (
+            HistGradientBoostingRegressor(random_state=42, max_iter=1000, early_stopping=True,
+                                          validation_fraction=0.1, n_iter_no_change=20, categorical_features="from_dtype"),
+            {
+                "model__learning_rate": [0.05, 0.1],
+                "model__max_leaf_nodes": [15, 31, 63],
+                "model__l2_regularization": [0.0, 1.0],
+            }
+        ),
     }
     return models
 
 def scorer_dict() -> Dict[str, callable]:
+    # rmse is an error, so the search must minimise it; the search summaries flip the sign back
     return {
-        "rmse": make_scorer(lambda y_true, y_pred: mean_squared_error(y_true, y_pred, squared=False)),
+        "rmse": make_scorer(root_mean_squared_error, greater_is_better=False),
         "mae": make_scorer(mean_absolute_error),
         "r2": make_scorer(r2_score),
     }
 
-def cv_and_tune( X, y, preprocessor, model_key, model_space, cv_splits = 5, n_jobs = -1, refit_metric = "rmse" ):
-    model, param_grid = model_space
-    pipe = Pipeline(steps=[("prep", preprocessor), ("model", model)])
-
-    #grid_search = GridSearchCV(
-    #    estimator=rfreg_pipeline,
-    #    param_grid=param_grid,
-    #    cv=cv,
-    #    scoring=scoring,
-    #    n_jobs=-1,  # Use all processors
-    #    verbose=1,  # Verbose to get feedback during fitting
-    #)
-    
-
-    grid = GridSearchCV(
-        estimator=pipe,
-        param_grid=param_grid,
-        scoring=scorer_dict(),
-        refit=refit_metric,  
-        cv=KFold(n_splits=cv_splits, shuffle=True, random_state=42),
-        n_jobs=n_jobs,
-        verbose=1,
-        return_train_score=False
-    )
-    grid.fit(X, y)
-    df = pd.DataFrame(grid.cv_results_)
-    summary = df[[
-        "rank_test_rmse", "mean_test_rmse", "std_test_rmse",
-        "mean_test_mae", "std_test_mae",
-        "mean_test_r2", "std_test_r2",
-        "params"
-    ]].sort_values("rank_test_rmse")
-    summary.insert(0, "model", model_key)
-    return grid, summary
-
-def export_feature_importance( fitted_pipeline, X, y, out_path ):
-    r = permutation_importance( fitted_pipeline, X, y, n_repeats=10, random_state=42, n_jobs=-1 )
-    prep = fitted_pipeline.named_steps["prep"]
-    feat_names = []
-    if hasattr(prep, "get_feature_names_out"):
-        #feat_names = prep.get_feature_names_out()
-        #try:
-        #    feat_names = prep.get_feature_names_out()
-        #except ValueError:
-        #    feat_names = prep.get_feature_names_out()
-        #    feat_names = pd.Index(feat_names).duplicated(keep=False).astype(str) + "_" + feat_names
-        
-        feat_names = prep.get_feature_names_out()
-        feat_names = pd.Index(feat_names).map(lambda x: x.replace(" ", "_")).to_list()
-        feat_names = pd.Index(feat_names + [f"dup_{i}" for i in range(len(feat_names))]).unique().to_list()
-    else:
-        feat_names = X.columns
-
-    imp = (
-        pd.DataFrame({
-            "feature": feat_names,
-            "mean_importance": r.importances_mean,
-            "std_importance": r.importances_std
-        })
-        .sort_values("mean_importance", ascending=False)
-    )
-    imp.to_csv(out_path, index=False)
\ No newline at end of file
+SEARCH_MODES = ["grid", "halving", "random"]
+
+# successive-halving budget per family: forests grow trees, everything else sees more rows.
+# GBR keeps n_estimators in its grid because it trades off against learning_rate.
+HALVING_RESOURCE = {"rf": "model__n_estimators"}
+# each halving round keeps the best third of its candidates and gives them three times the resource
+HALVING_FACTOR = 3
+
+SUMMARY_COLUMNS = [
+    "rank_test_rmse", "mean_test_rmse", "std_test_rmse",
+    "mean_test_mae", "std_test_mae",
+    "mean_test_r2", "std_test_r2",
+    "params"
+]
+
+def _grid_size(param_grid):
+    return int(np.prod([len(v) for v in param_grid.values()])) if param_grid else 1
+
+def export_feature_importance( fitted_pipeline, X, y, out_path, mode = "permutation", groups = None, max_rows = 5000,
+                               n_repeats = 5, n_jobs = -1 ):
+    # see importance.feature_importance; groups=None scores every input column on its own
+    imp = feature_importance(fitted_pipeline, X, y, mode=mode, groups=groups, max_rows=max_rows,
+                             n_repeats=n_repeats, n_jobs=n_jobs)
+    imp.to_csv(out_path, index=False)
+    return imp
+
+def model_meta_path(model_path):
+    # models/rf_best.joblib -> models/rf_best.meta.json
+    path = Path(model_path)
+    return path.with_name(path.stem + ".meta.json")
+
+def model_rows_path(model_path):
+    # models/rf_best.joblib -> models/rf_best.rows.npy
+    path = Path(model_path)
+    return path.with_name(path.stem + ".rows.npy")
+
+def row_hashes(X, y):
+    # one uint64 per (features, target) row; --update scores a saved model on the rows whose hash it was not trained on
+    return pd.util.hash_pandas_object(X.assign(**{str(y.name): y}), index=False).to_numpy()
+
+def load_model_rows(model_path):
+    # sorted training-row hashes saved with the model, or None for models saved without them
+    path = model_rows_path(model_path)
+    return np.load(path) if path.exists() else None
+
+def feature_meta(target_col, drop_cols, X, num_cols, cat_cols, indicator_cols = None, **extra):
+    # the feature contract a saved model was trained under; align_features replays it at prediction time
+    return {
+        "target": target_col,
+        "drop": list(drop_cols or []),
+        "columns": [str(c) for c in X.columns],
+        "num_cols": list(num_cols),
+        "cat_cols": list(cat_cols),
+        "indicator_cols": list(indicator_cols or []),
+        "sklearn": sklearn.__version__,
+        **extra,
+    }
+
+def save_model(fitted_pipeline, model_path, meta, rows = None):
+    # uncompressed so the fitted arrays can be memory-mapped on load; rows: row_hashes of the training rows
+    joblib.dump(fitted_pipeline, model_path)
+    with open(model_meta_path(model_path), "w") as f:
+        json.dump(meta, f, indent=1, default=str)
+    if rows is not None:
+        np.save(model_rows_path(model_path), np.sort(rows))
+
+def archive_model(model_path):
+    # moves the current artifact, its meta and row hashes to versions/<stem>_v<N>.joblib before it is replaced;
+    # returns the archived version (0 when there was nothing to archive)
+    model_path = Path(model_path)
+    if not model_path.exists():
+        return 0
+    meta_file = model_meta_path(model_path)
+    version = 1
+    if meta_file.exists():
+        with open(meta_file) as f:
+            version = json.load(f).get("version", 1)
+    dest = model_path.parent / "versions" / f"{model_path.stem}_v{version:03d}{model_path.suffix}"
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(model_path), str(dest))
+    for side, dest_side in [(meta_file, model_meta_path(dest)), (model_rows_path(model_path), model_rows_path(dest))]:
+        if side.exists():
+            shutil.move(str(side), str(dest_side))
+    return version
+
+# estimator param that grows the ensemble on a warm-started refit, and the fitted size it grows from
+WARM_START_PARAM = {"rf": "n_estimators", "gbr": "n_estimators", "hgb": "max_iter"}
+
+def _ensemble_size(model):
+    # boosting iterations (hgb) or fitted trees (rf; gbr keeps one row of trees per stage)
+    if getattr(model, "n_iter_", None) is not None:
+        return int(model.n_iter_)
+    if getattr(model, "estimators_", None) is not None:
+        return len(model.estimators_)
+    return None
+
+def warm_refit(fitted_pipeline, model_key, X, y, add_estimators = 100):
+    # refits a saved pipeline on updated data at its recorded hyperparameters. Ensembles keep the
+    # fitted preprocessor (so existing trees see the inputs they were grown on) and warm-start
+    # add_estimators more trees/iterations on the new data; anything else is refitted from scratch.
+    # Returns (pipeline, how it was refitted).
+    param = WARM_START_PARAM.get(model_key)
+    prep, model = fitted_pipeline.steps[0][1], fitted_pipeline.steps[-1][1]
+    size = _ensemble_size(model)
+    if param is None or size is None or len(fitted_pipeline.steps) != 2:
+        fresh = clone(fitted_pipeline).set_params(memory=None)
+        return fresh.fit(X, y), "refit"
+    model.set_params(warm_start=True, **{param: size + add_estimators})
+    model.fit(prep.transform(X), y)
+    model.set_params(warm_start=False)
+    return fitted_pipeline, f"warm_start +{_ensemble_size(model) - size}"
+
+def load_model(model_path, mmap = True):
+    # (pipeline, meta); models saved before the meta sidecar existed get their column order from the pipeline
+    model = joblib.load(model_path, mmap_mode="r" if mmap else None)
+    meta_file = model_meta_path(model_path)
+    if meta_file.exists():
+        with open(meta_file) as f:
+            return model, json.load(f)
+    columns = getattr(model, "feature_names_in_", None)
+    if columns is None:
+        raise ValueError(f"{model_path} has no {meta_file.name} and does not record its input columns")
+    print(f"Warning: no {meta_file.name}; using the pipeline's input columns and treating non-numeric inputs as categorical")
+    return model, {"target": None, "drop": [], "columns": [str(c) for c in columns], "num_cols": None,
+                   "cat_cols": None, "indicator_cols": []}
+
+def align_features(df, meta):
+    # training's split_features, replayed: drop the same columns, keep the trained columns in the
+    # trained order, and coerce numeric/categorical columns to the kind they were trained as
+    missing = [c for c in meta["columns"] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Input is missing {len(missing)} feature column(s): {missing[:10]}")
+    X = df[meta["columns"]]
+    num_cols = meta["num_cols"]
+    if num_cols is None:
+        num_cols = X.select_dtypes(include=["int", "int32", "int64", "float", "float32", "float64"]).columns.tolist()
+    text = [c for c in num_cols if not pd.api.types.is_numeric_dtype(X[c].dtype)]
+    if text:
+        X = X.assign(**{c: pd.to_numeric(X[c], errors="coerce") for c in text})
+    # indicator columns stay in whatever numeric dtype they arrive in: every preprocessor passes them
+    # through to float (or bins them), so uint8 only mattered for training-set memory
+    cat_cols = meta["cat_cols"] if meta["cat_cols"] is not None else [c for c in X.columns if c not in set(num_cols)]
+    # a chunk whose category column is all missing reads back as float
+    casts = {c: object for c in cat_cols if pd.api.types.is_numeric_dtype(X[c].dtype)}
+    return X.astype(casts) if casts else X
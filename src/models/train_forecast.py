@@ -0,0 +1,131 @@
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from src.instrumentation import RunRecorder
+from src.data.artifact_store import load_frame
+from src.data.data_utils import month_label
+from src.models.sl_config import build_paths
+from src.models.sl_utils import save_model, archive_model
+from src.models.fc_utils import (MAX_HORIZON, BASELINES, get_forecast_models, monthly_panel, forecast_rows, backtest_origins,
+                                 run_backtests, forecast_errors, fit_forecaster, forecast_latest)
+
+# Per-state monthly demand forecasts 1..12 months ahead from the state_month_agg table, with a
+# rolling-origin backtest of every model family against the naive / seasonal-naive baselines.
+#
+#   python -m src.models.train_forecast --data data/processed/state_month_agg.feather --target energy_kwh_sum sessions
+#
+# Writes, per target (a subdir each when several are given):
+#   backtest_predictions.csv  every (origin, state, horizon) backtest forecast next to the actual
+#   backtest_by_horizon.csv   MAE / RMSE / WAPE / bias per horizon, model and baselines
+#   backtest_by_origin.csv    the same per origin, with the origin's training rows and fit / predict seconds
+#   forecast_summary.csv      overall accuracy and backtest / forecast timings per method
+#   forecasts.csv             every state's forecasts for the months after the table's last one
+# and <models>/forecast_<family>.joblib refitted on the whole history.
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Forecast state-month EV charging demand.")
+    p.add_argument("--data", default="data/processed/state_month_agg.feather", help="state_month_agg table (.csv, .feather or .parquet)")
+    p.add_argument("--target", nargs="+", default=["energy_kwh_sum"], help="Monthly column(s) to forecast")
+    p.add_argument("--families", nargs="*", default=None, help="Model families (default: all of get_forecast_models)")
+    p.add_argument("--horizon", type=int, default=MAX_HORIZON, help="Months ahead to forecast")
+    p.add_argument("--origins", type=int, default=12, help="Rolling backtest origins")
+    p.add_argument("--origin-step", type=int, default=1, help="Months between backtest origins")
+    p.add_argument("--min-train-months", type=int, default=24, help="Skip origins with fewer observed target months")
+    p.add_argument("--n-jobs", type=int, default=-1, help="Workers in the pool shared by all backtest fits")
+    p.add_argument("--out", default="results/forecast", help="Results dir")
+    p.add_argument("--models", default="models", help="Models dir")
+    p.add_argument("--report-dir", default=None, help="Run report dir (default: run_reports next to --out)")
+    return p.parse_args()
+
+def target_paths(args, target):
+    if len(args.target) == 1:
+        return build_paths(args.data, results_dir=args.out, models_dir=args.models)
+    return build_paths(args.data, results_dir=Path(args.out) / target, models_dir=Path(args.models) / target)
+
+def _labelled(df, col):
+    return df.assign(**{col.replace("_t", ""): month_label(df[col] // 12, df[col] % 12 + 1).to_numpy()})
+
+def main():
+    args = parse_args()
+    print(args)
+    report_dir = Path(args.report_dir) if args.report_dir else target_paths(args, args.target[0]).results_dir.parent / "run_reports"
+    recorder = RunRecorder(f"forecast_{'+'.join(args.target)}")
+
+    print(f"Loading data: {args.data}")
+    sm = recorder.track("load_data", load_frame, args.data)
+    for target in args.target:
+        assert target in sm.columns, f"Target '{target}' not found in columns."
+    panel = recorder.track("monthly_panel", monthly_panel, sm, args.target, rows_in=len(sm))
+    print(f"{panel['state'].nunique()} states x {panel['t'].nunique()} months "
+          f"({month_label(panel['Year'], panel['Month']).iloc[[0, -1]].tolist()})")
+
+    models = {k: m for k, m in get_forecast_models().items() if not args.families or k in args.families}
+    rows = {t: recorder.track(f"forecast_rows[{t}]", forecast_rows, panel, t, horizon=args.horizon, rows_in=len(panel))
+            for t in args.target}
+    origins = backtest_origins(panel, args.origins, args.origin_step)
+    jobs = {(t, k): (m, *rows[t]) for t in args.target for k, m in models.items()}
+
+    # every (target, family, origin) fit of the run on one pool
+    print(f"\nBacktesting {len(jobs)} target/model jobs over {len(origins)} origins on a shared pool")
+    with recorder.stage("backtest", rows_in=len(origins) * len(jobs)) as rec:
+        backtests = run_backtests(jobs, origins, n_jobs=args.n_jobs, min_train_months=args.min_train_months)
+    backtest_wall = rec["wall_s"]
+
+    for target in args.target:
+        paths = target_paths(args, target)
+        X, y_log, _ = rows[target]
+        preds, by_h, by_o, summary, forecasts = [], [], [], [], []
+        for key, model in models.items():
+            pred, timing = backtests[(target, key)]
+            if pred is None:
+                print(f"{target}/{key}: no origin had {args.min_train_months} months of history; skipped")
+                continue
+            pred.insert(0, "model", key)
+            preds.append(pred)
+            # baselines are the same for every family: report them once
+            methods = ["forecast"] + (BASELINES if not by_h else [])
+            by_h.append(forecast_errors(pred, ["horizon"], methods).replace({"method": {"forecast": key}}))
+            o = forecast_errors(pred, ["origin_t"], methods).replace({"method": {"forecast": key}})
+            by_o.append(o.merge(timing.assign(method=key), on=["origin_t", "method"], how="left"))
+            total = forecast_errors(pred.assign(all=1), ["all"], methods).drop(columns="all").replace({"method": {"forecast": key}})
+
+            # final model on the whole history; one batched predict for every state and horizon
+            fitted = recorder.track(f"fit[{target}/{key}]", fit_forecaster, model, X, y_log, rows_in=len(X))
+            fc, fc_seconds = forecast_latest(fitted, panel, target, horizon=args.horizon)
+            forecasts.append(fc.assign(model=key))
+            total.loc[total["method"] == key, "backtest_fit_seconds"] = timing["fit_seconds"].sum()
+            total.loc[total["method"] == key, "backtest_predict_seconds"] = timing["predict_seconds"].sum()
+            total.loc[total["method"] == key, "refit_seconds"] = recorder.stages[-1]["wall_s"]
+            total.loc[total["method"] == key, "forecast_seconds"] = round(fc_seconds, 4)
+            summary.append(total)
+
+            model_path = paths.models_dir / f"forecast_{key}.joblib"
+            version = archive_model(model_path) + 1
+            save_model(fitted, model_path, {
+                "target": target, "model": key, "version": version, "columns": [str(c) for c in X.columns],
+                "horizon": args.horizon, "last_month": month_label(panel["Year"], panel["Month"]).iloc[-1],
+                "trained_utc": recorder.started.isoformat(), "n_train": int(np.isfinite(y_log).sum()),
+                **{f"backtest_{m}": float(total.loc[total["method"] == key, m].iloc[0]) for m in ["mae", "rmse", "wape"]},
+            })
+        if not preds:
+            continue
+
+        _labelled(pd.concat(preds, ignore_index=True), "origin_t").pipe(_labelled, "target_t") \
+            .to_csv(paths.results_dir / "backtest_predictions.csv", index=False)
+        pd.concat(by_h, ignore_index=True).to_csv(paths.results_dir / "backtest_by_horizon.csv", index=False)
+        _labelled(pd.concat(by_o, ignore_index=True), "origin_t").to_csv(paths.results_dir / "backtest_by_origin.csv", index=False)
+        pd.concat(forecasts, ignore_index=True).to_csv(paths.results_dir / "forecasts.csv", index=False)
+        summary = pd.concat(summary, ignore_index=True).sort_values("wape")
+        # wall time of the whole shared pool (all targets and families)
+        summary["backtest_wall_seconds"] = backtest_wall
+        summary.to_csv(paths.results_dir / "forecast_summary.csv", index=False)
+        print(f"\nBacktest summary ({target}, {len(origins)} origins, horizons 1..{args.horizon}):")
+        print(summary.to_string(index=False))
+    recorder.write_report(report_dir)
+
+if __name__ == "__main__":
+    main()
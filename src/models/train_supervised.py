@@ -1,81 +1,249 @@
 import argparse
-import joblib
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
 from pathlib import Path
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+from src.instrumentation import RunRecorder
+from src.data.artifact_store import load_frame, frame_columns
 from src.models.sl_config import build_paths
-from src.models.sl_utils import split_features, build_preprocessor, get_model_spaces, cv_and_tune, export_feature_importance 
+from src.models.importance import IMPORTANCE_MODES, importance_groups
+from src.models.orchestrate import SearchJob, run_search_jobs
+from src.models.sl_utils import split_features, get_model_spaces, export_feature_importance, SEARCH_MODES, prep_cache, trim_prep_cache, \
+    indicator_columns, compact_indicators, family_preprocessor, feature_meta, save_model, load_model, archive_model, warm_refit, \
+    row_hashes, load_model_rows
 
 def parse_args():
     p = argparse.ArgumentParser(description="Train supervised EV demand models.")
-    p.add_argument("--data", default="data/processed/final_data/FinalFeaturesDF.csv", help="Input features CSV")
-    p.add_argument("--target", default="demand_score", help="Target column name")
+    p.add_argument("--data", default="data/processed/final_data/FinalFeaturesDF.csv", help="Input features file (.csv, .feather or .parquet)")
+    p.add_argument("--target", nargs="+", default=["demand_score"],
+                   help="Target column(s); several are trained in one run on one data load and split")
     p.add_argument("--drop", nargs="*", default=["STATE_NAME","STATE","station_name","id"], help="Columns to drop from features")
     p.add_argument("--test_size", type=float, default=0.2)
     p.add_argument("--seed", type=int, default=42)
     p.add_argument("--out", default="results/supervised", help="Results dir")
     p.add_argument("--models", default="models", help="Models dir")
+    p.add_argument("--families", nargs="*", default=None, help="Model families to train (default: all of get_model_spaces)")
+    p.add_argument("--search", choices=SEARCH_MODES, default="grid", help="Hyperparameter search strategy")
+    p.add_argument("--budget", type=int, default=None,
+                   help="random: candidates to sample; halving: final-round resource (training rows, or trees for rf)")
+    p.add_argument("--cv-splits", type=int, default=5)
+    p.add_argument("--n-jobs", type=int, default=-1, help="Workers in the pool shared by all target/model searches")
+    p.add_argument("--legacy-features", action="store_true",
+                   help="Scale every numeric column and let sklearn pick the matrix layout (previous behaviour)")
+    p.add_argument("--importance", choices=IMPORTANCE_MODES + ["none"], default="permutation",
+                   help="Feature importance: grouped permutation, the model's native importances, or skip")
+    p.add_argument("--importance-rows", type=int, default=5000, help="Training rows sampled for permutation importance")
+    p.add_argument("--importance-repeats", type=int, default=5)
+    p.add_argument("--update", action="store_true",
+                   help="Refresh the saved models on updated data: refit at their recorded hyperparameters "
+                        "(warm-starting the ensembles) and only search again when error on the new rows drifts")
+    p.add_argument("--drift-threshold", type=float, default=0.10,
+                   help="--update: relative growth of RMSE on the rows a saved model was not trained on over its "
+                        "recorded test RMSE that triggers a full search")
+    p.add_argument("--add-estimators", type=int, default=100,
+                   help="--update: trees (rf, gbr) or boosting iterations (hgb) added on a warm start")
+    p.add_argument("--prep-cache", default="cache/sl_prep", help="Fitted-preprocessing cache dir ('' to disable)")
+    p.add_argument("--prep-cache-size", default="2G", help="Cache size limit, trimmed after the searches")
+    p.add_argument("--report-dir", default=None, help="Run report dir (default: run_reports next to --out)")
+    p.add_argument("--profile", action="store_true", help="Also dump cProfile output per stage")
     return p.parse_args()
 
+def test_metrics(y_true, y_pred):
+    rmse = ((y_true - y_pred) ** 2).mean() ** 0.5
+    mae  = (y_true - y_pred).abs().mean()
+    # avoid division by zero
+    y_bar = y_true.mean()
+    ss_res = ((y_true - y_pred) ** 2).sum()
+    ss_tot = ((y_true - y_bar) ** 2).sum()
+    r2 = 1 - ss_res/ss_tot if ss_tot != 0 else float("nan")
+    return {"rmse_test": rmse, "mae_test": mae, "r2_test": r2}
+
+def previous_model(model_path, target, X):
+    # (pipeline, meta, None) when the saved model can be refreshed in place, else (None, None, reason)
+    if not model_path.exists():
+        return None, None, f"no saved model at {model_path}"
+    pipe, meta = load_model(model_path, mmap=False)
+    if meta.get("target") != target:
+        return None, None, f"saved model predicts {meta.get('target')!r}"
+    if meta["columns"] != [str(c) for c in X.columns]:
+        return None, None, "feature columns changed since it was trained"
+    return pipe, meta, None
+
+def drift_months(X, new):
+    # months covered by the rows a saved model was not trained on (the feature table has no year)
+    if "Month" not in X.columns or not new.any():
+        return None
+    return ",".join(str(int(m)) for m in sorted(X["Month"][new].dropna().unique()))
+
+def target_paths(args, target):
+    # one target keeps the flat layout; several get a results/models subdir each
+    if len(args.target) == 1:
+        return build_paths(args.data, results_dir=args.out, models_dir=args.models)
+    return build_paths(args.data, results_dir=Path(args.out) / target, models_dir=Path(args.models) / target)
+
 def main():
     args = parse_args()
     print(args)
-    paths = build_paths(args.data, results_dir=args.out, models_dir=args.models)
+    targets = args.target
+    data_path = Path(args.data)
+    report_dir = Path(args.report_dir) if args.report_dir else target_paths(args, targets[0]).results_dir.parent / "run_reports"
+    recorder = RunRecorder(f"train_{'+'.join(targets)}", profile_dir=report_dir / "profiles" if args.profile else None)
 
-    print(f"Loading data: {paths.data_path}")
-    df = pd.read_csv(paths.data_path)
-    assert args.target in df.columns, f"Target '{args.target}' not found in columns."
+    print(f"Loading data: {data_path}")
+    # project away dropped columns at read time; columnar files never touch them
+    dropped = set(args.drop) - set(targets)
+    columns = [c for c in frame_columns(data_path) if c not in dropped]
+    df = recorder.track("load_data", load_frame, data_path, columns=columns)
+    for target in targets:
+        assert target in df.columns, f"Target '{target}' not found in columns."
 
-    # Split features
-    X, y, num_cols, cat_cols = split_features(df, args.target, drop_cols=args.drop)
-    print(f"Features: {len(num_cols)} numeric, {len(cat_cols)} categorical")
-
-    # Train/test split for final reporting 
-    Xtr, Xte, ytr, yte = train_test_split(
-        X, y, test_size=args.test_size, random_state=args.seed
+    # Train/test split for final reporting; one row split shared by every target
+    train_idx, test_idx = recorder.track("train_test_split", train_test_split,
+        np.arange(len(df)), test_size=args.test_size, random_state=args.seed, rows_in=len(df)
     )
 
-    preprocessor = build_preprocessor(num_cols, cat_cols)
-    model_spaces = get_model_spaces()
-
-    all_cv_rows = []
-    best_models = {}
-
-    for key, space in model_spaces.items():
-        print(f"\nTuning model: {key}")
-        grid, cv_summary = cv_and_tune(Xtr, ytr, preprocessor, key, space, cv_splits=5, n_jobs=-1)
-        cv_summary.to_csv(paths.results_dir / f"cv_{key}.csv", index=False)
-        all_cv_rows.append(cv_summary.head(5))
-        best_models[key] = grid.best_estimator_
-        # Save model
-        joblib.dump(grid.best_estimator_, paths.models_dir / f"{key}_best.joblib")
-        print(f"best params: {grid.best_params_}")
-
-        export_feature_importance(
-            fitted_pipeline=grid.best_estimator_,
-            X=Xtr, y=ytr,
-            out_path=str(paths.results_dir / f"feat_importance_{key}.csv")
-        )
-
-    rows = []
-    for key, pipe in best_models.items():
-        y_pred = pipe.predict(Xte)
-        rmse = ((yte - y_pred) ** 2).mean() ** 0.5
-        mae  = (yte - y_pred).abs().mean()
-        # avoid division by zero
-        y_bar = yte.mean()
-        ss_res = ((yte - y_pred) ** 2).sum()
-        ss_tot = ((yte - y_bar) ** 2).sum()
-        r2 = 1 - ss_res/ss_tot if ss_tot != 0 else float("nan")
-        rows.append({"model": key, "rmse_test": rmse, "mae_test": mae, "r2_test": r2})
-
-    test_table = pd.DataFrame(rows).sort_values("rmse_test")
-    test_table.to_csv(paths.results_dir / "test_summary.csv", index=False)
-    print("\nTest summary:")
-    print(test_table.to_string(index=False))
+    model_spaces = {k: v for k, v in get_model_spaces().items() if not args.families or k in args.families}
+    memory = prep_cache(args.prep_cache)
+
+    runs = {}
+    jobs = []
+    fitted = {}
+    for target in targets:
+        # Split features (each target's features include the other targets, as a separate run would)
+        X, y, num_cols, cat_cols = recorder.track(f"split_features[{target}]", split_features, df, target,
+                                                  drop_cols=args.drop, rows_in=len(df))
+        print(f"{target}: {len(num_cols)} numeric, {len(cat_cols)} categorical features")
+        ind_cols = None
+        if not args.legacy_features:
+            ind_cols = indicator_columns(X, num_cols)
+            X = compact_indicators(X, ind_cols)
+            print(f"{len(ind_cols)} numeric columns are 0/1 indicators, kept as uint8 and not scaled")
+        run = {
+            "paths": target_paths(args, target), "X": X, "num_cols": num_cols, "cat_cols": cat_cols, "ind_cols": ind_cols,
+            "Xtr": X.iloc[train_idx], "Xte": X.iloc[test_idx], "ytr": y.iloc[train_idx], "yte": y.iloc[test_idx],
+            # one-hot blocks of the feature table are permuted together
+            "groups": importance_groups(X.columns, ind_cols if ind_cols is not None else indicator_columns(X, num_cols)),
+            "rows": [], "versions": [],
+            # saved with each model, so the next --update can tell which rows it has not seen
+            "hashes": row_hashes(X, y),
+        }
+        runs[target] = run
+
+        for key, (model, grid) in model_spaces.items():
+            model_path = run["paths"].models_dir / f"{key}_best.joblib"
+            prev, prev_meta, prev_scores, reason = None, None, None, None
+            window = {"drift_rows": None, "drift_months": None, "prev_rmse_drift": None}
+            if args.update:
+                prev, prev_meta, reason = previous_model(model_path, target, X)
+            if prev is not None:
+                # drift is measured on the rows the saved model was not trained on (the new months), not on this
+                # run's test split, most of which it has seen; nothing new to score keeps its hyperparameters
+                prev_scores = test_metrics(run["yte"], prev.predict(run["Xte"]))
+                prev_rows, recorded = load_model_rows(model_path), prev_meta.get("rmse_test")
+                drift = None
+                if prev_rows is not None and recorded:
+                    new = ~np.isin(run["hashes"], prev_rows)
+                    window.update(drift_rows=int(new.sum()), drift_months=drift_months(X, new))
+                    drift = 0.0
+                    if new.any():
+                        window["prev_rmse_drift"] = test_metrics(y[new], prev.predict(X[new]))["rmse_test"]
+                        drift = window["prev_rmse_drift"] / recorded - 1
+                if drift is None or drift > args.drift_threshold:
+                    reason = "no recorded test error" if not recorded else "no record of its training rows" if drift is None else \
+                        f"RMSE on {window['drift_rows']:,} new rows drifted {drift:+.1%} (threshold {args.drift_threshold:.0%})"
+                    prev = None
+            fitted[(target, key)] = {"prev_meta": prev_meta, "prev_scores": prev_scores, "window": window}
+
+            if prev is not None:
+                # within tolerance: keep the recorded hyperparameters and just refit on the updated data
+                print(f"\nUpdating model: {target}/{key} (RMSE drift {drift:+.1%} on {window['drift_rows']:,} new rows, "
+                      f"months {window['drift_months']})")
+                pipe, action = recorder.track(f"warm_refit[{target}/{key}]", warm_refit, prev, key, run["Xtr"], run["ytr"],
+                                              add_estimators=args.add_estimators, rows_in=len(run["Xtr"]))
+                fitted[(target, key)].update(pipe=pipe, action=action, best_params=prev_meta.get("best_params", {}),
+                                             timing={"tune_seconds": 0.0, "fit_seconds": recorder.stages[-1]["wall_s"]})
+                continue
+            if args.update:
+                print(f"\n{target}/{key}: full search ({reason})")
+            preprocessor = family_preprocessor(key, num_cols, cat_cols, ind_cols)
+            jobs.append(SearchJob(target, key, Pipeline(steps=[("prep", preprocessor), ("model", model)], memory=memory),
+                                  grid, run["Xtr"], run["ytr"], search=args.search, budget=args.budget))
+
+    if jobs:
+        # every (target, family, candidate, fold) fit of the run on one pool
+        print(f"\nTuning {len(jobs)} target/model searches on a shared pool")
+        searched = recorder.track("search", run_search_jobs, jobs, cv_splits=args.cv_splits, n_jobs=args.n_jobs,
+                                  rows_in=len(train_idx))
+        trim_prep_cache(memory, args.prep_cache_size)
+        for (target, key), (grid, cv_summary) in searched.items():
+            # the saved model should not point at this run's cache dir
+            grid.best_estimator_.set_params(memory=None)
+            cv_summary.to_csv(runs[target]["paths"].results_dir / f"cv_{key}.csv", index=False)
+            # summed worker time of all candidates and folds, and the final refit of the winner
+            fitted[(target, key)].update(pipe=grid.best_estimator_, action="search", best_params=grid.best_params_,
+                                         timing={"tune_seconds": grid.search_seconds, "fit_seconds": round(grid.refit_time_, 3)})
+
+    for (target, key), fit in fitted.items():
+        run = runs[target]
+        pipe, prev_scores, prev_meta = fit["pipe"], fit["prev_scores"], fit["prev_meta"]
+        print(f"\n{target}/{key} best params: {fit['best_params']}")
+        y_pred = recorder.track(f"predict[{target}/{key}]", pipe.predict, run["Xte"], rows_in=len(run["Xte"]))
+        scores = test_metrics(run["yte"], y_pred)
+        run["rows"].append({"model": key, **scores, **fit["timing"]})
+
+        # Save model, with the feature contract src.models.predict replays; the one it replaces moves to versions/
+        model_path = run["paths"].models_dir / f"{key}_best.joblib"
+        prev_version = archive_model(model_path)
+        version = prev_version + 1
+        save_model(pipe, model_path,
+                   feature_meta(target, args.drop, run["X"], run["num_cols"], run["cat_cols"], run["ind_cols"], model=key,
+                                version=version, best_params=fit["best_params"], action=fit["action"],
+                                trained_utc=recorder.started.isoformat(), n_train=len(run["Xtr"]),
+                                **{k: float(v) for k, v in scores.items()}),
+                   rows=run["hashes"][train_idx])
+        run["versions"].append({
+            "run_utc": recorder.started.isoformat(), "model": key, "version": version, "prev_version": prev_version or None,
+            "action": fit["action"], "n_train": len(run["Xtr"]), **scores,
+            "prev_rmse_test": prev_scores["rmse_test"] if prev_scores else None,
+            "prev_recorded_rmse_test": prev_meta.get("rmse_test") if prev_meta else None,
+            "delta_rmse_test": scores["rmse_test"] - prev_scores["rmse_test"] if prev_scores else None,
+            **fit["window"],
+            **fit["timing"],
+        })
+
+        if args.importance != "none":
+            recorder.track(f"export_feature_importance[{target}/{key}]", export_feature_importance,
+                fitted_pipeline=pipe,
+                X=run["Xtr"], y=run["ytr"],
+                out_path=str(run["paths"].results_dir / f"feat_importance_{key}.csv"),
+                mode=args.importance, groups=run["groups"],
+                max_rows=args.importance_rows, n_repeats=args.importance_repeats,
+                rows_in=min(len(run["Xtr"]), args.importance_rows)
+            )
+
+    for target, run in runs.items():
+        test_table = pd.DataFrame(run["rows"]).sort_values("rmse_test")
+        test_table.to_csv(run["paths"].results_dir / "test_summary.csv", index=False)
+        print(f"\nTest summary ({target}):")
+        print(test_table.to_string(index=False))
+
+        # one row per saved artifact, appended across runs; with --update the prev_* columns compare against
+        # the version it replaced, scored on this run's test split, and drift_* give the rows it had not been
+        # trained on (count, months) with its RMSE there, which decided between refit and search
+        history = run["paths"].results_dir / "model_versions.csv"
+        version_table = pd.DataFrame(run["versions"])
+        # histories written before a column was added keep their rows, with the new columns left empty
+        old = pd.read_csv(history) if history.exists() else None
+        (version_table if old is None else pd.concat([old, version_table], ignore_index=True)).to_csv(history, index=False)
+        if args.update:
+            print(f"\nVersions ({target}):")
+            print(version_table[["model", "prev_version", "version", "action", "drift_rows", "drift_months", "prev_rmse_drift",
+                                 "prev_rmse_test", "rmse_test", "delta_rmse_test"]].to_string(index=False))
+    recorder.write_report(report_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
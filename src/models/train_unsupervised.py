@@ -0,0 +1,110 @@
+import argparse
+import joblib
+import pandas as pd
+from pathlib import Path
+import warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from src.instrumentation import RunRecorder
+from src.data.artifact_store import load_frame, frame_columns, save_frame, FORMATS
+from src.models.sl_config import build_paths
+from src.models.ul_utils import (CLUSTER_LEVELS, CLUSTER_ALGOS, STATION_NUM_COLS, STATION_CAT_COLS, REGION_FEATURES,
+                                 station_frame, region_frame, cluster_preprocessor, sweep_k, choose_k, clustering_pipeline,
+                                 dbscan_labels)
+
+# Station archetypes (--level station) and state investment tiers (--level region).
+#
+#   python -m src.models.train_unsupervised --level station --k-min 2 --k-max 10
+#
+# Writes <out>/<level>_k_sweep.csv (inertia, sampled silhouette / Davies-Bouldin, timings per k),
+# <out>/<level>_labels.<fmt>, <out>/<level>_profiles.csv (cluster means) and
+# <models>/cluster_<level>.joblib (fitted preprocessor + clusterer). --dbscan-eps adds the notebook's
+# DBSCAN labels over the same encoded matrix as a dbscan_cluster column (-1 = noise).
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Cluster EV stations or states.")
+    p.add_argument("--data", default="data/processed/final_data/FinalFeaturesDF.csv", help="Input features file (.csv, .feather or .parquet)")
+    p.add_argument("--level", choices=CLUSTER_LEVELS, default="station")
+    p.add_argument("--algo", choices=CLUSTER_ALGOS, default="minibatch", help="MiniBatchKMeans or full KMeans")
+    p.add_argument("--k-min", type=int, default=2)
+    p.add_argument("--k-max", type=int, default=10)
+    p.add_argument("--k", type=int, default=None, help="Clusters to keep (default: best --select metric of the sweep)")
+    p.add_argument("--select", choices=["silhouette", "davies_bouldin"], default="silhouette")
+    p.add_argument("--n-init", type=int, default=None, help="Restarts per k (default 3 for minibatch, 10 for kmeans)")
+    p.add_argument("--batch-size", type=int, default=4096, help="MiniBatchKMeans batch size")
+    p.add_argument("--metric-rows", type=int, default=10_000, help="Stratified sample scored per k (0 = every row)")
+    p.add_argument("--n-jobs", type=int, default=-1, help="k values fitted in parallel")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--dbscan-eps", type=float, default=None, help="Also label rows with DBSCAN at this eps (notebook: 1.0)")
+    p.add_argument("--dbscan-min-samples", type=int, default=5)
+    p.add_argument("--labels-format", choices=sorted(FORMATS), default="csv")
+    p.add_argument("--out", default="results/unsupervised", help="Results dir")
+    p.add_argument("--models", default="models", help="Models dir")
+    p.add_argument("--report-dir", default=None, help="Run report dir (default: run_reports next to --out)")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    print(args)
+    paths = build_paths(args.data, results_dir=args.out, models_dir=args.models)
+    report_dir = Path(args.report_dir) if args.report_dir else paths.results_dir.parent / "run_reports"
+    recorder = RunRecorder(f"cluster_{args.level}")
+
+    print(f"Loading data: {paths.data_path}")
+    if args.level == "station":
+        wanted = ["STATE_NAME", "STATION_NAME"] + STATION_NUM_COLS + STATION_CAT_COLS
+    else:
+        wanted = ["STATE_NAME", "STATION_NAME", "POPULATION", "ELECTRIC_VEHICLE_REG_COUNT"]
+    available = frame_columns(paths.data_path)
+    df = recorder.track("load_data", load_frame, paths.data_path, columns=[c for c in wanted if c in available])
+
+    if args.level == "station":
+        X = recorder.track("station_frame", station_frame, df, rows_in=len(df))
+        ids = df[[c for c in ["STATE_NAME", "STATION_NAME"] if c in df.columns]].reset_index(drop=True)
+    else:
+        region = recorder.track("region_frame", region_frame, df, rows_in=len(df))
+        X, ids = region[REGION_FEATURES], region.drop(columns=REGION_FEATURES)
+
+    prep = cluster_preprocessor(args.level)
+    M = recorder.track("preprocess", prep.fit_transform, X, rows_in=len(X))
+    # k can not exceed the rows being clustered (a handful of states in small extracts)
+    ks = [k for k in range(args.k_min, args.k_max + 1) if k < M.shape[0]]
+    if not ks:
+        raise ValueError(f"{M.shape[0]} rows is too few for k in [{args.k_min}, {args.k_max}]")
+    print(f"{args.level}: {M.shape[0]:,} rows x {M.shape[1]} features, k in {ks[0]}..{ks[-1]} ({args.algo})")
+
+    table, models, labels = recorder.track("sweep_k", sweep_k, M, ks, algo=args.algo, n_init=args.n_init,
+                                           batch_size=args.batch_size, sample_rows=args.metric_rows,
+                                           n_jobs=args.n_jobs, random_state=args.seed, rows_in=M.shape[0])
+    table.insert(0, "algo", args.algo)
+    table.to_csv(paths.results_dir / f"{args.level}_k_sweep.csv", index=False)
+    print("\nk sweep:")
+    print(table.to_string(index=False))
+
+    k = args.k if args.k is not None else choose_k(table, args.select)
+    if k not in models:
+        raise ValueError(f"--k {k} was not in the sweep ({ks[0]}..{ks[-1]})")
+    print(f"\nKeeping k={k}" + ("" if args.k is not None else f" (best {args.select})"))
+
+    out = ids.copy()
+    out["cluster"] = labels[k]
+    if args.dbscan_eps is not None:
+        db, n_distinct = recorder.track("dbscan", dbscan_labels, M, eps=args.dbscan_eps,
+                                        min_samples=args.dbscan_min_samples, rows_in=M.shape[0])
+        out["dbscan_cluster"] = db
+        print(f"DBSCAN(eps={args.dbscan_eps:g}, min_samples={args.dbscan_min_samples}) over {n_distinct:,} distinct rows: "
+              f"{db.max() + 1:,} clusters, {(db == -1).sum():,} noise rows")
+    save_frame(out, paths.results_dir / f"{args.level}_labels", fmt=args.labels_format)
+    profile = pd.concat([X.reset_index(drop=True), out["cluster"]], axis=1)
+    num = profile.drop(columns="cluster").select_dtypes("number").columns
+    profiles = profile.groupby("cluster")[list(num)].mean()
+    profiles.insert(0, "size", profile.groupby("cluster").size())
+    profiles.reset_index().to_csv(paths.results_dir / f"{args.level}_profiles.csv", index=False)
+    print(profiles.to_string())
+
+    joblib.dump(clustering_pipeline(prep, models[k]), paths.models_dir / f"cluster_{args.level}.joblib")
+    print(f"Clusterer saved {paths.models_dir / f'cluster_{args.level}.joblib'}")
+    recorder.write_report(report_dir)
+
+if __name__ == "__main__":
+    main()
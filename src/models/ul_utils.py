@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.cluster import DBSCAN, KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score, davies_bouldin_score
+from sklearn.pipeline import Pipeline
+import warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from .sl_utils import build_preprocessor
+
+# Station archetype / regional tier clustering from the unsupervised notebook, as reusable steps.
+# The notebook swept KMeans(n_init=10) over k on the densified one-hot station matrix and ran a full
+# silhouette_score (all pairwise distances) at every k. Here the matrix stays as build_preprocessor
+# returns it, k values are fitted in parallel, MiniBatchKMeans is available for the ~100k-row
+# station table, and silhouette / Davies-Bouldin are scored on a per-cluster stratified sample.
+
+CLUSTER_LEVELS = ["station", "region"]
+CLUSTER_ALGOS = ["minibatch", "kmeans"]
+
+STATION_NUM_COLS = ["EV_LEVEL1_EVSE_NUM", "EV_LEVEL2_EVSE_CNUM", "EV_DC_FAST_NUM"]
+STATION_CAT_COLS = ["EV_PRICING", "FACILITY_TYPE"]
+REGION_FEATURES = ["Adoption_Ratio", "Infra_Balance_Ratio"]
+
+def station_frame(df):
+    # notebook cleaning: missing charger counts are 0, missing categories are their own level
+    X = df[STATION_NUM_COLS + STATION_CAT_COLS].copy()
+    for c in STATION_NUM_COLS:
+        X[c] = pd.to_numeric(X[c], errors="coerce").fillna(0)
+    for c in STATION_CAT_COLS:
+        X[c] = X[c].astype(object).where(X[c].notna(), "UNKNOWN")
+    return X
+
+def region_frame(df):
+    # one row per state: EV adoption per capita and stations per registered EV
+    reg = pd.to_numeric(df["ELECTRIC_VEHICLE_REG_COUNT"].astype(str).str.replace(r"[^\d.]", "", regex=True),
+                        errors="coerce").fillna(0)
+    pop = df["POPULATION"].fillna(df["POPULATION"].mean())
+    region = (
+        pd.DataFrame({"STATE_NAME": df["STATE_NAME"], "POPULATION": pop, "EV_REG": reg, "STATION_NAME": df["STATION_NAME"]})
+        .groupby("STATE_NAME", observed=True)
+        .agg(Population_Mean=("POPULATION", "mean"), EV_Reg_Count_Sum=("EV_REG", "sum"),
+             Station_Count=("STATION_NAME", "count"))
+        .reset_index()
+    )
+    region["Adoption_Ratio"] = region["EV_Reg_Count_Sum"] / region["Population_Mean"]
+    region["Infra_Balance_Ratio"] = region["Station_Count"] / region["EV_Reg_Count_Sum"]
+    region = region.replace([np.inf, -np.inf], np.nan).dropna(subset=REGION_FEATURES)
+    return region.reset_index(drop=True)
+
+def cluster_preprocessor(level):
+    if level == "station":
+        return build_preprocessor(STATION_NUM_COLS, STATION_CAT_COLS)
+    return build_preprocessor(REGION_FEATURES, [])
+
+def make_clusterer(algo, k, n_init = None, batch_size = 4096, random_state = 42):
+    if algo == "kmeans":
+        return KMeans(n_clusters=k, init="k-means++", n_init=n_init or 10, random_state=random_state)
+    if algo == "minibatch":
+        return MiniBatchKMeans(n_clusters=k, init="k-means++", n_init=n_init or 3, batch_size=batch_size,
+                               random_state=random_state)
+    raise ValueError(f"Unknown clustering algorithm '{algo}', expected one of {CLUSTER_ALGOS}")
+
+def stratified_sample(labels, n_rows, random_state = 42):
+    # row indices, each cluster sampled in proportion to its size (at least 2 rows where it has them,
+    # so every cluster still gets a silhouette); all rows when n_rows covers them
+    labels = np.asarray(labels)
+    if not n_rows or n_rows >= len(labels):
+        return np.arange(len(labels))
+    rng = np.random.default_rng(random_state)
+    values, counts = np.unique(labels, return_counts=True)
+    take = np.minimum(counts, np.maximum(2, np.round(counts * n_rows / len(labels)).astype(int)))
+    rows = [rng.choice(np.flatnonzero(labels == v), size=t, replace=False) for v, t in zip(values, take)]
+    return np.sort(np.concatenate(rows))
+
+def cluster_scores(M, labels, sample_rows = 10_000, random_state = 42):
+    # silhouette (O(n^2) in the sample) and Davies-Bouldin on the same stratified sample
+    idx = stratified_sample(labels, sample_rows, random_state)
+    sample, lab = M[idx], np.asarray(labels)[idx]
+    if len(np.unique(lab)) < 2:
+        return {"silhouette": np.nan, "davies_bouldin": np.nan, "scored_rows": len(idx)}
+    dense = sample.toarray() if sparse.issparse(sample) else np.asarray(sample)
+    return {
+        "silhouette": float(silhouette_score(dense, lab)),
+        "davies_bouldin": float(davies_bouldin_score(dense, lab)),
+        "scored_rows": len(idx),
+    }
+
+def _fit_k(M, k, algo, n_init, batch_size, sample_rows, random_state):
+    t0 = time.perf_counter()
+    model = make_clusterer(algo, k, n_init=n_init, batch_size=batch_size, random_state=random_state)
+    labels = model.fit_predict(M).astype(np.int32)
+    fit_s = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    scores = cluster_scores(M, labels, sample_rows=sample_rows, random_state=random_state)
+    row = {"k": k, "inertia": float(model.inertia_), **scores,
+           "fit_seconds": round(fit_s, 3), "score_seconds": round(time.perf_counter() - t1, 3)}
+    return row, model, labels
+
+def sweep_k(M, ks, algo = "minibatch", n_init = None, batch_size = 4096, sample_rows = 10_000, n_jobs = -1,
+            random_state = 42):
+    # fits every k in parallel; returns (one row per k, {k: fitted clusterer}, {k: labels})
+    out = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_k)(M, k, algo, n_init, batch_size, sample_rows, random_state) for k in ks
+    )
+    table = pd.DataFrame([row for row, _, _ in out])
+    return table, {r["k"]: m for r, m, _ in out}, {r["k"]: lab for r, _, lab in out}
+
+def choose_k(table, metric = "silhouette"):
+    # highest silhouette, or lowest Davies-Bouldin
+    scored = table.dropna(subset=[metric])
+    if scored.empty:
+        return int(table["k"].iloc[0])
+    best = scored[metric].idxmax() if metric == "silhouette" else scored[metric].idxmin()
+    return int(table.loc[best, "k"])
+
+def dbscan_labels(M, eps = 1.0, min_samples = 5):
+    # the notebook's DBSCAN(eps=1, min_samples=5) ran brute-force neighbours over every encoded row.
+    # The station matrix has few distinct rows (port counts x pricing x facility type), so each
+    # distinct row is fitted once with its multiplicity as sample_weight and a tree answers the
+    # neighbour queries; core points and noise are the same as fitting all rows.
+    dense = M.toarray() if sparse.issparse(M) else np.asarray(M)
+    uniq, inverse, counts = np.unique(dense, axis=0, return_inverse=True, return_counts=True)
+    model = DBSCAN(eps=eps, min_samples=min_samples, algorithm="kd_tree")
+    return model.fit_predict(uniq, sample_weight=counts)[inverse.ravel()].astype(np.int32), len(uniq)
+
+def clustering_pipeline(fitted_prep, fitted_clusterer):
+    # prep + clusterer as one artifact; predict() assigns new rows to the saved clusters
+    return Pipeline(steps=[("prep", fitted_prep), ("cluster", fitted_clusterer)])
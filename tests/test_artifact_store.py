@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.artifact_store import FrameWriter, save_frame, load_frame
+from src.data.schema import compact_frame, SESSIONS_SCHEMA
+
+@pytest.mark.parametrize("fmt", ["feather", "parquet", "csv"])
+def test_streamed_artifact_matches_whole_frame(tmp_path, fmt):
+    # chunks see different categories (one none at all) and gaps in num_ports only in some chunks
+    rng = np.random.default_rng(0)
+    n = 1000
+    df = pd.DataFrame({"state": rng.choice(["CA", "NY", "TX", "WA"], n).astype(object),
+                       "venue": rng.choice(["Retail", "Workplace"], n).astype(object),
+                       "num_ports": rng.integers(1, 5, n).astype(float), "energy_kwh": rng.uniform(1, 30, n)})
+    df.loc[:300, "state"] = "CA"
+    df.loc[:399, "venue"] = np.nan
+    df.loc[600:700, "num_ports"] = np.nan
+    with FrameWriter(tmp_path / "streamed", fmt) as w:
+        for i in range(0, n, 200):
+            w.write(compact_frame(df.iloc[i:i + 200], SESSIONS_SCHEMA))
+    whole = save_frame(compact_frame(df, SESSIONS_SCHEMA), tmp_path / "whole", fmt)
+    streamed = load_frame(w.path)
+    assert isinstance(streamed["state"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(streamed, load_frame(whole))
+    assert not list(tmp_path.glob("*.part"))
+
+def test_declared_integer_sets_unfit_values_missing():
+    # one bad row must not abort a streamed build: it becomes missing and the column keeps its dtype
+    df = pd.DataFrame({"num_ports": [2, 2.5, -1, 70000, np.nan, "3"]})
+    out = compact_frame(df, SESSIONS_SCHEMA)["num_ports"]
+    assert out.dtype == "UInt16"
+    assert out.tolist() == [2, pd.NA, pd.NA, pd.NA, pd.NA, 3]
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from src.data.geo_index import StationGeoIndex, load_index, haversine_miles
+
+def _stations(n = 2000, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"id": np.arange(n), "latitude": rng.uniform(36, 40, n), "longitude": rng.uniform(-122, -118, n),
+                         "ev_level2_evse_num": rng.integers(0, 4, n), "ev_dc_fast_num": rng.integers(0, 2, n)})
+
+def test_saved_index_answers_queries_from_read_only_mmap(tmp_path):
+    # load_index memory-maps the trees' arrays read-only; queries must run on them and match brute force
+    stations = _stations()
+    path = StationGeoIndex(stations).save(tmp_path / "geo.joblib")
+    index = load_index(path)
+    rows, tree = index.trees["dcfc"]
+    assert not tree.get_arrays()[0].flags.writeable
+
+    lat, lon = np.array([37.0, 38.5]), np.array([-120.0, -121.0])
+    dist = haversine_miles(lat[:, None], lon[:, None], stations["latitude"].to_numpy(), stations["longitude"].to_numpy())
+    hits = index.within(lat, lon, 10.0)
+    for i in range(len(lat)):
+        np.testing.assert_array_equal(np.sort(hits[i]), np.flatnonzero(dist[i] <= 10.0))
+    dcfc = np.flatnonzero(stations["ev_dc_fast_num"].to_numpy() > 0)
+    miles, near = index.nearest(lat, lon, k=3, kind="dcfc")
+    np.testing.assert_array_equal(near, dcfc[np.argsort(dist[:, dcfc], axis=1)[:, :3]])
+    np.testing.assert_allclose(miles, np.sort(dist[:, dcfc], axis=1)[:, :3])
+    assert len(index.dbscan(eps_miles=2.0, min_samples=3)) == len(stations)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from src.data.load_profile import build_load_profile
+
+def _sessions(n = 400, seed = 0):
+    # minute-rounded sessions, many of them starting or ending exactly on a 15-minute boundary
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2023-03-01")
+    start = base + pd.to_timedelta(rng.integers(0, 3 * 24 * 4, n) * 15 + rng.choice([0, 0, 7], n), unit="min")
+    minutes = rng.integers(1, 16, n) * 15 + rng.choice([0, 0, 0, 4], n)
+    end = start + pd.to_timedelta(minutes, unit="min")
+    return pd.DataFrame({
+        "evse_id": rng.integers(0, 5, n), "state": rng.choice(["CA", "NY"], n),
+        "start_datetime": start, "end_datetime": end.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_duration": minutes / 60, "charge_duration": minutes / 120, "energy_kwh": rng.uniform(1, 30, n),
+    })
+
+def _brute_peak(s, e, lo, hi):
+    # most intervals [s, e) covering any instant of [lo, hi): the level only rises at lo or at a start
+    points = np.r_[lo, s[(s >= lo) & (s < hi)]]
+    return max(int(((s <= p) & (e > p)).sum()) for p in points)
+
+def test_peak_concurrency_at_bucket_boundaries():
+    ev = _sessions()
+    s = ev["start_datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    e = pd.to_datetime(ev["end_datetime"]).to_numpy(dtype="datetime64[s]").astype(np.int64)
+    assert (e % 900 == 0).sum() > 100
+    for minutes in (15, 60):
+        profile = build_load_profile([ev.iloc[:150], ev.iloc[150:]], "state", minutes)
+        lo = profile["bucket_start"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+        for i, state in enumerate(profile["state"].astype(str)):
+            m = (ev["state"] == state).to_numpy()
+            assert profile["peak_concurrent"].iloc[i] == _brute_peak(s[m], e[m], lo[i], lo[i] + minutes * 60)
+
+def test_bucket_sums_match_overlaps():
+    ev = _sessions(seed=1)
+    profile = build_load_profile([ev], "evse", 15)
+    assert np.isclose(profile["energy_kwh"].sum(), ev["energy_kwh"].sum())
+    plugged_hours = profile["mean_concurrent"].sum() * 0.25
+    assert np.isclose(plugged_hours, ev["total_duration"].sum())
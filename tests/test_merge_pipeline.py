@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from src.data.merge_pipeline import aggregate_state_month, aggregate_state_month_stream
+
+def _sessions(n = 300, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "state": rng.choice(["CA", "NY", "TX"], n), "Year": 2023, "Month": rng.integers(1, 4, n),
+        "energy_kwh": rng.uniform(1, 30, n), "charge_duration": rng.uniform(0, 3, n), "total_duration": rng.uniform(0, 5, n),
+        "demand_score": rng.uniform(0, 30, n), "num_ports": rng.integers(1, 4, n),
+    })
+
+def test_stream_matches_whole_without_num_ports():
+    ev = _sessions().drop(columns="num_ports")
+    whole = aggregate_state_month(ev)
+    streamed = aggregate_state_month_stream([ev.iloc[:100], ev.iloc[100:250], ev.iloc[250:]])
+    assert "num_ports_sum" not in whole.columns
+    pd.testing.assert_frame_equal(streamed.sort_values(["Month", "state"]).reset_index(drop=True),
+                                  whole.sort_values(["Month", "state"]).reset_index(drop=True))
+    assert whole["sessions"].sum() == len(ev)
+
+def test_empty_stream_gives_empty_table():
+    out = aggregate_state_month_stream(iter([]))
+    assert len(out) == 0
+    assert list(out.columns[:3]) == ["state", "Year", "Month"] and "sessions" in out.columns
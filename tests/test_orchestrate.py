@@ -0,0 +1,67 @@
+import time
+import numpy as np
+import pandas as pd
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, KFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from src.models.orchestrate import SearchJob, run_search_jobs, _halving_plan
+from src.models.sl_utils import scorer_dict
+
+def _data(n = 600, seed = 0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, 5)), columns=[f"x{i}" for i in range(5)])
+    return X, X @ np.array([3.0, -2.0, 1.0, 0.0, 0.5]) + rng.normal(scale=2.0, size=n)
+
+def _pipe():
+    return Pipeline(steps=[("prep", StandardScaler()), ("model", Ridge())])
+
+def test_grid_summary_matches_gridsearchcv():
+    X, y = _data()
+    grid = {"model__alpha": [0.01, 1.0, 30.0, 1000.0]}
+    (res, summary), = run_search_jobs([SearchJob("y", "ridge", _pipe(), grid, X, y)], cv_splits=3, n_jobs=1).values()
+    ref = GridSearchCV(_pipe(), grid, scoring=scorer_dict(), refit="rmse", cv=KFold(3, shuffle=True, random_state=42)).fit(X, y)
+    cv = pd.DataFrame(ref.cv_results_).sort_values("rank_test_rmse")
+    assert res.best_params_ == ref.best_params_
+    np.testing.assert_allclose(summary["mean_test_rmse"], -cv["mean_test_rmse"])
+    np.testing.assert_allclose(summary["mean_test_r2"], cv["mean_test_r2"])
+
+def test_halving_rounds_follow_sklearn_schedule():
+    X, y = _data()
+    grid = {"model__alpha": [0.01, 0.1, 1.0, 10.0, 100.0, 1000.0, 1e4, 1e5, 1e6]}
+    cands, resource, resources = _halving_plan(SearchJob("y", "ridge", _pipe(), grid, X, y, search="halving"), len(X), 3)
+    ref = HalvingGridSearchCV(_pipe(), grid, factor=3, min_resources="exhaust", cv=3, random_state=0).fit(X, y)
+    assert resource is None and len(cands) == 9
+    assert resources == list(ref.n_resources_)
+    (res, summary), = run_search_jobs([SearchJob("y", "ridge", _pipe(), grid, X, y, search="halving")],
+                                      cv_splits=3, n_jobs=1).values()
+    # every candidate is reported once; the winner comes from the last round
+    assert len(summary) == 9 and summary["rank_test_rmse"].iloc[0] == 1
+    assert res.best_params_ == summary["params"].iloc[0]
+    assert res.best_params_["model__alpha"] <= 10.0
+
+class _CountedScaler(StandardScaler):
+    # appends the row count of every fit to log, from whichever worker runs it; slow enough that
+    # candidates of the same fold would overlap on the pool
+    def __init__(self, log = None):
+        super().__init__()
+        self.log = log
+
+    def fit(self, X, y = None):
+        with open(self.log, "a") as f:
+            f.write(f"{len(X)}\n")
+        time.sleep(0.5)
+        return super().fit(X, y)
+
+def test_cached_preprocessing_is_fitted_once_per_fold(tmp_path):
+    # two jobs with the same preprocessing, several candidates each, on more workers than folds: one fit per fold
+    from src.models.sl_utils import prep_cache
+    X, y = _data()
+    log = tmp_path / "fits.log"
+    pipe = Pipeline(steps=[("prep", _CountedScaler(str(log))), ("model", Ridge())], memory=prep_cache(tmp_path / "cache"))
+    grid = {"model__alpha": [0.01, 1.0, 30.0, 1000.0]}
+    run_search_jobs([SearchJob("y", "a", pipe, grid, X, y), SearchJob("y", "b", pipe, grid, X, y)], cv_splits=3, n_jobs=4)
+    rows = [int(n) for n in log.read_text().split()]
+    assert sorted(n for n in rows if n < len(X)) == [400, 400, 400]
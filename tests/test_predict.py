@@ -0,0 +1,21 @@
+import numpy as np
+
+from src.models.predict import LatencyStats, MicroBatcher
+
+class _Model:
+    # sums the features; a row with x < 0 makes the whole predict call fail
+    def predict(self, X):
+        if (X["x"] < 0).any():
+            raise ValueError("negative x")
+        return (X["x"] + X["y"]).to_numpy()
+
+def test_failed_batch_only_fails_the_offending_request():
+    meta = {"columns": ["x", "y"], "num_cols": ["x", "y"], "cat_cols": []}
+    # a long wait so all three requests land in one micro-batch
+    batcher = MicroBatcher(_Model(), meta, LatencyStats(), max_batch=100, max_wait_ms=200)
+    good = batcher.submit([{"x": 1, "y": 2}, {"x": 3, "y": 4}])
+    bad = batcher.submit([{"x": -1, "y": 0}])
+    other = batcher.submit([{"x": 5, "y": 5}])
+    np.testing.assert_array_equal(good.result(timeout=5), [3, 7])
+    np.testing.assert_array_equal(other.result(timeout=5), [10])
+    assert isinstance(bad.exception(timeout=5), ValueError)
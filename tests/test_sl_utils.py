@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.sl_utils import family_preprocessor
+
+def _frame(n = 300, levels = 20, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"a": rng.normal(size=n), "b": rng.integers(0, 100, n).astype(float),
+                         "flag": rng.integers(0, 2, n).astype(np.uint8),
+                         "city": rng.choice([f"c{i}" for i in range(levels)], n)})
+
+def test_family_layouts_are_float32():
+    X = _frame()
+    for key in ["ridge", "gbr", "rf"]:
+        M = family_preprocessor(key, ["a", "b", "flag"], ["city"], ["flag"]).fit_transform(X)
+        assert M.dtype == np.float32
+        assert sparse.issparse(M) == (key != "rf")
+
+def test_forest_stays_sparse_on_wide_one_hot():
+    # 2000 one-hot levels is past DENSE_MAX_COLUMNS: the forest gets CSR, also when scoring a few rows
+    X = _frame(n = 4000, levels = 2000)
+    prep = family_preprocessor("rf", ["a", "b", "flag"], ["city"], ["flag"]).fit(X)
+    assert sparse.issparse(prep.transform(X.head(5)))